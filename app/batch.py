@@ -0,0 +1,328 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.download_manager import DownloadState
+from app.encoding import dumps_json
+from app.utils import MODEL_DIR
+
+# Input and output files for jobs started over the API live here
+BATCH_DIR = os.environ.get("BATCH_DIR", os.path.join(os.path.dirname(MODEL_DIR), "batches"))
+
+SAMPLING_FIELDS = ("temp", "top_k", "top_p", "repeat_penalty")
+
+
+@dataclass
+class BatchParams:
+    temp: float = 0.8
+    top_k: int = 40
+    top_p: float = 0.95
+    repeat_penalty: float = 1.0
+
+
+def read_prompts(input_path: str) -> List[dict]:
+    """
+    Parse the input JSONL: one object per line with a "prompt", optionally an "id" and
+    per-prompt temp/top_k/top_p/repeat_penalty. Each record gets "index", its position.
+    """
+    records = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_no}: {e}")
+            if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+                raise ValueError(f"Line {line_no}: expected an object with a \"prompt\" string")
+            record["index"] = len(records)
+            records.append(record)
+    return records
+
+
+def completed_indices(output_path: str) -> set:
+    """
+    Indices already in an output file from an earlier run. A partly written last line
+    (the process died mid-write) is cut off so appending continues cleanly.
+    """
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    return {json.loads(line)["index"] for line in data[:end].splitlines() if line.strip()}
+
+
+def plan_lanes(items: List[tuple], n_lanes: int) -> List[List[tuple]]:
+    """
+    Split (token_ids, record) items into n_lanes runs of similar size, one per engine.
+    Items are sorted by token IDs so prompts sharing a prefix run back to back on the same
+    engine and its KV cache only prefills what differs. Each cut is moved, within a quarter
+    of a lane, to where neighbouring prompts share the fewest tokens.
+    """
+    items = sorted(items, key=lambda item: item[0])
+    n_lanes = max(1, min(n_lanes, len(items)))
+    size = len(items) / n_lanes
+    window = int(size / 4)
+
+    cuts = [0]
+    for k in range(1, n_lanes):
+        target = round(k * size)
+        lo = max(cuts[-1] + 1, target - window)
+        hi = min(len(items) - (n_lanes - k), target + window)
+        cuts.append(min(
+            range(lo, hi + 1),
+            key=lambda c: (len(os.path.commonprefix([items[c - 1][0], items[c][0]])), abs(c - target)),
+        ))
+    cuts.append(len(items))
+    return [items[a:b] for a, b in zip(cuts, cuts[1:])]
+
+
+def run_batch(
+    engines: list,
+    input_path: str,
+    output_path: str,
+    params: BatchParams = None,
+    resume: bool = False,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> dict:
+    """
+    Evaluate every prompt in input_path and append one JSON line per prompt to output_path,
+    using each engine (e.g. every pool worker) from its own thread. Lines are written in
+    completion order with the prompt's index, so the output is also the checkpoint: with
+    resume, prompts already in it are skipped; otherwise it is overwritten.
+    progress(done, total, failed) is called after every prompt.
+    """
+    params = params or BatchParams()
+    records = read_prompts(input_path)
+    done = completed_indices(output_path) if resume else set()
+    pending = [r for r in records if r["index"] not in done]
+
+    engine = engines[0]
+    prefix = engine.prefix_tokens()
+    items = [(prefix + engine.tokenize(r["prompt"].encode("utf-8")), r) for r in pending]
+    lanes = plan_lanes(items, len(engines)) if items else []
+
+    counts = {"done": len(records) - len(pending), "failed": 0}
+    write_lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    with open(output_path, "ab" if resume else "wb") as out:
+        def run_lane(lane_engine, lane):
+            for token_ids, record in lane:
+                if cancelled and cancelled():
+                    return
+                result = evaluate(lane_engine, token_ids, record, params)
+                with write_lock:
+                    out.write(dumps_json(result) + b"\n")
+                    out.flush()
+                    counts["done"] += 1
+                    counts["failed"] += "error" in result
+                    if progress:
+                        progress(counts["done"], len(records), counts["failed"])
+
+        if progress:
+            progress(counts["done"], len(records), counts["failed"])
+        with ThreadPoolExecutor(max_workers=max(1, len(lanes))) as executor:
+            for future in [executor.submit(run_lane, e, lane) for e, lane in zip(engines, lanes)]:
+                future.result()
+
+    return {"total": len(records), "done": counts["done"], "failed": counts["failed"],
+            "skipped": len(records) - len(pending)}
+
+
+def evaluate(engine, token_ids: List[int], record: dict, params: BatchParams) -> dict:
+    """One output line: the prompt's candidates, or the error that prevented them."""
+    settings = {name: record.get(name, getattr(params, name)) for name in SAMPLING_FIELDS}
+    result = {"index": record["index"]}
+    if "id" in record:
+        result["id"] = record["id"]
+    try:
+        top_logprobs = engine.get_top_logprobs(token_ids, settings["top_k"])
+        result["candidates"] = engine.postprocess_candidates(
+            top_logprobs, record["prompt"], settings["temp"], settings["top_p"], settings["repeat_penalty"]
+        )
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+@dataclass
+class BatchJob:
+    job_id: str
+    input_path: str
+    output_path: str
+    state: DownloadState = DownloadState.PENDING  # Same lifecycle as a download
+    progress: float = 0.0  # Percentage 0-100
+    prompts_done: int = 0
+    total_prompts: int = 0
+    failed_prompts: int = 0
+    error_message: str = ""
+    started_at: datetime = field(default_factory=datetime.now)
+    completed_at: Optional[datetime] = None
+
+
+class BatchManager:
+    """Batch jobs started over the API. Jobs run one at a time; later ones wait as PENDING."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._jobs: Dict[str, BatchJob] = {}
+        self._jobs_lock = threading.RLock()
+        self._run_lock = threading.Lock()
+
+    def create_job(self, input_path: str, output_path: str) -> str:
+        job_id = str(uuid.uuid4())
+        with self._jobs_lock:
+            self._jobs[job_id] = BatchJob(job_id=job_id, input_path=input_path, output_path=output_path)
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[BatchJob]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def get_all_jobs(self) -> list:
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def update_progress(self, job_id: str, done: int, total: int, failed: int):
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.prompts_done = done
+                job.total_prompts = total
+                job.failed_prompts = failed
+                job.progress = done / total * 100 if total else 100.0
+
+    def set_state(self, job_id: str, state: DownloadState, error_message: str = ""):
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.state = state
+                if error_message:
+                    job.error_message = error_message
+                if state in (DownloadState.COMPLETED, DownloadState.FAILED, DownloadState.CANCELLED):
+                    job.completed_at = datetime.now()
+
+    def is_cancelled(self, job_id: str) -> bool:
+        job = self.get_job(job_id)
+        return job is None or job.state == DownloadState.CANCELLED
+
+    def cancel_job(self, job_id: str) -> bool:
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job and job.state in (DownloadState.PENDING, DownloadState.IN_PROGRESS):
+                self.set_state(job_id, DownloadState.CANCELLED)
+                return True
+        return False
+
+    def start_job_thread(self, job_id: str, engines: list, params: BatchParams, resume: bool = False):
+        thread = threading.Thread(
+            target=self._run_job, args=(job_id, engines, params, resume), daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _run_job(self, job_id: str, engines: list, params: BatchParams, resume: bool):
+        with self._run_lock:
+            if self.is_cancelled(job_id):
+                return
+            job = self.get_job(job_id)
+            self.set_state(job_id, DownloadState.IN_PROGRESS)
+            try:
+                run_batch(
+                    engines,
+                    job.input_path,
+                    job.output_path,
+                    params,
+                    resume=resume,
+                    progress=lambda done, total, failed: self.update_progress(job_id, done, total, failed),
+                    cancelled=lambda: self.is_cancelled(job_id),
+                )
+            except Exception as e:
+                self.set_state(job_id, DownloadState.FAILED, str(e))
+                return
+            if not self.is_cancelled(job_id):
+                self.set_state(job_id, DownloadState.COMPLETED)
+
+    def to_dict(self, job: BatchJob) -> dict:
+        return {
+            "job_id": job.job_id,
+            "input_file": os.path.basename(job.input_path),
+            "output_file": os.path.basename(job.output_path),
+            "state": job.state.value,
+            "progress": round(job.progress, 1),
+            "prompts_done": job.prompts_done,
+            "total_prompts": job.total_prompts,
+            "failed_prompts": job.failed_prompts,
+            "error_message": job.error_message,
+            "started_at": job.started_at.isoformat(),
+            "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Next-token candidates for every prompt in a JSONL file")
+    parser.add_argument("input", help="JSONL file with one {\"prompt\": ...} object per line")
+    parser.add_argument("output", help="JSONL file to write results to")
+    parser.add_argument("--model", required=True, help="GGUF model path")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Worker processes, each on its own core group (0 = run in-process)")
+    parser.add_argument("--temp", type=float, default=BatchParams.temp)
+    parser.add_argument("--top-k", type=int, default=BatchParams.top_k)
+    parser.add_argument("--top-p", type=float, default=BatchParams.top_p)
+    parser.add_argument("--repeat-penalty", type=float, default=BatchParams.repeat_penalty)
+    parser.add_argument("--resume", action="store_true", help="Skip prompts already in the output")
+    args = parser.parse_args(argv)
+
+    params = BatchParams(args.temp, args.top_k, args.top_p, args.repeat_penalty)
+    pool = None
+    if args.workers > 0:
+        from app.worker_pool import WorkerEngine, WorkerPool
+
+        pool = WorkerPool(args.workers, args.model)
+        engines = [WorkerEngine(pool, worker) for worker in pool.workers]
+    else:
+        from app.llm import LLMEngine
+
+        LLMEngine.model_path_override = args.model
+        engines = [LLMEngine()]
+
+    def report(done, total, failed):
+        print(f"\r{done}/{total} prompts ({failed} failed)", end="", file=sys.stderr, flush=True)
+
+    try:
+        summary = run_batch(engines, args.input, args.output, params, resume=args.resume, progress=report)
+    finally:
+        if pool is not None:
+            pool.stop()
+    print(file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.llm import select_diverse_indices
+from app.speculative import SpeculativeConfig, SpeculativeStats, generate
+
+MAX_TREE_NODES = 1024
+
+
+@dataclass(eq=False)
+class BeamNode:
+    node_id: str
+    parent: Optional["BeamNode"] = field(repr=False)
+    token_ids: List[int]  # Tokens on the edge from the parent
+    tokens: List[dict]  # {"token": text, "prob": 0-1} for each edge token
+    children: Dict[int, "BeamNode"] = field(default_factory=dict, repr=False)  # Keyed by first token ID
+    internal: bool = False  # Created by an edge split rather than handed out as a path
+    top_logprobs: Optional[list] = None  # Cached raw distribution after this node
+    top_k: int = 0
+    # (top_k, top_logprobs) after token_ids[:i + 1], for edge positions i short of the end
+    inner_logprobs: Dict[int, tuple] = field(default_factory=dict, repr=False)
+
+
+class BeamTree:
+    """
+    Radix tree of explored continuations of a session's context.
+    The root edge holds the context itself; every other node ID doubles as a beam path ID.
+    The KV cache is shared through the engine's longest-prefix reuse, so decoding from a
+    node only evaluates tokens past the point where it diverges from the last evaluated path.
+    """
+
+    def __init__(self, context_tokens: List[int], context_text: str, model_path: Optional[str] = None):
+        self.root = BeamNode(node_id=str(uuid.uuid4()), parent=None, token_ids=list(context_tokens), tokens=[])
+        self.context_text = context_text
+        self.model_path = model_path  # Token IDs and distributions only hold for this model
+        self.nodes: Dict[str, BeamNode] = {self.root.node_id: self.root}
+
+    def get(self, node_id: str) -> Optional[BeamNode]:
+        return self.nodes.get(node_id)
+
+    def path_tokens(self, node: BeamNode) -> List[int]:
+        """Token IDs from the start of the context to the end of `node`."""
+        edges = []
+        while node is not None:
+            edges.append(node.token_ids)
+            node = node.parent
+        return [t for edge in reversed(edges) for t in edge]
+
+    def path_steps(self, node: BeamNode) -> List[dict]:
+        """Generated tokens (with probabilities) from the root to the end of `node`."""
+        edges = []
+        while node is not None:
+            edges.append(node.tokens)
+            node = node.parent
+        return [t for edge in reversed(edges) for t in edge]
+
+    def path_distributions(self, node: BeamNode) -> List[Tuple[int, list]]:
+        """
+        Cached distributions along the path to `node`, as (number of path tokens they follow,
+        top_logprobs), up to but not including the one after its end.
+        """
+        nodes = []
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        distributions = []
+        start = 0
+        for i, current in enumerate(reversed(nodes)):
+            for position in sorted(current.inner_logprobs):
+                distributions.append((start + position + 1, current.inner_logprobs[position][1]))
+            start += len(current.token_ids)
+            if i < len(nodes) - 1 and current.top_logprobs is not None:
+                distributions.append((start, current.top_logprobs))
+        return distributions
+
+    def path_text(self, node: BeamNode) -> str:
+        return self.context_text + "".join(t["token"] for t in self.path_steps(node))
+
+    def _add(self, node: BeamNode) -> BeamNode:
+        if len(self.nodes) >= MAX_TREE_NODES:
+            raise ValueError("Beam tree is full, adopt or delete some paths")
+        self.nodes[node.node_id] = node
+        if node.parent is not None:
+            node.parent.children[node.token_ids[0]] = node
+        return node
+
+    def _split(self, node: BeamNode, n: int) -> BeamNode:
+        """Split node's edge after n tokens. The node keeps its ID (it still ends in the same place)."""
+        upper = BeamNode(
+            node_id=str(uuid.uuid4()),
+            parent=node.parent,
+            token_ids=node.token_ids[:n],
+            tokens=node.tokens[:n],
+            internal=True,
+            inner_logprobs={i: d for i, d in node.inner_logprobs.items() if i < n - 1},
+        )
+        if n - 1 in node.inner_logprobs:
+            upper.top_k, upper.top_logprobs = node.inner_logprobs[n - 1]
+        self._add(upper)
+        node.token_ids = node.token_ids[n:]
+        node.tokens = node.tokens[n:]
+        node.inner_logprobs = {i - n: d for i, d in node.inner_logprobs.items() if i >= n}
+        node.parent = upper
+        upper.children[node.token_ids[0]] = node
+        return upper
+
+    def insert(self, parent: BeamNode, token_ids: List[int], tokens: List[dict]) -> BeamNode:
+        """Insert a continuation below `parent`, sharing any existing prefix. Returns its end node."""
+        node = parent
+        i = 0
+        while i < len(token_ids):
+            child = node.children.get(token_ids[i])
+            if child is None:
+                return self._add(BeamNode(
+                    node_id=str(uuid.uuid4()),
+                    parent=node,
+                    token_ids=list(token_ids[i:]),
+                    tokens=list(tokens[i:]),
+                ))
+            n = len(os.path.commonprefix([child.token_ids, list(token_ids[i:])]))
+            if n < len(child.token_ids):
+                child = self._split(child, n)
+            node = child
+            i += n
+        node.internal = False
+        return node
+
+    def append(self, node: BeamNode, token_id: int, token: dict) -> BeamNode:
+        """Extend a path by one token. Leaves grow in place so the path keeps its ID."""
+        if node is not self.root and not node.children:
+            if node.top_logprobs is not None:
+                node.inner_logprobs[len(node.token_ids) - 1] = (node.top_k, node.top_logprobs)
+            node.token_ids.append(token_id)
+            node.tokens.append(token)
+            node.top_logprobs = None
+            node.top_k = 0
+            return node
+        return self.insert(node, [token_id], [token])
+
+    def remove(self, node_id: str) -> bool:
+        """
+        Delete a path and any split nodes left without children. Paths that run on through
+        its end are kept, so then the node just stays as their split point.
+        """
+        node = self.nodes.get(node_id)
+        if node is None or node is self.root or node.internal:
+            return False
+        if node.children:
+            node.internal = True
+            return True
+        del self.nodes[node.node_id]
+        parent = node.parent
+        del parent.children[node.token_ids[0]]
+        while parent is not self.root and parent.internal and not parent.children:
+            del self.nodes[parent.node_id]
+            del parent.parent.children[parent.token_ids[0]]
+            parent = parent.parent
+        return True
+
+    def reroot(self, node: BeamNode, context_text: str):
+        """Make `node` the new root (the adopted context), dropping every other branch."""
+        node.token_ids = self.path_tokens(node)
+        node.tokens = []
+        node.inner_logprobs = {}
+        node.parent = None
+        node.internal = False
+        self.root = node
+        self.context_text = context_text
+        self.nodes = {}
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            self.nodes[current.node_id] = current
+            stack.extend(current.children.values())
+
+    def to_path(self, node: BeamNode) -> dict:
+        steps = self.path_steps(node)
+        cumulative_prob = 1.0
+        for t in steps:
+            cumulative_prob *= t["prob"]
+        return {
+            "id": node.node_id,
+            "text": self.path_text(node),
+            "tokens": steps,
+            "cumulative_prob": cumulative_prob,
+        }
+
+
+def node_candidates(tree: BeamTree, node: BeamNode, engine, temp=0.8, top_k=40, top_p=0.95,
+                    repeat_penalty=1.0) -> list:
+    """Candidates after `node`, decoding only when its distribution isn't cached yet."""
+    if node.top_logprobs is None or node.top_k < top_k:
+        node.top_logprobs = engine.get_top_logprobs(tree.path_tokens(node), top_k)
+        node.top_k = top_k
+    return engine.postprocess_candidates(
+        node.top_logprobs[:top_k], tree.path_text(node), temp, top_p, repeat_penalty
+    )
+
+
+def extend_node(tree: BeamTree, node: BeamNode, engine, **sampling) -> Optional[BeamNode]:
+    """Greedily extend a path by its most likely non-excluded token."""
+    candidates = node_candidates(tree, node, engine, **sampling)
+    valid = [c for c in candidates if not c.get("excluded", False)]
+    if not valid:
+        return None
+    best = valid[0]
+    return tree.append(node, best["token_id"], {"token": best["token"], "prob": best["prob"] / 100.0})
+
+
+def extend_path(tree: BeamTree, node: BeamNode, engine, n_tokens: int,
+                speculative: Optional[SpeculativeConfig] = None,
+                stats: Optional[SpeculativeStats] = None, **sampling) -> BeamNode:
+    """
+    Greedily extend a path by up to n_tokens. With speculative decoding on, drafted tokens
+    are verified in batches, and every verified distribution is cached on the path's nodes.
+    """
+    if speculative is None or speculative.mode == "off":
+        for _ in range(n_tokens):
+            extended = extend_node(tree, node, engine, **sampling)
+            if extended is None:
+                break
+            node = extended
+        return node
+
+    steps = generate(engine, tree.path_tokens(node), tree.path_text(node), n_tokens, speculative,
+                     greedy=True, stats=stats, **sampling)
+    for step in steps:
+        node.top_logprobs = step["top_logprobs"]
+        node.top_k = sampling.get("top_k", 40)
+        node = tree.append(node, step["token_id"], {"token": step["token"], "prob": step["prob"]})
+    return node
+
+
+def expand_node(tree: BeamTree, node: BeamNode, engine, num_paths: int = 3, depth: int = 1,
+                speculative: Optional[SpeculativeConfig] = None,
+                stats: Optional[SpeculativeStats] = None, **sampling) -> List[BeamNode]:
+    """Branch num_paths divergent continuations from `node`, each `depth` tokens deep."""
+    candidates = node_candidates(tree, node, engine, **sampling)
+    valid = [c for c in candidates if not c.get("excluded", False)]
+
+    leaves = []
+    # Weighted sampling can pick the same start twice; the tree would merge them anyway
+    for idx in dict.fromkeys(select_diverse_indices(len(valid), num_paths)):
+        candidate = valid[idx]
+        leaf = tree.insert(
+            node,
+            [candidate["token_id"]],
+            [{"token": candidate["token"], "prob": candidate["prob"] / 100.0}],
+        )
+        leaf = extend_path(tree, leaf, engine, depth - 1, speculative, stats, **sampling)
+        if leaf not in leaves:
+            leaves.append(leaf)
+    return leaves
@@ -0,0 +1,188 @@
+import bisect
+import ctypes
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import llama_cpp
+from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+# Used when the GGUF has no tokenizer.chat_template
+CHATML_TEMPLATE = (
+    "{% for message in messages %}"
+    "{{ '<|im_start|>' + message['role'] + '\n' + message['content'] + '<|im_end|>' + '\n' }}"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}{{ '<|im_start|>assistant\n' }}{% endif %}"
+)
+
+# Rendered + tokenized conversations, so each generated token doesn't re-render every turn
+MAX_CACHED_PROMPTS = 64
+# Budget for KV snapshots taken at completed-turn boundaries
+TURN_CACHE_BYTES = int(os.environ.get("CHAT_TURN_CACHE_MB", "1024")) * 1024 * 1024
+
+
+class TurnStateCache:
+    """
+    KV cache snapshots of the main model at chat turn boundaries, keyed by the token prefix.
+    Restoring one means a new message only prefills its own turn, even when other requests
+    have overwritten the live KV cache in between. Least recently used snapshots are
+    dropped beyond max_bytes, and a snapshot replaces any it extends.
+    """
+
+    def __init__(self, max_bytes: int = TURN_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._states: "OrderedDict[Tuple[int, ...], ctypes.Array]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    def lookup(self, tokens: List[int], boundaries: List[int]) -> Optional[int]:
+        """Longest boundary with a snapshot whose tokens match the start of `tokens`."""
+        for boundary in sorted(boundaries, reverse=True):
+            key = tuple(tokens[:boundary])
+            if key in self._states:
+                self._states.move_to_end(key)
+                return boundary
+        return None
+
+    def save(self, model, n_tokens: int):
+        """Snapshot the model's sequence, which must hold exactly n_tokens tokens."""
+        ctx = model._ctx.ctx
+        size = llama_cpp.llama_state_seq_get_size(ctx, 0)
+        if size > self.max_bytes:
+            return
+        buf = (ctypes.c_uint8 * size)()
+        llama_cpp.llama_state_seq_get_data(ctx, buf, size, 0)
+
+        key = tuple(model.input_ids[:n_tokens].tolist())
+        for old in [k for k in self._states if len(k) < len(key) and key[:len(k)] == k]:
+            self._drop(old)
+        self._states[key] = buf
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            self._drop(next(iter(self._states)))
+
+    def restore(self, model, tokens: List[int], n_tokens: int):
+        """Bring back a snapshot's KV cache. Its tokens' logits aren't restored (see LLMEngine.logits_valid)."""
+        buf = self._states[tuple(tokens[:n_tokens])]
+        model._ctx.kv_cache_seq_rm(-1, 0, -1)
+        llama_cpp.llama_state_seq_set_data(model._ctx.ctx, buf, len(buf), 0)
+        model.input_ids[:n_tokens] = tokens[:n_tokens]
+        model.n_tokens = n_tokens
+
+    def clear(self):
+        self._states.clear()
+        self.total_bytes = 0
+
+    def _drop(self, key):
+        self.total_bytes -= len(self._states.pop(key))
+
+
+_formatters: Dict[Tuple[str, bool], Jinja2ChatFormatter] = {}
+_prompts: "OrderedDict[tuple, dict]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def render(info: dict, messages: List[dict], add_generation_prompt: bool) -> str:
+    """Render messages with the model's chat template (see LLMEngine.chat_template_info)."""
+    template = info["template"] or CHATML_TEMPLATE
+    key = (template, add_generation_prompt)
+    with _lock:
+        formatter = _formatters.get(key)
+        if formatter is None:
+            formatter = Jinja2ChatFormatter(
+                template, info["eos_token"], info["bos_token"], add_generation_prompt
+            )
+            _formatters[key] = formatter
+    return formatter(messages=messages).prompt
+
+
+def build_prompt(engine, messages: List[dict], assistant_prefix: str = "") -> dict:
+    """
+    Render and tokenize a conversation, ready for the assistant's reply.
+    Returns prompt (text), token_ids, and boundaries: the token count at the end of each
+    completed message, where the conversation can be cached.
+    """
+    info = engine.chat_template_info()
+    key = (engine.get_current_model(), json.dumps(messages))
+    with _lock:
+        cached = _prompts.get(key)
+        if cached is not None:
+            _prompts.move_to_end(key)
+    if cached is None:
+        cached = _tokenize_conversation(engine, info, messages)
+        with _lock:
+            _prompts[key] = cached
+            while len(_prompts) > MAX_CACHED_PROMPTS:
+                _prompts.popitem(last=False)
+
+    token_ids = cached["token_ids"]
+    if assistant_prefix:
+        token_ids = token_ids + engine.tokenize(assistant_prefix.encode("utf-8"))
+    return {
+        "prompt": cached["prompt"] + assistant_prefix,
+        "token_ids": token_ids,
+        "boundaries": cached["boundaries"],
+        "stop": [info["eos_token"]] + info.get("stop", []),
+    }
+
+
+def _tokenize_conversation(engine, info: dict, messages: List[dict]) -> dict:
+    prompt = render(info, messages, add_generation_prompt=True)
+
+    prefix = engine.prefix_tokens()
+    text = prompt
+    # Templates usually write the BOS text themselves; tokenize_with_offsets adds the real one
+    if prefix and info["bos_token"] and text.startswith(info["bos_token"]):
+        text = text[len(info["bos_token"]):]
+    skipped = len(prompt.encode("utf-8")) - len(text.encode("utf-8"))
+    ids = engine.tokenize(text.encode("utf-8")) if text else []
+    offsets = []
+    pos = 0
+    for piece in engine.token_pieces(ids):
+        offsets.append(pos)
+        pos += len(piece)
+
+    boundaries = []
+    for i in range(1, len(messages) + 1):
+        try:
+            turn = render(info, messages[:i], add_generation_prompt=False)
+        except Exception:
+            continue  # Some templates insist on a complete exchange
+        if not prompt.startswith(turn):
+            continue
+        end = len(turn.encode("utf-8")) - skipped
+        index = bisect.bisect_left(offsets, end)
+        # Only usable where a token starts exactly at the end of the turn
+        if 0 < index < len(offsets) and offsets[index] == end:
+            boundaries.append(len(prefix) + index)
+
+    return {"prompt": prompt, "token_ids": prefix + ids, "boundaries": boundaries}
+
+
+def chat_candidates(
+    engine,
+    messages: List[dict],
+    assistant_prefix: str = "",
+    temp: float = 0.8,
+    top_k: int = 40,
+    top_p: float = 0.95,
+    repeat_penalty: float = 1.0,
+    timings=None,
+) -> dict:
+    """Next-token candidates for the assistant's reply to a conversation."""
+    built = build_prompt(engine, messages, assistant_prefix)
+    result = engine.chat_top_logprobs(built["token_ids"], built["boundaries"], top_k, timings=timings)
+    candidates = engine.postprocess_candidates(
+        result["top_logprobs"], built["prompt"], temp, top_p, repeat_penalty
+    )
+    return {
+        "candidates": candidates,
+        "prompt": built["prompt"],
+        "n_tokens": len(built["token_ids"]),
+        "restored_tokens": result["restored_tokens"],
+        "stop": built["stop"],
+    }
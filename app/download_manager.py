@@ -1,12 +1,39 @@
+import asyncio
+import heapq
+import itertools
 import threading
 import time
 import uuid
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Dict, Optional, Callable
+from typing import Dict, List, Optional, Callable
+import atexit
 import os
 
+from app.download_registry import DownloadRegistry
+from app.ranged_download import resume_progress
+from app.utils import MODEL_DIR
+
+# Minimum gap between progress events for one download. State changes are always sent.
+PROGRESS_EVENT_INTERVAL = 0.25
+
+# Downloads beyond this many wait in the queue as PENDING
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", "2"))
+# Global download bandwidth cap in bytes/s (0 = unlimited)
+DOWNLOAD_BANDWIDTH_LIMIT = int(os.environ.get("DOWNLOAD_BANDWIDTH_LIMIT", "0"))
+# Cap applied while inference requests are running (0 = no extra throttling)
+INFERENCE_BANDWIDTH_LIMIT = int(os.environ.get("INFERENCE_BANDWIDTH_LIMIT", "0"))
+# Inference counts as active for this long after the last request finishes
+INFERENCE_QUIET_SECONDS = 2.0
+# How often finished downloads are swept from the list
+CLEANUP_INTERVAL_SECONDS = 3600
+
+# Download history survives restarts here (empty string disables persistence)
+REGISTRY_PATH = os.environ.get("DOWNLOAD_REGISTRY", os.path.join(MODEL_DIR, "downloads.db"))
+# Progress updates are written to the registry in batches at most this often
+PROGRESS_FLUSH_INTERVAL = 5.0
+
 
 class DownloadState(Enum):
     PENDING = "pending"
@@ -31,6 +58,62 @@ class DownloadInfo:
     target_path: Optional[str] = None
 
 
+class DownloadSubscription:
+    """
+    One subscriber to download events, bound to the event loop that created it.
+    Events for the same download coalesce until the subscriber reads them.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._pending: Dict[str, dict] = {}
+        self._ready = asyncio.Event()
+
+    def publish(self, event: dict):
+        """Thread-safe: hand an event to the subscriber's loop."""
+        self._loop.call_soon_threadsafe(self._push, event)
+
+    def _push(self, event: dict):
+        self._pending[event["download_id"]] = event
+        self._ready.set()
+
+    async def next_events(self, timeout: Optional[float] = None) -> List[dict]:
+        """Wait for events and return the latest one per download. Empty on timeout."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        events = list(self._pending.values())
+        self._pending.clear()
+        return events
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all downloads. The rate is re-read on every call."""
+
+    def __init__(self, rate: Callable[[], int]):
+        self._rate = rate
+        self._lock = threading.Lock()
+        self._allowance = 0.0
+        self._last = time.monotonic()
+
+    def consume(self, n: int):
+        """Account for n bytes read, sleeping as long as needed to stay under the rate."""
+        rate = self._rate()
+        if rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Allow at most one second of burst after an idle period
+            self._allowance = min(float(rate), self._allowance + (now - self._last) * rate)
+            self._last = now
+            self._allowance -= n
+            wait = -self._allowance / rate if self._allowance < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
 class DownloadManager:
     _instance = None
     _lock = threading.Lock()
@@ -50,15 +133,49 @@ class DownloadManager:
         self._downloads: Dict[str, DownloadInfo] = {}
         self._downloads_lock = threading.RLock()
         self._active_threads: Dict[str, threading.Thread] = {}
+        self._subscribers: List[DownloadSubscription] = []
+        self._last_published: Dict[str, float] = {}
+
+        self.max_concurrent = MAX_CONCURRENT_DOWNLOADS
+        self.bandwidth_limit = DOWNLOAD_BANDWIDTH_LIMIT
+        self.inference_bandwidth_limit = INFERENCE_BANDWIDTH_LIMIT
+        self.limiter = BandwidthLimiter(self.current_bandwidth_limit)
+        self._queue: list = []
+        self._queue_seq = itertools.count()
+        self._inference_requests = 0
+        self._last_inference = 0.0
+        self._last_cleanup = time.monotonic()
+
+        self._registry = DownloadRegistry(REGISTRY_PATH) if REGISTRY_PATH else None
+        self._dirty: set = set()
+        self._last_flush = time.monotonic()
+        self._interrupted: List[str] = []
+        if self._registry:
+            self._load_registry()
+            atexit.register(self.flush)
 
     def create_download(self, repo_id: str, filename: str) -> str:
+        """
+        Record a new download, or return the pending or running one that writes the same local
+        file: two at once would share its .part file and manifest.
+        """
+        self._maybe_cleanup()
         download_id = str(uuid.uuid4())
+        local_filename = os.path.basename(filename)
         with self._downloads_lock:
+            for download in self._downloads.values():
+                if (
+                    download.state in (DownloadState.PENDING, DownloadState.IN_PROGRESS)
+                    and os.path.basename(download.filename) == local_filename
+                ):
+                    return download.download_id
             self._downloads[download_id] = DownloadInfo(
                 download_id=download_id,
                 repo_id=repo_id,
                 filename=filename,
             )
+            self._persist(self._downloads[download_id])
+            self._publish(self._downloads[download_id])
         return download_id
 
     def get_download(self, download_id: str) -> Optional[DownloadInfo]:
@@ -66,6 +183,7 @@ class DownloadManager:
             return self._downloads.get(download_id)
 
     def get_all_downloads(self) -> list:
+        self._maybe_cleanup()
         with self._downloads_lock:
             return list(self._downloads.values())
 
@@ -92,6 +210,9 @@ class DownloadManager:
                     download.bytes_downloaded = bytes_downloaded
                 if total_bytes is not None:
                     download.total_bytes = total_bytes
+                self._dirty.add(download_id)
+                self._maybe_flush()
+                self._publish(download, throttle=True)
 
     def set_state(
         self,
@@ -110,22 +231,83 @@ class DownloadManager:
                     download.target_path = target_path
                 if state in (DownloadState.COMPLETED, DownloadState.FAILED, DownloadState.CANCELLED):
                     download.completed_at = datetime.now()
+                self._persist(download)
+                self._publish(download)
 
     def start_download_thread(
         self,
         download_id: str,
         download_func: Callable,
+        priority: int = 0,
     ):
-        def run_download():
-            try:
-                download_func()
-            except Exception as e:
-                self.set_state(download_id, DownloadState.FAILED, str(e))
+        """
+        Queue a download. It stays PENDING until one of the max_concurrent slots is free.
+        Higher priority runs first; equal priorities run in request order. A download
+        that is already queued or running is left as it is.
+        """
+        with self._downloads_lock:
+            if download_id in self._active_threads or any(entry[2] == download_id for entry in self._queue):
+                return
+            heapq.heappush(
+                self._queue, (-priority, next(self._queue_seq), download_id, download_func)
+            )
+        self._dispatch()
+
+    def _dispatch(self):
+        """Start queued downloads while there are free slots."""
+        with self._downloads_lock:
+            while self._queue and len(self._active_threads) < self.max_concurrent:
+                _, _, download_id, download_func = heapq.heappop(self._queue)
+                download = self._downloads.get(download_id)
+                if not download or download.state != DownloadState.PENDING:
+                    continue  # Cancelled or cleaned up while queued
+                thread = threading.Thread(
+                    target=self._run_download, args=(download_id, download_func), daemon=True
+                )
+                self._active_threads[download_id] = thread
+                thread.start()
+
+    def _run_download(self, download_id: str, download_func: Callable):
+        try:
+            download_func()
+            download = self.get_download(download_id)
+            if download and download.state in (DownloadState.PENDING, DownloadState.IN_PROGRESS):
+                # The function returned without finishing or failing the download; left as
+                # is, it would be resumed on every restart
+                self.set_state(download_id, DownloadState.FAILED, "Download ended without completing")
+        except Exception as e:
+            self.set_state(download_id, DownloadState.FAILED, str(e))
+        finally:
+            with self._downloads_lock:
+                self._active_threads.pop(download_id, None)
+            self._dispatch()
+
+    def queued_count(self) -> int:
+        with self._downloads_lock:
+            return len(self._queue)
+
+    def inference_started(self):
+        with self._downloads_lock:
+            self._inference_requests += 1
 
-        thread = threading.Thread(target=run_download, daemon=True)
+    def inference_finished(self):
         with self._downloads_lock:
-            self._active_threads[download_id] = thread
-        thread.start()
+            self._inference_requests -= 1
+            self._last_inference = time.monotonic()
+
+    def inference_active(self) -> bool:
+        return (
+            self._inference_requests > 0
+            or time.monotonic() - self._last_inference < INFERENCE_QUIET_SECONDS
+        )
+
+    def current_bandwidth_limit(self) -> int:
+        """Bytes/s downloads may use right now (0 = unlimited)."""
+        limits = [self.bandwidth_limit]
+        if self.inference_bandwidth_limit and self.inference_active():
+            limits.append(self.inference_bandwidth_limit)
+        limits = [limit for limit in limits if limit > 0]
+        return min(limits) if limits else 0
 
     def cancel_download(self, download_id: str) -> bool:
         with self._downloads_lock:
@@ -136,6 +318,14 @@ class DownloadManager:
                 return True
         return False
 
+    def _maybe_cleanup(self):
+        """Run cleanup_old_downloads at most once per CLEANUP_INTERVAL_SECONDS."""
+        now = time.monotonic()
+        if now - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+            return
+        self._last_cleanup = now
+        self.cleanup_old_downloads()
+
     def cleanup_old_downloads(self, max_age_hours: int = 24):
         cutoff = datetime.now().timestamp() - (max_age_hours * 3600)
         with self._downloads_lock:
@@ -146,8 +336,126 @@ class DownloadManager:
             for did in to_remove:
                 del self._downloads[did]
                 self._active_threads.pop(did, None)
+                self._last_published.pop(did, None)
+                self._dirty.discard(did)
+            if self._registry:
+                self._registry.delete(to_remove)
             return len(to_remove)
 
+    def _persist(self, download: DownloadInfo):
+        """Write a state change now, along with any batched progress. Caller holds _downloads_lock."""
+        if not self._registry:
+            return
+        self._dirty.add(download.download_id)
+        self.flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= PROGRESS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Write all records with unsaved changes to the registry in one transaction."""
+        if not self._registry:
+            return
+        with self._downloads_lock:
+            records = [
+                self.to_dict(self._downloads[did]) for did in self._dirty if did in self._downloads
+            ]
+            self._dirty.clear()
+            self._last_flush = time.monotonic()
+            self._registry.save(records)
+
+    def _load_registry(self):
+        """Restore saved downloads and reconcile interrupted ones against the files on disk."""
+        for record in self._registry.load():
+            download = DownloadInfo(
+                download_id=record["download_id"],
+                repo_id=record["repo_id"],
+                filename=record["filename"],
+                state=DownloadState(record["state"]),
+                progress=record["progress"] or 0.0,
+                bytes_downloaded=record["bytes_downloaded"] or 0,
+                total_bytes=record["total_bytes"] or 0,
+                error_message=record["error_message"] or "",
+                started_at=datetime.fromisoformat(record["started_at"]),
+                completed_at=(
+                    datetime.fromisoformat(record["completed_at"]) if record["completed_at"] else None
+                ),
+                target_path=record["target_path"],
+            )
+            self._downloads[download.download_id] = download
+            if download.state in (DownloadState.PENDING, DownloadState.IN_PROGRESS):
+                self._reconcile(download)
+                self._dirty.add(download.download_id)
+        self.flush()
+
+    def _reconcile(self, download: DownloadInfo):
+        """Settle a download the last process left unfinished."""
+        local_path = os.path.join(MODEL_DIR, os.path.basename(download.filename))
+        partial = resume_progress(local_path)
+
+        if partial is None and os.path.exists(local_path):
+            # Finished on disk before the final state was recorded
+            size = os.path.getsize(local_path)
+            download.state = DownloadState.COMPLETED
+            download.progress = 100.0
+            download.bytes_downloaded = download.total_bytes = size
+            download.target_path = local_path
+            download.completed_at = datetime.now()
+            return
+
+        if partial is not None:
+            download.bytes_downloaded, download.total_bytes = partial
+        else:
+            download.bytes_downloaded = 0
+        download.progress = (
+            download.bytes_downloaded / download.total_bytes * 100 if download.total_bytes else 0.0
+        )
+        download.state = DownloadState.PENDING
+        self._interrupted.append(download.download_id)
+
+    def resume_interrupted(self, make_download_func: Callable[[DownloadInfo], Callable]) -> int:
+        """Queue the downloads found interrupted at startup. Returns how many were queued."""
+        with self._downloads_lock:
+            interrupted, self._interrupted = self._interrupted, []
+        count = 0
+        for download_id in interrupted:
+            download = self.get_download(download_id)
+            if download and download.state == DownloadState.PENDING:
+                self.start_download_thread(download_id, make_download_func(download))
+                count += 1
+        return count
+
+    def subscribe(self) -> DownloadSubscription:
+        """Subscribe the running event loop to download events."""
+        subscription = DownloadSubscription(asyncio.get_running_loop())
+        with self._downloads_lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: DownloadSubscription):
+        with self._downloads_lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def _publish(self, download: DownloadInfo, throttle: bool = False):
+        """Send a download's state to subscribers. Caller holds _downloads_lock."""
+        if not self._subscribers:
+            return
+        now = time.monotonic()
+        last = self._last_published.get(download.download_id, 0.0)
+        if throttle and now - last < PROGRESS_EVENT_INTERVAL:
+            return
+        self._last_published[download.download_id] = now
+
+        event = self.to_dict(download)
+        for subscription in list(self._subscribers):
+            try:
+                subscription.publish(event)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                self._subscribers.remove(subscription)
+
     def to_dict(self, download: DownloadInfo) -> dict:
         return {
             "download_id": download.download_id,
@@ -0,0 +1,69 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable, List
+
+COLUMNS = (
+    "download_id",
+    "repo_id",
+    "filename",
+    "state",
+    "progress",
+    "bytes_downloaded",
+    "total_bytes",
+    "error_message",
+    "started_at",
+    "completed_at",
+    "target_path",
+)
+
+
+class DownloadRegistry:
+    """
+    SQLite-backed store for download records, so history and interrupted
+    downloads survive a restart. Records are the dicts from DownloadManager.to_dict.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            # WAL keeps writes cheap and lets readers in while a batch commits
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS downloads ("
+                "download_id TEXT PRIMARY KEY, record TEXT NOT NULL)"
+            )
+
+    def save(self, records: Iterable[dict]):
+        """Insert or replace records in a single transaction."""
+        rows = [
+            (r["download_id"], json.dumps({k: r.get(k) for k in COLUMNS}))
+            for r in records
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO downloads (download_id, record) VALUES (?, ?)", rows
+            )
+
+    def delete(self, download_ids: Iterable[str]):
+        rows = [(download_id,) for download_id in download_ids]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM downloads WHERE download_id = ?", rows)
+
+    def load(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT record FROM downloads").fetchall()
+        return [json.loads(record) for (record,) in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
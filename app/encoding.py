@@ -0,0 +1,167 @@
+import json
+import struct
+from typing import List, Optional
+
+import numpy as np
+from fastapi import Request, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+JSON = "application/json"
+# Parallel arrays instead of one object per candidate, as JSON
+COLUMNAR_JSON = "application/vnd.llm-explorer.columns+json"
+# Same columns as msgpack (only offered when msgpack is installed)
+MSGPACK = "application/msgpack"
+# Same columns with numeric arrays as raw little-endian typed arrays (see encode_binary)
+BINARY = "application/vnd.llm-explorer.columns"
+
+BINARY_MAGIC = b"LXC1"
+
+# TokenInfo's fields and defaults, applied here instead of validating each candidate
+CANDIDATE_DEFAULTS = {"cumulative_prob": 0.0, "excluded": False, "token_id": None}
+CANDIDATE_FIELDS = ("token", "prob", "logprob", "cumulative_prob", "excluded", "token_id")
+
+
+def dumps_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(data) -> Response:
+    """Serialize a large response without validating it against its response_model."""
+    return Response(dumps_json(data), media_type=JSON)
+
+
+def negotiate(request: Request) -> str:
+    """Pick the response format from the Accept header; plain JSON unless asked otherwise."""
+    accept = request.headers.get("accept", "")
+    for part in accept.split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in (MSGPACK, "application/x-msgpack") and msgpack is not None:
+            return MSGPACK
+        if media_type in (BINARY, COLUMNAR_JSON):
+            return media_type
+    return JSON
+
+
+def candidate_columns(candidates: List[dict]) -> dict:
+    """Candidates as parallel arrays. Numeric columns are numpy arrays."""
+    token_ids = [c.get("token_id") for c in candidates]
+    return {
+        "token": [c["token"] for c in candidates],
+        # -1 where the token ID isn't known (text-prompt path)
+        "token_id": np.array([-1 if t is None else t for t in token_ids], dtype="<i4"),
+        "prob": np.array([c["prob"] for c in candidates], dtype="<f4"),
+        "logprob": np.array([c["logprob"] for c in candidates], dtype="<f4"),
+        "cumulative_prob": np.array([c.get("cumulative_prob", 0.0) for c in candidates], dtype="<f4"),
+        "excluded": np.array([bool(c.get("excluded", False)) for c in candidates], dtype="u1"),
+    }
+
+
+def path_columns(paths: List[dict]) -> dict:
+    """Beam paths as parallel arrays; per-token columns are flattened with offsets."""
+    offsets = [0]
+    for path in paths:
+        offsets.append(offsets[-1] + len(path["tokens"]))
+    return {
+        "id": [p["id"] for p in paths],
+        "text": [p["text"] for p in paths],
+        "cumulative_prob": np.array([p["cumulative_prob"] for p in paths], dtype="<f4"),
+        # Tokens of path i are token[token_offsets[i]:token_offsets[i + 1]]
+        "token_offsets": np.array(offsets, dtype="<i4"),
+        "token": [t["token"] for p in paths for t in p["tokens"]],
+        "token_prob": np.array([t["prob"] for p in paths for t in p["tokens"]], dtype="<f4"),
+    }
+
+
+def encode_binary(fields: dict) -> bytes:
+    """
+    Typed binary layout:
+      b"LXC1", uint32 header length, UTF-8 JSON header (padded to 4 bytes),
+      then each numpy array's raw little-endian bytes (each padded to 4 bytes).
+    The header holds the non-array fields plus "arrays": [{name, dtype, length}]
+    in the order the arrays follow. dtype is "f4", "i4" or "u1".
+    """
+    header = {}
+    arrays = []
+    for name, value in fields.items():
+        if isinstance(value, np.ndarray):
+            arrays.append((name, value))
+        else:
+            header[name] = value
+    header["arrays"] = [
+        {"name": name, "dtype": array.dtype.str.lstrip("<|"), "length": len(array)}
+        for name, array in arrays
+    ]
+
+    header_bytes = dumps_json(header)
+    parts = [BINARY_MAGIC, struct.pack("<I", len(header_bytes)), header_bytes, _padding(len(header_bytes))]
+    for _, array in arrays:
+        data = array.tobytes()
+        parts.append(data)
+        parts.append(_padding(len(data)))
+    return b"".join(parts)
+
+
+def _padding(length: int) -> bytes:
+    return b"\0" * (-length % 4)
+
+
+def encode_response(
+    request: Request,
+    rows: dict,
+    columns_key: str,
+    columns: dict,
+) -> Response:
+    """
+    Serialize a hot-path response without pydantic validation.
+    `rows` is the regular JSON body. For columnar formats, the list under
+    `columns_key` is replaced by `columns` merged into the top level.
+    """
+    media_type = negotiate(request)
+    if media_type == JSON:
+        return json_response(rows)
+
+    fields = {k: v for k, v in rows.items() if k != columns_key}
+    fields.update(columns)
+    if media_type == BINARY:
+        return Response(encode_binary(fields), media_type=BINARY)
+
+    plain = {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in fields.items()}
+    if media_type == MSGPACK:
+        return Response(msgpack.packb(plain), media_type=MSGPACK)
+    return Response(dumps_json(plain), media_type=COLUMNAR_JSON)
+
+
+def candidates_response(request: Request, candidates: List[dict], **fields) -> Response:
+    rows = [{k: c.get(k, CANDIDATE_DEFAULTS.get(k)) for k in CANDIDATE_FIELDS} for c in candidates]
+    return encode_response(request, {"candidates": rows, **fields}, "candidates", candidate_columns(rows))
+
+
+def paths_response(request: Request, paths: List[dict], **fields) -> Response:
+    return encode_response(request, {"paths": paths, **fields}, "paths", path_columns(paths))
+
+
+def decode_binary(data: bytes) -> Optional[dict]:
+    """Inverse of encode_binary (used by tests and Python clients)."""
+    if data[:4] != BINARY_MAGIC:
+        return None
+    (header_len,) = struct.unpack_from("<I", data, 4)
+    pos = 8
+    header = json.loads(data[pos:pos + header_len])
+    pos += header_len + (-header_len % 4)
+    for spec in header.pop("arrays"):
+        dtype = np.dtype(spec["dtype"]).newbyteorder("<")
+        size = dtype.itemsize * spec["length"]
+        header[spec["name"]] = np.frombuffer(data, dtype=dtype, count=spec["length"], offset=pos)
+        pos += size + (-size % 4)
+    return header
@@ -0,0 +1,258 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, Optional
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF metadata value types
+_SCALARS = {
+    0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i",
+    6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d",
+}
+_STRING = 8
+_ARRAY = 9
+
+# llama.cpp `general.file_type` values
+FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M",
+    16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S",
+    22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M",
+    28: "IQ2_S", 29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16",
+}
+
+# Arrays longer than this (token lists, merges) are skipped; only their length is kept
+MAX_ARRAY_ITEMS = 64
+
+
+class _Reader:
+    """Sequential little-endian reader over a memory-mapped GGUF header."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def scalar(self, fmt: str):
+        value = struct.unpack_from(fmt, self.buf, self.pos)[0]
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def string(self) -> str:
+        length = self.scalar("<Q")
+        value = bytes(self.buf[self.pos:self.pos + length])
+        self.pos += length
+        return value.decode("utf-8", errors="replace")
+
+    def skip_string(self):
+        length = self.scalar("<Q")
+        self.pos += length
+
+    def value(self, value_type: int):
+        if value_type in _SCALARS:
+            return self.scalar(_SCALARS[value_type])
+        if value_type == _STRING:
+            return self.string()
+        if value_type == _ARRAY:
+            item_type = self.scalar("<I")
+            count = self.scalar("<Q")
+            if count <= MAX_ARRAY_ITEMS:
+                return [self.value(item_type) for _ in range(count)]
+            self.skip_array(item_type, count)
+            return {"length": count}
+        raise ValueError(f"Unknown GGUF value type {value_type}")
+
+    def skip_array(self, item_type: int, count: int):
+        if item_type in _SCALARS:
+            self.pos += struct.calcsize(_SCALARS[item_type]) * count
+        elif item_type == _STRING:
+            for _ in range(count):
+                self.skip_string()
+        else:
+            for _ in range(count):
+                self.value(item_type)
+
+
+def read_gguf_header(path: str) -> dict:
+    """
+    Read the KV metadata and tensor table of a GGUF file without touching the weights.
+    The file is memory-mapped, so only the header pages are actually read.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        if buf[:4] != GGUF_MAGIC:
+            raise ValueError(f"{os.path.basename(path)} is not a GGUF file")
+        reader = _Reader(buf)
+        reader.pos = 4
+        version = reader.scalar("<I")
+        tensor_count = reader.scalar("<Q")
+        kv_count = reader.scalar("<Q")
+
+        metadata = {}
+        for _ in range(kv_count):
+            key = reader.string()
+            metadata[key] = reader.value(reader.scalar("<I"))
+
+        parameter_count = 0
+        for _ in range(tensor_count):
+            reader.skip_string()
+            n_dims = reader.scalar("<I")
+            elements = 1
+            for _ in range(n_dims):
+                elements *= reader.scalar("<Q")
+            reader.pos += 4 + 8  # tensor type, data offset
+            parameter_count += elements
+
+    return {
+        "version": version,
+        "tensor_count": tensor_count,
+        "parameter_count": parameter_count,
+        "metadata": metadata,
+    }
+
+
+def summarize_gguf(path: str) -> dict:
+    """The catalog entry for one model: the GGUF fields the UI and loader care about."""
+    header = read_gguf_header(path)
+    meta = header["metadata"]
+    arch = meta.get("general.architecture", "")
+
+    def arch_value(key: str):
+        return meta.get(f"{arch}.{key}")
+
+    tokens = meta.get("tokenizer.ggml.tokens")
+    vocab_size = arch_value("vocab_size")
+    if vocab_size is None and isinstance(tokens, dict):
+        vocab_size = tokens["length"]
+    elif vocab_size is None and isinstance(tokens, list):
+        vocab_size = len(tokens)
+
+    file_type = meta.get("general.file_type")
+    return {
+        "name": meta.get("general.name"),
+        "architecture": arch or None,
+        "parameter_count": header["parameter_count"],
+        "quantization": FILE_TYPES.get(file_type) if file_type is not None else None,
+        "context_length": arch_value("context_length"),
+        "embedding_length": arch_value("embedding_length"),
+        "block_count": arch_value("block_count"),
+        "head_count": arch_value("attention.head_count"),
+        "head_count_kv": arch_value("attention.head_count_kv"),
+        "key_length": arch_value("attention.key_length"),
+        "value_length": arch_value("attention.value_length"),
+        "vocab_size": vocab_size,
+        "chat_template": meta.get("tokenizer.chat_template"),
+    }
+
+
+class ModelCatalog:
+    """
+    Index of the GGUF files in a directory with their parsed metadata.
+
+    Entries are cached by (path, size, mtime) in memory and in `catalog.json`
+    next to the models, so headers are only parsed when a file is new or has
+    changed. Listing re-scans the directory only when its mtime changes, but stats
+    every known file each time, since a file rewritten in place leaves it as is.
+    """
+
+    CACHE_FILENAME = "catalog.json"
+
+    def __init__(self, model_dir: str):
+        self.model_dir = model_dir
+        self.cache_path = os.path.join(model_dir, self.CACHE_FILENAME)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = self._load_cache()
+        self._dir_mtime_ns: Optional[int] = None
+        self._changed = False
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            try:
+                dir_mtime_ns = os.stat(self.model_dir).st_mtime_ns
+            except FileNotFoundError:
+                return []
+            if dir_mtime_ns != self._dir_mtime_ns:
+                self._refresh()
+                self._dir_mtime_ns = dir_mtime_ns
+            else:
+                for path in list(self._entries):
+                    self._entry(path)
+                self._save_cache()
+            return [self._entries[path] for path in sorted(self._entries)]
+
+    def get(self, path: str) -> Optional[dict]:
+        """Catalog entry for a single file, parsed now if it isn't cached."""
+        with self._lock:
+            entry = self._entry(path)
+            self._save_cache()
+            return entry
+
+    def _refresh(self):
+        paths = set(glob.glob(os.path.join(self.model_dir, "*.gguf")))
+        for path in list(self._entries):
+            if path not in paths:
+                del self._entries[path]
+                self._changed = True
+        for path in paths:
+            self._entry(path)
+        self._save_cache()
+
+    def _entry(self, path: str) -> Optional[dict]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if self._entries.pop(path, None):
+                self._changed = True
+            return None
+        entry = self._entries.get(path)
+        if entry and entry["size_bytes"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry
+
+        try:
+            gguf = summarize_gguf(path)
+            error = None
+        except (OSError, ValueError, struct.error) as e:
+            gguf, error = None, str(e)
+        entry = {
+            "path": path,
+            "size_bytes": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "gguf": gguf,
+            "error": error,
+        }
+        self._entries[path] = entry
+        self._changed = True
+        return entry
+
+    def _load_cache(self) -> Dict[str, dict]:
+        try:
+            with open(self.cache_path) as f:
+                return {entry["path"]: entry for entry in json.load(f)}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _save_cache(self):
+        if not self._changed:
+            return
+        self._changed = False
+        try:
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(list(self._entries.values()), f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass  # The cache is an optimization; a read-only model dir still works
+
+
+_catalogs: Dict[str, ModelCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(model_dir: str) -> ModelCatalog:
+    """The shared catalog for a models directory."""
+    with _catalogs_lock:
+        if model_dir not in _catalogs:
+            _catalogs[model_dir] = ModelCatalog(model_dir)
+        return _catalogs[model_dir]
@@ -0,0 +1,109 @@
+import io
+import os
+from typing import List
+
+import numpy as np
+
+# Steps kept per session; the oldest are overwritten beyond this
+HISTORY_STEPS = int(os.environ.get("HISTORY_STEPS", "2048"))
+# Candidates kept per step (the UI's top-k maximum)
+HISTORY_TOP_K = 100
+# Arrays start this small and double, so short sessions stay cheap
+INITIAL_CAPACITY = 64
+
+
+class SessionHistory:
+    """
+    The distributions a session was shown and the token taken after each, in a ring buffer
+    of columnar arrays: int32 token IDs, float16 logprobs, one row per step. Candidates are
+    stored in display order, so a step's rank is the chosen token's position.
+
+    position splits the steps into done (before) and undone (after, available to redo).
+    Recording a new step drops the undone ones.
+    """
+
+    def __init__(self, max_steps: int = HISTORY_STEPS, top_k: int = HISTORY_TOP_K):
+        self.max_steps = max_steps
+        self.top_k = top_k
+        self.start = 0  # Ring index of the oldest step
+        self.steps = 0
+        self.position = 0
+        self._allocate(0)
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self.context_len = np.zeros(capacity, dtype=np.int32)  # Tokens before the step
+        self.token_id = np.zeros(capacity, dtype=np.int32)  # Token taken
+        self.rank = np.zeros(capacity, dtype=np.int16)  # Its position in candidates, -1 if absent
+        self.n_candidates = np.zeros(capacity, dtype=np.int16)
+        self.candidate_ids = np.zeros((capacity, self.top_k), dtype=np.int32)
+        self.logprobs = np.zeros((capacity, self.top_k), dtype=np.float16)
+
+    def _grow(self):
+        """Double the arrays (up to max_steps), unrolling the ring so the oldest step is row 0."""
+        columns = self._columns()
+        self._allocate(min(max(INITIAL_CAPACITY, self.capacity * 2), self.max_steps))
+        for name, values in columns.items():
+            getattr(self, name)[:len(values)] = values
+        self.start = 0
+
+    def _row(self, i: int) -> int:
+        return (self.start + i) % self.capacity
+
+    def _columns(self) -> dict:
+        rows = [self._row(i) for i in range(self.steps)]
+        return {
+            "context_len": self.context_len[rows],
+            "token_id": self.token_id[rows],
+            "rank": self.rank[rows],
+            "n_candidates": self.n_candidates[rows],
+            "candidate_ids": self.candidate_ids[rows],
+            "logprobs": self.logprobs[rows],
+        }
+
+    def record(self, context_len: int, token_id: int, candidate_ids: List[int], logprobs: List[float]):
+        self.steps = self.position  # Undone steps can no longer be redone
+        if self.steps == self.capacity and self.capacity < self.max_steps:
+            self._grow()
+        if self.steps == self.capacity:
+            # Full: overwrite the oldest
+            self.start = (self.start + 1) % self.capacity
+            self.steps -= 1
+
+        row = self._row(self.steps)
+        n = min(len(candidate_ids), self.top_k)
+        self.context_len[row] = context_len
+        self.token_id[row] = token_id
+        ids = list(candidate_ids[:n])
+        self.rank[row] = ids.index(token_id) if token_id in ids else -1
+        self.n_candidates[row] = n
+        self.candidate_ids[row, :n] = ids
+        self.logprobs[row, :n] = logprobs[:n]
+        self.steps += 1
+        self.position = self.steps
+
+    def step(self, i: int) -> dict:
+        row = self._row(i)
+        n = int(self.n_candidates[row])
+        return {
+            "context_len": int(self.context_len[row]),
+            "token_id": int(self.token_id[row]),
+            "rank": int(self.rank[row]),
+            "candidate_ids": self.candidate_ids[row, :n].tolist(),
+            "logprobs": self.logprobs[row, :n].astype(np.float32).tolist(),
+        }
+
+    def clear(self):
+        self.start = self.steps = self.position = 0
+        self._allocate(0)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.context_len, self.token_id, self.rank, self.n_candidates, self.candidate_ids, self.logprobs)
+        return sum(a.nbytes for a in arrays)
+
+    def to_npz(self) -> bytes:
+        """All steps, oldest first, as an .npz archive (numpy.load reads it back)."""
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, position=np.int32(self.position), **self._columns())
+        return buffer.getvalue()
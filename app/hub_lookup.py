@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+from huggingface_hub.utils import build_hf_headers
+
+# Point at a mirror or local stand-in with the same variable huggingface_hub uses
+HF_ENDPOINT = os.environ.get("HF_ENDPOINT", "https://huggingface.co").rstrip("/")
+# Listings younger than this are served without touching the network
+LOOKUP_TTL_SECONDS = int(os.environ.get("HF_LOOKUP_TTL", "300"))
+MAX_CACHED_REPOS = 128
+
+
+@dataclass
+class _Listing:
+    files: List[dict]
+    etag: Optional[str]
+    fetched_at: float
+
+
+class HubLookup:
+    """
+    Async, cached listing of the GGUF files in a Hugging Face repo.
+
+    Listings are cached per (repo, revision) for LOOKUP_TTL_SECONDS. After that
+    the first page is re-requested with If-None-Match, so an unchanged repo costs
+    one 304 instead of walking every page of the tree again.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = HF_ENDPOINT,
+        ttl: float = LOOKUP_TTL_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.endpoint = endpoint
+        self.ttl = ttl
+        self._transport = transport
+        self._headers = build_hf_headers()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+        self._cache: "OrderedDict[Tuple[str, str], _Listing]" = OrderedDict()
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # A pooled client belongs to one event loop; tests may run several loops
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.endpoint,
+                headers=self._headers,
+                follow_redirects=True,
+                timeout=httpx.Timeout(15.0),
+                transport=self._transport,
+            )
+            self._client_loop = loop
+            self._locks.clear()
+        return self._client
+
+    async def list_gguf_files(self, repo_id: str, revision: str = "main") -> List[dict]:
+        key = (repo_id, revision)
+        client = self._get_client()
+        cached = self._fresh(key)
+        if cached is not None:
+            return cached.files
+
+        # One request per repo at a time; concurrent callers share its result
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = self._fresh(key)
+            if cached is not None:
+                return cached.files
+
+            stale = self._cache.get(key)
+            files, etag = await self._fetch(client, repo_id, revision, stale.etag if stale else None)
+            if files is None:
+                # 304: the stale listing is still current
+                files = stale.files
+            self._cache[key] = _Listing(files, etag, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > MAX_CACHED_REPOS:
+                self._cache.popitem(last=False)
+            return files
+
+    def _fresh(self, key) -> Optional[_Listing]:
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached.fetched_at < self.ttl:
+            self._cache.move_to_end(key)
+            return cached
+        return None
+
+    async def _fetch(self, client: httpx.AsyncClient, repo_id: str, revision: str, etag: Optional[str]):
+        """Walk the paginated tree listing. Returns (None, etag) if the repo is unchanged."""
+        url = f"/api/models/{repo_id}/tree/{quote(revision, safe='')}"
+        params = {"recursive": "true"}
+        headers = {"If-None-Match": etag} if etag else {}
+
+        response = await client.get(url, params=params, headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        new_etag = response.headers.get("ETag")
+
+        files = []
+        while True:
+            for item in response.json():
+                if item.get("type") == "file" and item["path"].endswith(".gguf"):
+                    size = item.get("size") or 0
+                    files.append({
+                        "filename": item["path"],
+                        "size_mb": round(size / (1024 * 1024), 2) if size else 0,
+                    })
+            next_url = response.links.get("next", {}).get("url")
+            if not next_url:
+                break
+            response = await client.get(next_url)
+            response.raise_for_status()
+        return files, new_etag
+
+    def invalidate(self, repo_id: Optional[str] = None):
+        if repo_id is None:
+            self._cache.clear()
+        else:
+            for key in [k for k in self._cache if k[0] == repo_id]:
+                del self._cache[key]
+
+
+_lookup: Optional[HubLookup] = None
+
+
+def get_hub_lookup() -> HubLookup:
+    """The shared lookup service."""
+    global _lookup
+    if _lookup is None:
+        _lookup = HubLookup()
+    return _lookup
@@ -1,22 +1,99 @@
 from llama_cpp import Llama
 from llama_cpp._internals import LlamaModel
 from app.utils import get_model_path
+from app.chat import TurnStateCache
+from app.gguf_catalog import get_catalog
+from app.model_memory import DEFAULT_N_CTX, plan_context
+from app.timing import phase, reset_llama_perf, read_llama_perf
+from app.singleflight import SingleFlight, call_key
+from app.vocab import VocabIndex
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+import ctypes
+import ctypes.util
+import gc
 import math
+import numpy as np
+import os
 import threading
 import uuid
 import random
 
+# Draft models (speculative decoding) kept loaded alongside the main model
+MAX_DRAFT_MODELS = 1
+
 # Workaround for llama-cpp-python bug where __del__ tries to access
-# self.sampler before checking if it exists
+# self.sampler before checking if it exists. Without a sampler there are no custom
+# samplers to detach, but the model itself must still be freed.
 _original_close = LlamaModel.close
 def _safe_close(self):
     if hasattr(self, 'sampler'):
         _original_close(self)
+    elif hasattr(self, '_exit_stack'):
+        self._exit_stack.close()
 LlamaModel.close = _safe_close
 
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"))
+    _malloc_trim = _libc.malloc_trim  # glibc only
+except (OSError, AttributeError, TypeError):
+    _malloc_trim = None
+
+
+def close_llama(llama: Llama) -> list:
+    """
+    Free a Llama's sampler, batch, context and model now, rather than whenever the last
+    reference is collected. Returns the names of native handles still set afterwards.
+    """
+    sampler = getattr(llama, "_sampler", None)
+    if sampler is not None:
+        sampler.close()
+        llama._sampler = None
+    llama.close()
+    handles = {
+        "model": getattr(getattr(llama, "_model", None), "model", None),
+        "context": getattr(getattr(llama, "_ctx", None), "ctx", None),
+        "batch": getattr(getattr(llama, "_batch", None), "batch", None),
+    }
+    return [name for name, handle in handles.items() if handle is not None]
+
+
+def select_diverse_indices(num_candidates: int, num_paths: int) -> list:
+    """
+    Pick up to num_paths distinct starting points from candidates sorted by probability.
+    Always includes the top token, then samples the rest weighted by rank.
+    """
+    if num_candidates <= num_paths:
+        return list(range(num_candidates))
+
+    selected_indices = [0]
+    remaining = list(range(1, num_candidates))
+    # Sample with probability proportional to rank (higher rank = more likely)
+    weights = [1.0 / (i + 1) for i in range(len(remaining))]
+    weights = [w / sum(weights) for w in weights]
+    selected_indices.extend(random.choices(
+        remaining,
+        weights=weights,
+        k=min(num_paths - 1, len(remaining))
+    ))
+    return selected_indices
+
 
 class LLMEngine:
     _instance = None
+    # Set by worker pool processes before the engine is first created
+    model_path_override = None
+    n_threads = None
+    # Estimated resident size of the loaded model (see app.model_memory)
+    footprint = None
+    # Result of the last unload: whether every native handle was freed
+    teardown = None
+    # Future of the loaded model's VocabIndex (see _start_vocab_index)
+    vocab = None
+    # Whether model.scores holds the logits for every evaluated token. False after a KV
+    # cache restore, which brings back the tokens but not their logits.
+    logits_valid = False
 
     def __new__(cls):
         if cls._instance is None:
@@ -26,7 +103,9 @@ class LLMEngine:
 
     def initialize(self):
         self.lock = threading.Lock()
-        model_path = get_model_path()
+        # Identical requests arriving together share one forward pass
+        self.flights = SingleFlight()
+        model_path = self.model_path_override or get_model_path()
         self.load_model(model_path)
 
     def load_model(self, model_path: str):
@@ -36,30 +115,353 @@ class LLMEngine:
         else:
             self._load_internal(model_path)
 
+    def _plan_load(self, model_path: str):
+        """
+        Check the model fits in memory before anything is unloaded. Shrinks n_ctx if
+        only a smaller context fits; raises InsufficientMemoryError if nothing does.
+        """
+        entry = get_catalog(os.path.dirname(model_path)).get(model_path)
+        if not entry or not entry["gguf"]:
+            return DEFAULT_N_CTX, None  # No metadata to estimate from; let llama.cpp try
+
+        # The current model is freed before the new one loads
+        freed = self.footprint["total_bytes"] if self.footprint and getattr(self, "model", None) else 0
+        n_ctx, footprint = plan_context(entry["size_bytes"], entry["gguf"], DEFAULT_N_CTX, freed_bytes=freed)
+        if n_ctx < min(DEFAULT_N_CTX, entry["gguf"].get("context_length") or DEFAULT_N_CTX):
+            print(f"Reduced context to {n_ctx} tokens to fit in memory")
+        return n_ctx, footprint
+
     def _load_internal(self, model_path):
-        if hasattr(self, "model") and self.model:
-            del self.model
-            import gc
+        n_ctx, footprint = self._plan_load(model_path)
 
-            gc.collect()
+        self._unload()
 
         # Store the current model path
         self.current_model_path = model_path
 
+        # Pool workers pin themselves to a core subset and size llama.cpp's threads to match
+        options = {"n_threads": self.n_threads} if self.n_threads else {}
+
         # n_gpu_layers=-1 for full Metal offload
         self.model = Llama(
             model_path=model_path,
             n_gpu_layers=-1,
-            n_ctx=2048,  # Reasonable context
+            n_ctx=n_ctx,
             verbose=False,
             logits_all=True,
+            **options,
         )
+        self.footprint = footprint
+        self._start_vocab_index()
         print(f"Model loaded: {model_path}")
 
+    def _start_vocab_index(self):
+        """
+        Load or build the model's VocabIndex in a background thread, so the first filtered
+        request doesn't spend seconds building it while holding the engine lock.
+        """
+        model, model_path = self.model, self.current_model_path
+        future = Future()
+
+        def build():
+            try:
+                future.set_result(VocabIndex.for_model(
+                    model_path, lambda: [model.detokenize([t], special=True) for t in range(model.n_vocab())]
+                ))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.vocab = future
+        self._vocab_thread = threading.Thread(target=build, name="vocab-index", daemon=True)
+        self._vocab_thread.start()
+
+    def _unload(self):
+        """
+        Free the current model and everything tied to it before loading another. The
+        native resources are closed explicitly and checked, then freed heap is returned
+        to the OS, so repeated switches don't grow the process.
+        """
+        llamas = [getattr(self, "model", None), *getattr(self, "draft_models", {}).values()]
+        self.model = None
+        # Drafts were checked against the old model's vocabulary
+        self.draft_models = OrderedDict()
+        self.turn_cache = TurnStateCache()
+        self.logits_valid = False
+        if getattr(self, "_vocab_thread", None) is not None:
+            self._vocab_thread.join()  # It reads the old model's vocabulary
+        self.vocab = None
+
+        leaked = []
+        for llama in llamas:
+            if llama is not None:
+                leaked += close_llama(llama)
+        del llamas
+        gc.collect()
+        if _malloc_trim is not None:
+            _malloc_trim(0)
+        self.teardown = {"verified": not leaked, "leaked_handles": leaked}
+        if leaked:
+            print(f"Model teardown left native handles alive: {', '.join(leaked)}")
+
     def get_current_model(self) -> str:
         """Return the path to the currently loaded model."""
         return getattr(self, "current_model_path", None)
 
+    def prefix_tokens(self) -> list:
+        """Tokens the model expects before any text (BOS), matching create_completion."""
+        if self.model._model.add_bos_token():
+            return [self.model.token_bos()]
+        return []
+
+    def tokenize(self, data: bytes) -> list:
+        """Tokenize UTF-8 bytes without BOS, parsing special tokens like create_completion does."""
+        return self.model.tokenize(data, add_bos=False, special=True)
+
+    def token_pieces(self, token_ids) -> list:
+        """Return the raw bytes of each token, used to map tokens back to byte offsets."""
+        model = self.model
+        return [model.detokenize([t], special=True) for t in token_ids]
+
+    @contextmanager
+    def _locked(self, timings=None):
+        """Hold the engine lock, recording time spent waiting for it."""
+        with phase(timings, "queue_wait"):
+            self.lock.acquire()
+        try:
+            yield
+        finally:
+            self.lock.release()
+
+    def _complete(self, prompt, timings=None, **kwargs):
+        """Run create_completion, collecting prefill/cache stats when timing is on."""
+        if timings is None:
+            return self.model.create_completion(prompt, **kwargs)
+
+        with phase(timings, "tokenize"):
+            prompt_tokens = self.model.tokenize(prompt.encode("utf-8"), special=True)
+        # Llama reuses the longest matching prefix of its last evaluated tokens
+        cached = len(os.path.commonprefix([self.model._input_ids.tolist(), prompt_tokens]))
+        cached = min(cached, len(prompt_tokens) - 1) if prompt_tokens else 0
+        timings.cached_tokens = cached
+        timings.prefill_tokens += len(prompt_tokens) - cached
+
+        reset_llama_perf(self.model)
+        with phase(timings, "inference"):
+            output = self.model.create_completion(prompt, **kwargs)
+        timings.add_perf(read_llama_perf(self.model))
+        return output
+
+    def _eval_logits(self, prompt_tokens, timings=None):
+        """
+        Evaluate prompt_tokens and return the logits for the next token.
+        Only the suffix after the longest prefix already in the KV cache is decoded.
+        Must be called with the lock held.
+        """
+        return self._eval_rows(prompt_tokens, 1, timings)[-1]
+
+    def _eval_rows(self, prompt_tokens, n_rows: int, timings=None):
+        """
+        Like _eval_logits, but return the logits after each of the last n_rows tokens,
+        all from a single batched decode. Must be called with the lock held.
+        """
+        model = self.model
+        if not prompt_tokens:
+            raise ValueError("Empty prompt")
+        if len(prompt_tokens) >= model.n_ctx():
+            raise ValueError(
+                f"Requested tokens ({len(prompt_tokens)}) exceed context window of {model.n_ctx()}"
+            )
+
+        cached = len(os.path.commonprefix([model._input_ids.tolist(), list(prompt_tokens)]))
+        fully_cached = cached == len(prompt_tokens) == model.n_tokens and self.logits_valid
+        if not fully_cached or n_rows > 1:
+            # Always decode at least the requested rows so their logits are fresh
+            cached = min(cached, len(prompt_tokens) - n_rows)
+            model.n_tokens = cached
+            if timings is not None:
+                reset_llama_perf(model)
+            with phase(timings, "inference"):
+                model.eval(prompt_tokens[cached:])
+            self.logits_valid = True
+            if timings is not None:
+                timings.add_perf(read_llama_perf(model))
+
+        if timings is not None:
+            timings.cached_tokens = cached
+            timings.prefill_tokens += len(prompt_tokens) - cached
+        return model.scores[len(prompt_tokens) - n_rows:len(prompt_tokens)]
+
+    def _top_logprobs(self, logits, top_k: int, mask=None) -> list:
+        """Top tokens by logprob; with a mask, only allowed tokens (logprobs stay unconditional)."""
+        top_k = max(1, min(top_k, len(logits)))
+        shifted = logits - logits.max()
+        logprobs = shifted - np.log(np.exp(shifted).sum())
+        ranked = logprobs
+        if mask is not None:
+            top_k = min(top_k, int(np.count_nonzero(mask)))
+            if top_k == 0:
+                return []
+            ranked = np.where(mask, logprobs, -np.inf)
+        top_ids = np.argpartition(-ranked, top_k - 1)[:top_k]
+        top_ids = top_ids[np.argsort(-logprobs[top_ids])]
+        model = self.model
+        return [
+            (
+                model.detokenize([int(t)], special=True).decode("utf-8", errors="ignore"),
+                float(logprobs[t]),
+                int(t),
+            )
+            for t in top_ids
+        ]
+
+    def get_top_logprobs(self, prompt_tokens, top_k: int = 40, timings=None, token_filter=None) -> list:
+        """
+        Return the top_k next tokens for a token-ID context as (token_text, logprob, token_id),
+        most likely first. Works on the raw logits rather than through create_completion.
+        token_filter (prefix/partial, classes, regex; see VocabIndex.mask) limits which tokens
+        are ranked.
+        """
+        key = call_key("get_top_logprobs", self.current_model_path, list(prompt_tokens), top_k, token_filter)
+
+        def run():
+            # Outside the lock, since the index may still be building
+            vocab = self.vocab
+            mask = self._token_mask(vocab, token_filter)
+            with self._locked(timings):
+                if self.vocab is not vocab:
+                    mask = self._token_mask(self.vocab, token_filter)  # The model was switched meanwhile
+                logits = self._eval_logits(prompt_tokens, timings)
+                with phase(timings, "sampler"):
+                    return self._top_logprobs(logits, top_k, mask)
+
+        return list(self.flights.do(key, run, on_wait=lambda: phase(timings, "queue_wait")))
+
+    def coalesce_stats(self) -> dict:
+        """Counts of inference calls run versus answered by an identical in-flight call."""
+        return self.flights.stats()
+
+    def _token_mask(self, vocab: Future, token_filter):
+        """Allowed-token mask for a filter, or None. Waits for the index if it is still building."""
+        if not token_filter:
+            return None
+        if vocab is None:
+            raise RuntimeError("No model loaded")  # Unloaded, or the last load failed
+        return vocab.result().mask(token_filter)
+
+    def verify_top_logprobs(self, prompt_tokens, draft, top_k: int = 40, timings=None) -> list:
+        """
+        Speculative verification: evaluate prompt_tokens + draft in one batch and return
+        top logprobs (as get_top_logprobs) after the prompt and after each drafted token.
+        """
+        with self._locked(timings):
+            rows = self._eval_rows(list(prompt_tokens) + list(draft), len(draft) + 1, timings)
+            with phase(timings, "sampler"):
+                return [self._top_logprobs(logits, top_k) for logits in rows]
+
+    def chat_template_info(self) -> dict:
+        """The GGUF chat template and the special token texts it refers to."""
+        model = self.model
+        info = {
+            "template": model.metadata.get("tokenizer.chat_template"),
+            "bos_token": model.detokenize([model.token_bos()], special=True).decode("utf-8", errors="ignore"),
+            "eos_token": model.detokenize([model.token_eos()], special=True).decode("utf-8", errors="ignore"),
+            "stop": [],
+        }
+        eot = model._model.token_eot()
+        if eot >= 0 and eot != model.token_eos():
+            info["stop"].append(model.detokenize([eot], special=True).decode("utf-8", errors="ignore"))
+        return info
+
+    def chat_top_logprobs(self, prompt_tokens, boundaries, top_k: int = 40, timings=None) -> dict:
+        """
+        get_top_logprobs for a chat prompt. `boundaries` are token counts where completed
+        turns end: the KV cache is restored from the deepest snapshotted one when that saves
+        prefill, and a snapshot is taken at the deepest one otherwise.
+        """
+        with self._locked(timings):
+            model = self.model
+            prompt_tokens = list(prompt_tokens)
+            boundaries = [b for b in boundaries if 0 < b < len(prompt_tokens)]
+            live = len(os.path.commonprefix([model._input_ids.tolist(), prompt_tokens]))
+
+            restored = 0
+            snapshot = self.turn_cache.lookup(prompt_tokens, boundaries)
+            if snapshot is not None and snapshot > live:
+                with phase(timings, "inference"):
+                    self.turn_cache.restore(model, prompt_tokens, snapshot)
+                self.logits_valid = False
+                restored = live = snapshot
+
+            deepest = max(boundaries, default=0)
+            if deepest > live and snapshot != deepest:
+                # Stop at the turn boundary to snapshot it, then prefill the rest
+                self._eval_rows(prompt_tokens[:deepest], 1, timings)
+                self.turn_cache.save(model, deepest)
+
+            logits = self._eval_logits(prompt_tokens, timings)
+            with phase(timings, "sampler"):
+                return {"top_logprobs": self._top_logprobs(logits, top_k), "restored_tokens": restored}
+
+    def stop_tokens(self) -> list:
+        """Token IDs that end generation."""
+        return [self.model.token_eos()]
+
+    def draft_tokens(self, draft_path: str, prompt_tokens, n_draft: int) -> list:
+        """Greedily draft n_draft tokens after prompt_tokens with a small draft model."""
+        with self.lock:
+            draft = self._get_draft_model(draft_path)
+            tokens = list(prompt_tokens)
+            if not tokens or len(tokens) + n_draft >= draft.n_ctx():
+                return []
+            cached = len(os.path.commonprefix([draft._input_ids.tolist(), tokens]))
+            draft.n_tokens = min(cached, len(tokens) - 1)
+            draft.eval(tokens[draft.n_tokens:])
+
+            drafted = []
+            n_vocab = draft.n_vocab()
+            for i in range(n_draft):
+                # Without logits_all only the last position's logits are kept, in the context
+                logits = np.ctypeslib.as_array(draft._ctx.get_logits(), shape=(n_vocab,))
+                token = int(np.argmax(logits))
+                drafted.append(token)
+                if i + 1 < n_draft:
+                    draft.eval([token])
+            return drafted
+
+    def load_draft_model(self, draft_path: str):
+        """Load a draft model ahead of use, so vocabulary or memory problems surface early."""
+        with self.lock:
+            self._get_draft_model(draft_path)
+
+    def _get_draft_model(self, draft_path: str):
+        """Load (or reuse) a draft model. It must share the main model's vocabulary."""
+        if draft_path in self.draft_models:
+            self.draft_models.move_to_end(draft_path)
+            return self.draft_models[draft_path]
+
+        entry = get_catalog(os.path.dirname(draft_path)).get(draft_path)
+        n_ctx = self.model.n_ctx()
+        if entry and entry["gguf"]:
+            # Refuses the load (InsufficientMemoryError) rather than pushing the main model out
+            n_ctx, _ = plan_context(entry["size_bytes"], entry["gguf"], n_ctx)
+
+        draft = Llama(
+            model_path=draft_path,
+            n_gpu_layers=-1,
+            n_ctx=n_ctx,
+            verbose=False,
+            logits_all=False,
+            **({"n_threads": self.n_threads} if self.n_threads else {}),
+        )
+        if draft.n_vocab() != self.model.n_vocab() or draft.token_eos() != self.model.token_eos():
+            close_llama(draft)
+            raise ValueError("Draft model vocabulary does not match the loaded model")
+
+        self.draft_models[draft_path] = draft
+        while len(self.draft_models) > MAX_DRAFT_MODELS:
+            close_llama(self.draft_models.popitem(last=False)[1])
+        return draft
+
     def get_next_tokens(
         self,
         prompt: str,
@@ -67,11 +469,37 @@ class LLMEngine:
         top_k: int = 40,
         top_p: float = 0.95,
         repeat_penalty: float = 1.0,
+        timings=None,
+        prompt_tokens=None,
+        token_filter=None,
     ):
+        if token_filter and prompt_tokens is None:
+            # Filtering works on the logits, so evaluate the text as token IDs
+            with phase(timings, "tokenize"):
+                prompt_tokens = self.prefix_tokens() + (self.tokenize(prompt.encode("utf-8")) if prompt else [])
+        if prompt_tokens is not None:
+            # Token IDs are known (session context): skip create_completion entirely
+            top_logprobs = self.get_top_logprobs(prompt_tokens, top_k, timings, token_filter)
+            with phase(timings, "sampler"):
+                return self.postprocess_candidates(
+                    top_logprobs, prompt, temp, top_p, repeat_penalty
+                )
+
+        key = call_key("get_next_tokens", self.current_model_path, prompt, temp, top_k, top_p, repeat_penalty)
+        candidates = self.flights.do(
+            key,
+            lambda: self._complete_next_tokens(prompt, temp, top_k, top_p, repeat_penalty, timings),
+            on_wait=lambda: phase(timings, "queue_wait"),
+        )
+        return [dict(c) for c in candidates]
+
+    def _complete_next_tokens(self, prompt, temp, top_k, top_p, repeat_penalty, timings):
+        """Candidates for a text prompt, through create_completion's logprobs."""
         # Try with requested logprobs first
-        with self.lock:
-            output = self.model.create_completion(
+        with self._locked(timings):
+            output = self._complete(
                 prompt,
+                timings,
                 max_tokens=1,
                 temperature=temp,
                 top_k=top_k,
@@ -85,9 +513,10 @@ class LLMEngine:
         # If top_logprobs is empty, retry with smaller logprobs value (llama-cpp-python bug workaround)
         if not top_logprobs_list:
             print(f"DEBUG: Empty top_logprobs, retrying with logprobs=10...")
-            with self.lock:
-                output = self.model.create_completion(
+            with self._locked(timings):
+                output = self._complete(
                     prompt,
+                    timings,
                     max_tokens=1,
                     temperature=temp,
                     top_k=top_k,
@@ -100,9 +529,10 @@ class LLMEngine:
             # If still empty, generate without logprobs and create a fake candidate
             if not top_logprobs_list:
                 print(f"DEBUG: Still empty, generating without logprobs...")
-                with self.lock:
-                    output = self.model.create_completion(
+                with self._locked(timings):
+                    output = self._complete(
                         prompt,
+                        timings,
                         max_tokens=1,
                         temperature=temp,
                         top_k=top_k,
@@ -116,15 +546,34 @@ class LLMEngine:
                              "cumulative_prob": 100.0}]
                 raise ValueError("Failed to generate token")
 
-        top_logprobs = top_logprobs_list[0]
+        with phase(timings, "sampler"):
+            return self.postprocess_candidates(
+                [(token, logprob, None) for token, logprob in top_logprobs_list[0].items()],
+                prompt,
+                temp,
+                top_p,
+                repeat_penalty,
+            )
 
+    def postprocess_candidates(
+        self,
+        top_logprobs: list,
+        prompt: str,
+        temp: float,
+        top_p: float,
+        repeat_penalty: float,
+    ) -> list:
+        """
+        Apply repetition penalty, temperature and top-p to raw top logprobs,
+        given as (token_text, logprob, token_id) tuples.
+        """
         candidates = []
 
         # Helper to check if token is in context (simple string match for demo)
         # Real implementation would use token IDs.
         # This is an approximation.
 
-        for token_text, logprob in top_logprobs.items():
+        for token_text, logprob, token_id in top_logprobs:
             # Apply Repetition Penalty (Approximate)
             # If token appears in prompt, penalize logprob
             # We treat logprob as logit for this approximation
@@ -139,7 +588,9 @@ class LLMEngine:
                 logprob = logprob * repeat_penalty
 
             prob = math.exp(logprob)
-            candidates.append({"token": token_text, "prob": prob, "logprob": logprob})
+            candidates.append(
+                {"token": token_text, "prob": prob, "logprob": logprob, "token_id": token_id}
+            )
 
         # Apply Temperature (Reuse existing logic)
         if temp < 1e-5:
@@ -189,6 +640,7 @@ class LLMEngine:
         top_k: int = 40,
         top_p: float = 0.95,
         repeat_penalty: float = 1.0,
+        timings=None,
     ) -> list:
         """
         Generate multiple divergent paths from the given context.
@@ -202,29 +654,13 @@ class LLMEngine:
             top_k=top_k,
             top_p=top_p,
             repeat_penalty=repeat_penalty,
+            timings=timings,
         )
 
         # Filter to only non-excluded candidates
         valid_candidates = [c for c in candidates if not c.get("excluded", False)]
 
-        # Select diverse tokens from the top candidates
-        # We want num_paths distinct starting points
-        selected_indices = []
-        if len(valid_candidates) <= num_paths:
-            selected_indices = list(range(len(valid_candidates)))
-        else:
-            # Use a mix of top tokens and some sampling for diversity
-            # Always include the top token, then sample from the rest
-            selected_indices = [0]
-            remaining = list(range(1, len(valid_candidates)))
-            # Sample with probability proportional to rank (higher rank = more likely)
-            weights = [1.0 / (i + 1) for i in range(len(remaining))]
-            weights = [w / sum(weights) for w in weights]
-            selected_indices.extend(random.choices(
-                remaining,
-                weights=weights,
-                k=min(num_paths - 1, len(remaining))
-            ))
+        selected_indices = select_diverse_indices(len(valid_candidates), num_paths)
 
         paths = []
         for idx in selected_indices[:num_paths]:
@@ -245,6 +681,7 @@ class LLMEngine:
                     top_k=top_k,
                     top_p=top_p,
                     repeat_penalty=repeat_penalty,
+                    timings=timings,
                 )
                 valid_next = [c for c in next_candidates if not c.get("excluded", False)]
                 if valid_next:
@@ -0,0 +1,606 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from app.chat import TurnStateCache
+from app.llm import LLMEngine
+from app.singleflight import SingleFlight
+
+# Client timings, mirroring app/static/app.js
+TOP_TOKENS_PER_SECOND = 5  # Auto-infer tick rate
+SELECTION_DELAY = 0.15  # Auto-infer flashes the chosen token before selecting it
+AUTO_INFER_PLAN_TOKENS = 8  # Tokens per /generate plan request
+KEYSTROKE_DEBOUNCE = 0.5  # Typing pause before candidates are fetched
+BEAM_SLIDER_DEBOUNCE = 0.3
+
+USER_KINDS = ("auto", "typing", "beam", "chat", "models")
+DEFAULT_MIX = {"auto": 2, "typing": 2, "beam": 1, "chat": 1, "models": 1}
+# A stage is past saturation when adding users grows throughput by less than this fraction
+SATURATION_GAIN = 0.1
+
+WORDS = "the a of to and in that it was for on are with as his they be at one have this from".split()
+
+
+class StubModel:
+    """
+    Byte-level stand-in for llama_cpp.Llama, covering what LLMEngine's token-ID paths use.
+    eval() sleeps like a forward pass: decode_ms per call plus prefill_ms per extra token.
+    """
+
+    BOS = 256
+    EOS = 257
+
+    def __init__(self, decode_ms: float, prefill_ms: float, n_ctx: int = 4096):
+        self.decode_ms = decode_ms
+        self.prefill_ms = prefill_ms
+        self._n_ctx = n_ctx
+        self._input_ids = np.zeros(0, dtype=np.intc)
+        self.n_tokens = 0
+        self.scores = np.zeros((n_ctx, self.n_vocab()), dtype=np.float32)
+        self.metadata = {}
+        self._model = SimpleNamespace(add_bos_token=lambda: True, token_eot=lambda: -1)
+        # Next-token logits depend only on the previous token
+        self._table = np.random.default_rng(0).standard_normal((self.n_vocab(), self.n_vocab())).astype(np.float32) * 3
+
+    def n_ctx(self) -> int:
+        return self._n_ctx
+
+    def n_vocab(self) -> int:
+        return 258
+
+    def token_bos(self) -> int:
+        return self.BOS
+
+    def token_eos(self) -> int:
+        return self.EOS
+
+    def tokenize(self, data: bytes, add_bos: bool = True, special: bool = False) -> list:
+        return ([self.BOS] if add_bos else []) + list(data)
+
+    def detokenize(self, tokens, special: bool = False) -> bytes:
+        return bytes(t for t in tokens if t < 256)
+
+    def eval(self, tokens):
+        tokens = list(tokens)
+        time.sleep((self.decode_ms + self.prefill_ms * max(0, len(tokens) - 1)) / 1000)
+        start = self.n_tokens
+        self.scores[start:start + len(tokens)] = self._table[tokens]
+        self._input_ids = np.concatenate([self._input_ids[:start], np.array(tokens, dtype=np.intc)])
+        self.n_tokens = start + len(tokens)
+
+
+class StubEngine(LLMEngine):
+    """
+    LLMEngine over a StubModel: the real lock, request coalescing and candidate
+    post-processing, with forward passes replaced by sleeps. Install it as the engine
+    singleton (LLMEngine._instance) to load-test the server without a GGUF.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __init__(self, decode_ms: float = 20.0, prefill_ms: float = 0.5):
+        # LLMEngine() returns the installed instance and re-runs __init__ on it
+        if getattr(self, "_initialized", False):
+            return
+        self._initialized = True
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.current_model_path = "stub.gguf"
+        self.model = StubModel(decode_ms, prefill_ms)
+        self.draft_models = OrderedDict()
+        self.turn_cache = TurnStateCache()
+        self.vocab = None
+
+    def load_model(self, model_path: str):
+        self.current_model_path = model_path
+
+    def _complete_next_tokens(self, prompt, temp, top_k, top_p, repeat_penalty, timings):
+        # No create_completion: text prompts take the token-ID path
+        tokens = self.prefix_tokens() + self.tokenize(prompt.encode("utf-8"))
+        top_logprobs = self.get_top_logprobs(tokens, top_k, timings)
+        return self.postprocess_candidates(top_logprobs, prompt, temp, top_p, repeat_penalty)
+
+    def chat_top_logprobs(self, prompt_tokens, boundaries, top_k: int = 40, timings=None) -> dict:
+        # No KV state to snapshot, so turns are always prefilled
+        return {"top_logprobs": self.get_top_logprobs(prompt_tokens, top_k, timings), "restored_tokens": 0}
+
+
+class Recorder:
+    """Latency and outcome of every request, grouped by endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.aborted: Dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.latencies[endpoint].append(seconds)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self, duration: float) -> dict:
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.aborted)):
+            latencies = np.array(self.latencies[endpoint]) * 1000
+            requests = len(latencies)
+            endpoints[endpoint] = {
+                "requests": requests,
+                "errors": self.errors[endpoint],
+                "aborted": self.aborted[endpoint],
+                "error_rate": self.errors[endpoint] / requests if requests else 0.0,
+                "throughput": requests / duration,
+                **{
+                    f"p{q}_ms": round(float(np.percentile(latencies, q)), 1) if requests else None
+                    for q in (50, 95, 99)
+                },
+                "max_ms": round(float(latencies.max()), 1) if requests else None,
+            }
+        requests = sum(e["requests"] for e in endpoints.values())
+        errors = sum(e["errors"] for e in endpoints.values())
+        return {
+            "duration": duration,
+            "requests": requests,
+            "throughput": requests / duration,
+            "error_rate": errors / requests if requests else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class _QueueStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: asyncio.Queue, disconnected: asyncio.Event, task: asyncio.Task):
+        self.chunks = chunks
+        self.disconnected = disconnected
+        self.task = task
+
+    async def __aiter__(self):
+        while True:
+            chunk = await self.chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def aclose(self):
+        self.disconnected.set()
+        try:
+            await asyncio.wait_for(self.task, timeout=1.0)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+
+
+class StreamingASGITransport(httpx.AsyncBaseTransport):
+    """
+    In-process transport that returns once the response headers are sent and streams the
+    body. httpx's ASGITransport waits for the whole body, which never ends for an event stream.
+    Closing the response disconnects the client, as a closed tab would.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "headers": [(k.lower(), v) for k, v in request.headers.raw],
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "server": (request.url.host, request.url.port),
+            "client": ("127.0.0.1", 0),
+            "root_path": "",
+        }
+        chunks: asyncio.Queue = asyncio.Queue()
+        started = asyncio.get_running_loop().create_future()
+        disconnected = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                started.set_result(message)
+            elif message["type"] == "http.response.body":
+                await chunks.put(message.get("body", b""))
+
+        async def run():
+            try:
+                await self.app(scope, receive, send)
+            except Exception as e:
+                if not started.done():
+                    started.set_exception(e)
+            finally:
+                await chunks.put(None)
+
+        task = asyncio.ensure_future(run())
+        try:
+            start = await started
+        except BaseException:
+            task.cancel()
+            raise
+        return httpx.Response(
+            start["status"],
+            headers=start.get("headers", []),
+            stream=_QueueStream(chunks, disconnected, task),
+            request=request,
+        )
+
+
+class SimulatedUser:
+    """One browser tab: an HTTP client, a session and the request patterns of app.js."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, index: int, seed: int):
+        self.client = client
+        self.recorder = recorder
+        self.session_id = f"loadtest-{index}"
+        self.rng = random.Random(seed)
+        self.version: Optional[int] = None
+        self.server_text = ""
+        self.observations: List[tuple] = []  # (text, candidates) shown from the candidate cache
+        self.in_flight: Optional[asyncio.Task] = None
+        self.deadline = 0.0
+
+    async def request(self, endpoint: str, method: str, url: str, body: Optional[dict] = None):
+        """Send one request, recording it under endpoint (the route, not the URL). None on failure."""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, json=body)
+        except asyncio.CancelledError:
+            self.recorder.aborted[endpoint] += 1
+            raise
+        except httpx.HTTPError:
+            self.recorder.record(endpoint, time.perf_counter() - started, ok=False)
+            return None
+        # 409 is the expected stale-session answer; the client resyncs
+        ok = response.status_code < 400 or response.status_code == 409
+        self.recorder.record(endpoint, time.perf_counter() - started, ok)
+        return response if ok else None
+
+    async def session_request(self, path: str, text: str, params: dict):
+        """postSessionRequest: send the context as a delta, resending it whole on 409."""
+        endpoint = f"POST /sessions/{{id}}{path}"
+        url = f"/sessions/{self.session_id}{path}"
+        for _ in range(2):
+            ops = self.context_ops(text)
+            reported = list(self.observations)  # context_ops keeps just the ones it reports
+            response = await self.request(endpoint, "POST", url, {"base_version": self.version, "ops": ops, **params})
+            if response is None:
+                return None
+            if response.status_code != 409:
+                data = response.json()
+                self.version = data.get("session_version", self.version)
+                self.server_text = text
+                self.observations = [o for o in self.observations if o not in reported]
+                return data
+            self.version = None
+        return None
+
+    def context_ops(self, text: str) -> list:
+        """buildContextOps: a delta from the server's text, reporting cached distributions shown on the way."""
+        if self.version is None or not text.startswith(self.server_text):
+            self.observations = []
+            return [{"op": "set_text", "text": text}]
+        self.observations = sorted(
+            (o for o in self.observations if o[0].startswith(self.server_text) and text.startswith(o[0])),
+            key=lambda o: len(o[0]),
+        )
+        ops = []
+        position = len(self.server_text)
+        for observed, candidates in self.observations:
+            if len(observed) > position:
+                ops.append({"op": "append_text", "text": observed[position:]})
+                position = len(observed)
+            ops.append({
+                "op": "observe",
+                "token_ids": [c["token_id"] for c in candidates],
+                "logprobs": [c["logprob"] for c in candidates],
+            })
+        if len(text) > position:
+            ops.append({"op": "append_text", "text": text[position:]})
+        return ops
+
+    def supersede(self, coro):
+        """Start a request, aborting the previous one like the UI's AbortControllers."""
+        if self.in_flight and not self.in_flight.done():
+            self.in_flight.cancel()
+        self.in_flight = asyncio.ensure_future(coro)
+        return self.in_flight
+
+    def sampling(self) -> dict:
+        return {"temp": 0.8, "top_k": 40, "top_p": 0.95, "repeat_penalty": 1.0}
+
+    def pick(self, candidates: list) -> Optional[str]:
+        eligible = [c for c in candidates if not c.get("excluded")]
+        if not eligible:
+            return None
+        return self.rng.choices([c["token"] for c in eligible], weights=[c["prob"] for c in eligible])[0]
+
+    def opening(self) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(3, 12))).capitalize()
+
+    def active(self) -> bool:
+        return time.monotonic() < self.deadline
+
+    async def wait(self, seconds: float) -> bool:
+        """Sleep, but not past the deadline. False once the run is over."""
+        await asyncio.sleep(max(0.0, min(seconds, self.deadline - time.monotonic())))
+        return self.active()
+
+    async def auto_infer(self):
+        """
+        Auto-infer: pick a candidate every tick and keep a plan ahead. Planned steps' distributions
+        are in the client's candidate cache, so the next distribution is only fetched off the plan.
+        """
+        text = self.opening()
+        plan: List[tuple] = []  # (text, step) for each planned token
+        plan_task: Optional[asyncio.Task] = None
+        while self.active():
+            tick = time.monotonic()
+            while plan and plan[0][0] != text:
+                plan.pop(0)
+            if plan:
+                step = plan.pop(0)[1]
+                self.observations.append((text, step["candidates"]))
+                token = step["token"]
+            else:
+                data = await self.session_request("/next-tokens", text, self.sampling())
+                token = self.pick(data["candidates"]) if data else None
+            if len(plan) < 2 and (plan_task is None or plan_task.done()):
+                plan_task = asyncio.ensure_future(self.fetch_plan(text, plan))
+            if not await self.wait(SELECTION_DELAY):
+                break
+            if token is not None:
+                text += token
+            # setInterval skips ticks while a fetch is still loading
+            await self.wait(1 / TOP_TOKENS_PER_SECOND - (time.monotonic() - tick))
+        if plan_task:
+            plan_task.cancel()
+
+    async def fetch_plan(self, text: str, plan: List[str]):
+        data = await self.session_request("/generate", text, {**self.sampling(), "max_tokens": AUTO_INFER_PLAN_TOKENS})
+        if data:
+            plan[:] = []
+            for step in data["tokens"]:
+                plan.append((text, step))
+                text += step["token"]
+
+    async def typing(self):
+        """Typing: bursts of keystrokes; candidates are fetched once a pause outlasts the debounce."""
+        text = self.opening()
+        while self.active():
+            for _ in range(self.rng.randint(2, 12)):
+                text += self.rng.choice("etaoin shrdlu")
+                if not await self.wait(self.rng.uniform(0.05, 0.25)):
+                    return
+            if not await self.wait(KEYSTROKE_DEBOUNCE):
+                return
+            self.supersede(self.session_request("/next-tokens", text, self.sampling()))
+            await self.wait(self.rng.uniform(0.0, 1.5))  # Reading the candidates
+
+    async def beam(self):
+        """Beam view: slider drags fire input events; each debounced search aborts the last."""
+        text = self.opening()
+        while self.active():
+            for _ in range(self.rng.randint(3, 15)):
+                params = {**self.sampling(), "num_paths": self.rng.randint(1, 8), "depth": self.rng.randint(1, 6)}
+                # Most events come faster than the debounce; the occasional pause lets one through
+                gap = self.rng.uniform(0.02, 0.1) if self.rng.random() < 0.8 else BEAM_SLIDER_DEBOUNCE + 0.05
+                if not await self.wait(gap):
+                    return
+                if gap > BEAM_SLIDER_DEBOUNCE:
+                    self.supersede(self.session_request("/beam/search", text, params))
+            if not await self.wait(BEAM_SLIDER_DEBOUNCE):
+                return
+            self.supersede(self.session_request("/beam/search", text, params))
+            await self.wait(self.rng.uniform(1.0, 3.0))
+
+    async def chat(self):
+        """Chat: send a message, then build the reply a token at a time, then think."""
+        messages = [{"role": "system", "content": "You are a helpful assistant."}]
+        while self.active():
+            messages.append({"role": "user", "content": self.opening() + "?"})
+            reply = ""
+            for _ in range(self.rng.randint(3, 10)):
+                response = await self.request("POST /chat", "POST", "/chat", {
+                    "messages": messages,
+                    "assistant_prefix": reply,
+                    "session_id": self.session_id,
+                    **self.sampling(),
+                })
+                token = self.pick(response.json()["candidates"]) if response is not None else None
+                if token is None:
+                    break
+                reply += token
+                if not await self.wait(self.rng.uniform(0.2, 0.8)):
+                    return
+            messages.append({"role": "assistant", "content": reply})
+            await self.wait(self.rng.uniform(1.0, 4.0))
+
+    async def models(self):
+        """Model selector: opened now and then, which lists the local models."""
+        while self.active():
+            await self.request("GET /models", "GET", "/models")
+            await self.request("GET /models/current", "GET", "/models/current")
+            await self.wait(self.rng.uniform(2.0, 6.0))
+
+    async def download_events(self):
+        """
+        The download event stream every page opens on load and keeps for its lifetime.
+        Recorded once, with the time to the initial snapshot as its latency.
+        """
+        endpoint = "GET /downloads/events"
+        started = time.perf_counter()
+        try:
+            async with self.client.stream("GET", "/downloads/events") as response:
+                if response.status_code >= 400:
+                    self.recorder.record(endpoint, time.perf_counter() - started, ok=False)
+                    return
+                async for line in response.aiter_lines():
+                    if line == "event: snapshot":
+                        self.recorder.record(endpoint, time.perf_counter() - started, ok=True)
+        except httpx.HTTPError:
+            self.recorder.record(endpoint, time.perf_counter() - started, ok=False)
+
+    async def run(self, kind: str, deadline: float):
+        self.deadline = deadline
+        events = asyncio.ensure_future(self.download_events())
+        try:
+            # Stagger starts so users don't tick in lockstep
+            if not await self.wait(self.rng.uniform(0, 1 / TOP_TOKENS_PER_SECOND)):
+                return
+            try:
+                await getattr(self, {"auto": "auto_infer"}.get(kind, kind))()
+            finally:
+                # Superseding requests are fire-and-forget in the UI; let the last one finish
+                if self.in_flight and not self.in_flight.done():
+                    await asyncio.gather(self.in_flight, return_exceptions=True)
+        finally:
+            events.cancel()  # The tab closes
+            await asyncio.gather(events, return_exceptions=True)
+
+
+def assign_users(num_users: int, mix: Dict[str, int]) -> List[str]:
+    """Spread num_users over the kinds in proportion to mix (largest remainder)."""
+    total = sum(mix.values())
+    shares = {kind: num_users * weight / total for kind, weight in mix.items()}
+    counts = {kind: int(share) for kind, share in shares.items()}
+    for kind in sorted(shares, key=lambda k: shares[k] - counts[k], reverse=True)[:num_users - sum(counts.values())]:
+        counts[kind] += 1
+    return [kind for kind in mix for _ in range(counts[kind])]
+
+
+async def run_stage(client: httpx.AsyncClient, num_users: int, duration: float, mix: Dict[str, int], seed: int = 0) -> dict:
+    """Run num_users simulated users for duration seconds and summarize their requests."""
+    recorder = Recorder()
+    kinds = assign_users(num_users, mix)
+    started = time.monotonic()
+    deadline = started + duration
+    users = [SimulatedUser(client, recorder, i, seed + i) for i in range(num_users)]
+    tasks = [asyncio.ensure_future(user.run(kind, deadline)) for user, kind in zip(users, kinds)]
+    # Requests still running at the deadline are let finish, so slow ones are counted
+    await asyncio.gather(*tasks, return_exceptions=True)
+    summary = recorder.summary(time.monotonic() - started)
+    summary["users"] = num_users
+    summary["mix"] = {kind: kinds.count(kind) for kind in mix}
+    return summary
+
+
+def find_saturation(stages: List[dict]) -> Optional[int]:
+    """Users at the first stage where more users stopped buying proportionally more throughput."""
+    for prev, stage in zip(stages, stages[1:]):
+        expected = prev["throughput"] * (1 + SATURATION_GAIN * (stage["users"] / prev["users"] - 1))
+        if stage["throughput"] < expected or stage["error_rate"] > 0.01:
+            return stage["users"]
+    return None
+
+
+async def run_load(
+    users: List[int],
+    duration: float,
+    mix: Optional[Dict[str, int]] = None,
+    url: Optional[str] = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Run one stage per entry in users against url, or in-process against app.main.app
+    (whatever engine is installed). Returns the stage summaries and saturation point.
+    """
+    mix = mix or DEFAULT_MIX
+    if url:
+        client = httpx.AsyncClient(base_url=url, timeout=None)
+    else:
+        from app.main import app
+
+        client = httpx.AsyncClient(transport=StreamingASGITransport(app), base_url="http://loadtest", timeout=None)
+    async with client:
+        stages = [await run_stage(client, n, duration, mix, seed) for n in users]
+    return {"stages": stages, "saturation_users": find_saturation(stages)}
+
+
+def format_report(report: dict) -> str:
+    lines = []
+    for stage in report["stages"]:
+        lines.append(
+            f"{stage['users']} users ({', '.join(f'{k}={v}' for k, v in stage['mix'].items() if v)}): "
+            f"{stage['throughput']:.1f} req/s, {stage['error_rate']:.1%} errors"
+        )
+        lines.append(f"  {'endpoint':<34}{'reqs':>6}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'err':>6}{'abort':>6}")
+        for endpoint, e in stage["endpoints"].items():
+            ms = [f"{e[k]:8.0f}" if e[k] is not None else f"{'-':>8}" for k in ("p50_ms", "p95_ms", "p99_ms")]
+            lines.append(
+                f"  {endpoint:<34}{e['requests']:>6}{e['throughput']:>8.1f}{''.join(ms)}{e['errors']:>6}{e['aborted']:>6}"
+            )
+    if len(report["stages"]) > 1:
+        saturation = report["saturation_users"]
+        lines.append(f"Saturation: {f'at {saturation} users' if saturation else 'not reached'}")
+    return "\n".join(lines)
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {kind: 0 for kind in USER_KINDS}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in mix:
+            raise argparse.ArgumentTypeError(f"unknown user kind {kind!r} (one of {', '.join(USER_KINDS)})")
+        mix[kind] = int(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent UI users (auto-infer, typing, beam, chat, model selector) "
+        "and report latency percentiles per endpoint."
+    )
+    parser.add_argument("--users", default="4", help="Simulated users; a comma-separated list runs one stage per count")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per stage")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="User kinds and weights, e.g. auto=2,beam=1,models=1")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="A running server, e.g. http://127.0.0.1:8000")
+    target.add_argument("--model", help="Serve this GGUF in-process")
+    parser.add_argument("--decode-ms", type=float, default=20.0, help="Stub engine: milliseconds per forward pass")
+    parser.add_argument("--prefill-ms", type=float, default=0.5, help="Stub engine: milliseconds per extra prompt token")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Also write the full report here")
+    args = parser.parse_args(argv)
+
+    if not args.url:
+        # In-process: the given GGUF, or the stub engine
+        if args.model:
+            LLMEngine.model_path_override = args.model
+        else:
+            LLMEngine._instance = StubEngine(args.decode_ms, args.prefill_ms)
+
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    users = [int(n) for n in args.users.split(",")]
+    report = asyncio.run(run_load(users, args.duration, args.mix, args.url, args.seed))
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from app.schemas import (
     GenerationRequest,
     GenerationResponse,
@@ -9,23 +9,115 @@ from app.schemas import (
     DownloadsStatusResponse,
     BeamSearchRequest,
     BeamSearchResponse,
+    TokenizeRequest,
+    TokenizeResponse,
+    SessionGenerationRequest,
+    SessionGenerationResponse,
+    SessionBeamSearchRequest,
+    SessionBeamSearchResponse,
+    BeamNodeRequest,
+    BeamExtendResponse,
+    BeamAdoptResponse,
+    SpeculativeConfigRequest,
+    SpeculativeConfigResponse,
+    SessionGenerateRequest,
+    SessionGenerateResponse,
+    ChatRequest,
+    ChatResponse,
+    ChatRenderRequest,
+    ChatRenderResponse,
+    SessionSweepRequest,
+    SessionSweepResponse,
+    BatchJobRequest,
+    BatchJobInfo,
+    BatchJobsResponse,
+    InferenceStatsResponse,
+    HistoryStepRequest,
+    HistoryStepResponse,
+    HistoryInfo,
+    PrewarmRequest,
+    PrewarmInfo,
+    MemoryWatchdogResponse,
 )
 from app.llm import LLMEngine
+from app.beam_tree import expand_node, extend_node, node_candidates
 from app.models_manager import ModelManager, MODEL_DIR
-from app.download_manager import DownloadManager
+from app.model_memory import InsufficientMemoryError, available_memory
+from app.prewarm import PrewarmManager, page_cache_percent
+from app.memory_watchdog import MemoryWatchdog
+from app.download_manager import DownloadManager, PROGRESS_EVENT_INTERVAL
+from app.encoding import candidates_response, json_response, paths_response
+from app.sweep import MAX_SWEEP_CONFIGS, sweep_candidates
+from app.batch import BATCH_DIR, BatchManager, BatchParams
+from app.chat import chat_candidates, render
+from app.sessions import SessionManager, SessionVersionError, tokenize_with_offsets
+from app.speculative import MAX_NUM_DRAFT, SpeculativeConfig, SpeculativeStats, generate
+from app.timing import RequestTimings, profile_request
+from app.worker_pool import WorkerEngine, WorkerPool
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
 import os
 import logging
 import traceback
+from typing import Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="LLM Explorer")
+# Comment line sent on idle event streams so proxies keep the connection open
+SSE_KEEPALIVE_SECONDS = 15
+
+# Upper bound on tokens per /sessions/{id}/generate request
+MAX_GENERATE_TOKENS = 256
+
+# Requests under these paths count as inference traffic for download throttling
+INFERENCE_PATH_PREFIXES = ("/next-tokens", "/beam/", "/sessions/", "/chat")
+
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resume_downloads()
+    yield
+    DownloadManager().flush()
+
+
+app = FastAPI(title="LLM Explorer", lifespan=lifespan)
 
 # Mount static files with cache busting for development
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 
+@app.middleware("http")
+async def track_inference(request: Request, call_next):
+    """Let the download scheduler throttle bandwidth while inference is running."""
+    if not request.url.path.startswith(INFERENCE_PATH_PREFIXES):
+        return await call_next(request)
+    download_mgr = DownloadManager()
+    download_mgr.inference_started()
+    try:
+        return await call_next(request)
+    finally:
+        download_mgr.inference_finished()
+
+
+def get_engine(session_id: str = None):
+    """The in-process engine, or a pool worker (by session affinity) when LLM_WORKERS is set."""
+    pool = WorkerPool.get()
+    if pool is not None:
+        return pool.engine_for(session_id)
+    return LLMEngine()  # Singleton access
+
+
+def token_filter_args(request) -> dict:
+    """get_next_tokens kwargs for a request's token filter, as a plain dict for worker processes."""
+    if request.token_filter is None:
+        return {}
+    return {"token_filter": request.token_filter.model_dump(exclude_none=True)}
+
+
 @app.get("/")
 def read_root():
     return FileResponse("app/static/index.html")
@@ -33,52 +125,463 @@ def read_root():
 
 @app.get("/health")
 def health_check():
+    pool = WorkerPool.get()
+    if pool is not None and pool.degraded:
+        return {"status": "degraded", "detail": pool.degraded}
     return {"status": "ok"}
 
 
 @app.post("/next-tokens", response_model=GenerationResponse)
-def get_next_tokens(request: GenerationRequest):
-    engine = LLMEngine()  # Singleton access
-    try:
-        candidates = engine.get_next_tokens(
-            request.text,
-            temp=request.temp,
-            top_k=request.top_k,
-            top_p=request.top_p,
-            repeat_penalty=request.repeat_penalty,
-        )
-        return {"candidates": candidates}
+def get_next_tokens(request: GenerationRequest, http_request: Request):
+    engine = get_engine(request.session_id)
+    timings = RequestTimings() if request.debug_timing or request.profile else None
+    extra = {"timings": timings} if timings else {}
+    extra.update(token_filter_args(request))
+    try:
+        if request.session_id:
+            session = SessionManager().sync_text(request.session_id, request.text, engine)
+            extra["prompt_tokens"] = list(session.token_ids)
+        with profile_request("next-tokens", timings, enabled=request.profile):
+            candidates = engine.get_next_tokens(
+                request.text,
+                temp=request.temp,
+                top_k=request.top_k,
+                top_p=request.top_p,
+                repeat_penalty=request.repeat_penalty,
+                **extra,
+            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return candidates_response(http_request, candidates, timings=timings.to_dict() if timings else None)
+
+
+@app.post("/sessions/{session_id}/next-tokens", response_model=SessionGenerationResponse)
+def session_next_tokens(session_id: str, request: SessionGenerationRequest, http_request: Request):
+    """Like /next-tokens, but the context is held server-side and updated with deltas."""
+    engine = get_engine(session_id)
+    try:
+        session = SessionManager().apply_ops(session_id, request.base_version, request.ops, engine)
+    except SessionVersionError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.version})
+
+    with session.lock:
+        text = session.text
+        prompt_tokens = list(session.token_ids)
+        version = session.version
+
+    timings = RequestTimings() if request.debug_timing or request.profile else None
+    try:
+        with profile_request("session-next-tokens", timings, enabled=request.profile):
+            candidates = engine.get_next_tokens(
+                text,
+                temp=request.temp,
+                top_k=request.top_k,
+                top_p=request.top_p,
+                repeat_penalty=request.repeat_penalty,
+                timings=timings,
+                prompt_tokens=prompt_tokens,
+                **token_filter_args(request),
+            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    SessionManager().observe(session, prompt_tokens, candidates)
+    return candidates_response(
+        http_request,
+        candidates,
+        timings=timings.to_dict() if timings else None,
+        session_version=version,
+        n_tokens=len(prompt_tokens),
+    )
+
+
+def history_step_response(session, engine, request: HistoryStepRequest) -> dict:
+    """The session after an undo/redo, with its recorded distribution post-processed again."""
+    candidates = []
+    if session.shown is not None:
+        _, candidate_ids, logprobs = session.shown
+        pieces = engine.token_pieces(candidate_ids[:request.top_k])
+        top_logprobs = [
+            (piece.decode("utf-8", errors="ignore"), logprob, token_id)
+            for piece, logprob, token_id in zip(pieces, logprobs, candidate_ids)
+        ]
+        # Recorded logprobs already include the repeat penalty that was applied
+        candidates = engine.postprocess_candidates(top_logprobs, session.text, request.temp, request.top_p, 1.0)
+    return {
+        "text": session.text,
+        "session_version": session.version,
+        "n_tokens": len(session.token_ids),
+        "candidates": candidates,
+        "position": session.history.position,
+        "steps": session.history.steps,
+    }
+
+
+@app.post("/sessions/{session_id}/history/undo", response_model=HistoryStepResponse)
+def session_history_undo(session_id: str, request: HistoryStepRequest = HistoryStepRequest()):
+    """Go back one token, showing the distribution it was chosen from without recomputing it."""
+    engine = get_engine(session_id)
+    try:
+        session = SessionManager().undo(session_id)
+    except KeyError:
+        raise HTTPException(status_code=409, detail="Nothing to undo")
+    with session.lock:
+        return history_step_response(session, engine, request)
+
+
+@app.post("/sessions/{session_id}/history/redo", response_model=HistoryStepResponse)
+def session_history_redo(session_id: str, request: HistoryStepRequest = HistoryStepRequest()):
+    engine = get_engine(session_id)
+    try:
+        session = SessionManager().redo(session_id, engine)
+    except KeyError:
+        raise HTTPException(status_code=409, detail="Nothing to redo")
+    with session.lock:
+        return history_step_response(session, engine, request)
+
+
+@app.get("/sessions/{session_id}/history", response_model=HistoryInfo)
+def session_history(session_id: str):
+    session = SessionManager().get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    history = session.history
+    return {
+        "steps": history.steps,
+        "position": history.position,
+        "capacity": history.capacity,
+        "nbytes": history.nbytes,
+    }
+
+
+@app.get("/sessions/{session_id}/history/export")
+def export_session_history(session_id: str):
+    """Every recorded step as columnar arrays in an .npz archive."""
+    session = SessionManager().get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    with session.lock:
+        data = session.history.to_npz()
+    return Response(
+        data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="session-history.npz"'},
+    )
+
+
+@app.post("/chat", response_model=ChatResponse)
+def chat(request: ChatRequest, http_request: Request):
+    """
+    Next-token candidates for the assistant's reply, with the conversation rendered by the
+    model's own chat template. Completed turns are cached, so a new message only prefills itself.
+    """
+    engine = get_engine(request.session_id)
+    timings = RequestTimings() if request.debug_timing or request.profile else None
+    messages = [m.model_dump() for m in request.messages]
+    try:
+        with profile_request("chat", timings, enabled=request.profile):
+            result = chat_candidates(
+                engine,
+                messages,
+                request.assistant_prefix,
+                temp=request.temp,
+                top_k=request.top_k,
+                top_p=request.top_p,
+                repeat_penalty=request.repeat_penalty,
+                timings=timings,
+            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    candidates = result.pop("candidates")
+    return candidates_response(http_request, candidates, timings=timings.to_dict() if timings else None, **result)
+
+
+@app.post("/chat/render", response_model=ChatRenderResponse)
+def chat_render(request: ChatRenderRequest):
+    """Render a conversation with the model's chat template without evaluating it."""
+    engine = get_engine()
+    try:
+        info = engine.chat_template_info()
+        return {"prompt": render(info, [m.model_dump() for m in request.messages], request.add_generation_prompt)}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/sessions/{session_id}/sweep", response_model=SessionSweepResponse)
+def session_sweep(session_id: str, request: SessionSweepRequest):
+    """Candidates for a grid of sampling settings, all from a single evaluation of the context."""
+    grid = (request.temps, request.top_ks, request.top_ps, request.repeat_penalties)
+    n_configs = 1
+    for values in grid:
+        n_configs *= len(values)
+    if not 0 < n_configs <= MAX_SWEEP_CONFIGS:
+        raise HTTPException(status_code=422, detail=f"Sweep must have 1 to {MAX_SWEEP_CONFIGS} configurations")
+
+    engine = get_engine(session_id)
+    manager = SessionManager()
+    try:
+        session = manager.apply_ops(session_id, request.base_version, request.ops, engine)
+    except SessionVersionError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.version})
+
+    try:
+        with session.lock:
+            top_logprobs = manager.top_logprobs(session, engine, max(request.top_ks))
+            text = session.text
+            version = session.version
+        result = sweep_candidates(engine, top_logprobs, text, *grid)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return json_response({**result, "session_version": version})
+
+
+@app.post("/tokenize", response_model=TokenizeResponse)
+def tokenize(request: TokenizeRequest):
+    """Tokenize text, returning token IDs and their byte offsets."""
+    engine = get_engine(request.session_id)
+    try:
+        if request.session_id:
+            session = SessionManager().sync_text(request.session_id, request.text, engine)
+            with session.lock:
+                return {
+                    "token_ids": session.token_ids,
+                    "offsets": session.offsets,
+                    "session_id": session.session_id,
+                    "version": session.version,
+                }
+        token_ids, offsets, _ = tokenize_with_offsets(request.text.encode("utf-8"), engine)
+        return {"token_ids": token_ids, "offsets": offsets}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/beam/search", response_model=BeamSearchResponse)
-def beam_search(request: BeamSearchRequest):
+def beam_search(request: BeamSearchRequest, http_request: Request):
     """Generate multiple divergent text paths using beam search."""
-    engine = LLMEngine()
+    engine = get_engine()
+    timings = RequestTimings() if request.debug_timing or request.profile else None
+    extra = {"timings": timings} if timings else {}
     try:
-        paths = engine.generate_beam_paths(
-            context=request.context,
-            num_paths=request.num_paths,
-            depth=request.depth,
-        )
-        return {"paths": paths}
+        with profile_request("beam-search", timings, enabled=request.profile):
+            paths = engine.generate_beam_paths(
+                context=request.context,
+                num_paths=request.num_paths,
+                depth=request.depth,
+                **extra,
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return paths_response(http_request, paths, timings=timings.to_dict() if timings else None)
+
+
+@app.post("/sessions/{session_id}/beam/search", response_model=SessionBeamSearchResponse)
+def session_beam_search(session_id: str, request: SessionBeamSearchRequest, http_request: Request):
+    """Branch paths from the session context (or an existing path), reusing explored nodes."""
+    engine = get_engine(session_id)
+    manager = SessionManager()
+    try:
+        session = manager.apply_ops(session_id, request.base_version, request.ops, engine)
+    except SessionVersionError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.version})
+
+    with session.lock:
+        tree = manager.beam_tree(session)
+        node = tree.root if request.node_id is None else tree.get(request.node_id)
+        if node is None:
+            raise HTTPException(status_code=404, detail="Beam path not found")
+        try:
+            leaves = expand_node(
+                tree,
+                node,
+                engine,
+                num_paths=request.num_paths,
+                depth=request.depth,
+                temp=request.temp,
+                top_k=request.top_k,
+                top_p=request.top_p,
+                repeat_penalty=request.repeat_penalty,
+                speculative=session.speculative,
+                stats=session.speculative_stats,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        paths = sorted((tree.to_path(leaf) for leaf in leaves), key=lambda p: p["cumulative_prob"], reverse=True)
+        version = session.version
+    return paths_response(http_request, paths, session_version=version)
+
+
+@app.post("/sessions/{session_id}/beam/{node_id}/extend", response_model=BeamExtendResponse)
+def session_beam_extend(session_id: str, node_id: str, request: BeamNodeRequest = BeamNodeRequest()):
+    """Extend a beam path by one token, decoding only from the end of that path."""
+    engine = get_engine(session_id)
+    manager = SessionManager()
+    session = manager.get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Beam path not found")
+
+    with session.lock:
+        node = manager.beam_node(session, node_id, engine)
+        if node is None:
+            raise HTTPException(status_code=404, detail="Beam path not found")
+        tree = session.beam_tree
+        try:
+            node = extend_node(tree, node, engine, **request.model_dump()) or node
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return {"path": tree.to_path(node)}
+
+
+@app.post("/sessions/{session_id}/beam/{node_id}/adopt", response_model=BeamAdoptResponse)
+def session_beam_adopt(session_id: str, node_id: str, request: BeamNodeRequest = BeamNodeRequest()):
+    """Make a beam path the session context. Cached distributions make this nearly free."""
+    engine = get_engine(session_id)
+    try:
+        session = SessionManager().adopt_beam_node(session_id, node_id, engine)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Beam path not found")
+
+    with session.lock:
+        try:
+            candidates = node_candidates(session.beam_tree, session.beam_tree.root, engine, **request.model_dump())
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        SessionManager().observe(session, list(session.token_ids), candidates)
+        return {"session_version": session.version, "text": session.text, "candidates": candidates}
+
+
+@app.delete("/sessions/{session_id}/beam/{node_id}")
+def session_beam_delete(session_id: str, node_id: str):
+    session = SessionManager().get_session(session_id)
+    if session is None or session.beam_tree is None:
+        raise HTTPException(status_code=404, detail="Beam path not found")
+    with session.lock:
+        if not session.beam_tree.remove(node_id):
+            raise HTTPException(status_code=404, detail="Beam path not found")
+    return {"status": "deleted"}
+
+
+def speculative_info(session) -> dict:
+    config = session.speculative
+    return {
+        "mode": config.mode,
+        "draft_model": os.path.basename(config.draft_model) if config.draft_model else None,
+        "num_draft": config.num_draft,
+        "stats": session.speculative_stats.to_dict(),
+    }
+
+
+@app.get("/sessions/{session_id}/speculative", response_model=SpeculativeConfigResponse)
+def get_session_speculative(session_id: str):
+    session = SessionManager().get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return speculative_info(session)
+
+
+@app.put("/sessions/{session_id}/speculative", response_model=SpeculativeConfigResponse)
+def set_session_speculative(session_id: str, request: SpeculativeConfigRequest):
+    """Choose how this session drafts tokens for speculative decoding (off, n-gram lookup or a draft model)."""
+    if not 1 <= request.num_draft <= MAX_NUM_DRAFT:
+        raise HTTPException(status_code=422, detail=f"num_draft must be between 1 and {MAX_NUM_DRAFT}")
+    draft_path = None
+    if request.mode == "draft":
+        if not request.draft_model:
+            raise HTTPException(status_code=422, detail="draft_model is required for mode 'draft'")
+        draft_path = os.path.join(MODEL_DIR, os.path.basename(request.draft_model))
+        if not os.path.exists(draft_path):
+            raise HTTPException(status_code=404, detail="Draft model not found")
+        try:
+            get_engine(session_id).load_draft_model(draft_path)
+        except InsufficientMemoryError as e:
+            raise HTTPException(status_code=507, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    session = SessionManager().get_or_create(session_id)
+    with session.lock:
+        session.speculative = SpeculativeConfig(request.mode, draft_path, request.num_draft)
+        session.speculative_stats = SpeculativeStats()
+        return speculative_info(session)
+
+
+@app.post("/sessions/{session_id}/generate", response_model=SessionGenerateResponse)
+def session_generate(session_id: str, request: SessionGenerateRequest):
+    """
+    Generate up to max_tokens tokens after the session context, with the candidates at each
+    step. Uses the session's speculative decoding setting; the context itself is left as is.
+    """
+    if not 1 <= request.max_tokens <= MAX_GENERATE_TOKENS:
+        raise HTTPException(status_code=422, detail=f"max_tokens must be between 1 and {MAX_GENERATE_TOKENS}")
+    engine = get_engine(session_id)
+    try:
+        session = SessionManager().apply_ops(session_id, request.base_version, request.ops, engine)
+    except SessionVersionError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "version": e.version})
+
+    with session.lock:
+        text = session.text
+        prompt_tokens = list(session.token_ids)
+        version = session.version
+        config = session.speculative
+
+    timings = RequestTimings() if request.debug_timing or request.profile else None
+    stats = SpeculativeStats()
+    try:
+        with profile_request("session-generate", timings, enabled=request.profile):
+            steps = generate(
+                engine,
+                prompt_tokens,
+                text,
+                request.max_tokens,
+                config,
+                greedy=request.greedy,
+                temp=request.temp,
+                top_k=request.top_k,
+                top_p=request.top_p,
+                repeat_penalty=request.repeat_penalty,
+                stats=stats,
+                timings=timings,
+            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    with session.lock:
+        session.speculative_stats.add(stats)
+    SessionManager().offer(session, prompt_tokens, steps)
+    return {
+        "tokens": [{k: step[k] for k in ("token", "token_id", "prob", "candidates")} for step in steps],
+        "text": "".join(step["token"] for step in steps),
+        "session_version": version,
+        "speculative": stats.to_dict(),
+        "timings": timings.to_dict() if timings else None,
+    }
 
 
 @app.get("/models")
 def list_models():
     manager = ModelManager()
-    return manager.list_local_models()
+    # Switching frees the current model, so count its memory as available.
+    # Don't construct the engine here: that would load a model just to list them.
+    pool = WorkerPool.get()
+    if pool is not None:
+        return manager.list_local_models(freed_bytes=pool.footprint_bytes())
+    engine = LLMEngine._instance
+    footprint = engine.footprint if engine else None
+    return manager.list_local_models(freed_bytes=footprint["total_bytes"] if footprint else 0)
+
+
+@app.get("/inference/stats", response_model=InferenceStatsResponse)
+def inference_stats():
+    """How many inference calls ran, and how many shared an identical in-flight call's result."""
+    pool = WorkerPool.get()
+    stats = pool.coalesce_stats() if pool is not None else LLMEngine().coalesce_stats()
+    return {"coalescing": stats}
 
 
 @app.get("/models/current")
 def get_current_model():
     """Get the currently loaded model filename."""
     try:
-        from app.llm import LLMEngine
-        engine = LLMEngine()
+        engine = get_engine()
         current_model = engine.get_current_model()
         if current_model:
             # Return just the filename
@@ -91,9 +594,33 @@ def get_current_model():
 
 
 @app.get("/models/lookup")
-def lookup_models(repo_id: str):
+async def lookup_models(repo_id: str, response: Response, offset: int = 0, limit: Optional[int] = None):
     manager = ModelManager()
-    return manager.list_remote_files(repo_id)
+    files = await manager.list_remote_files(repo_id)
+    if isinstance(files, list):
+        response.headers["X-Total-Count"] = str(len(files))
+        files = files[offset:offset + limit if limit is not None else None]
+    return files
+
+
+def make_download_func(model_mgr: ModelManager, repo_id: str, filename: str, download_id: str):
+    def run_download():
+        try:
+            model_mgr.download_model(repo_id, filename, download_id=download_id)
+        except Exception:
+            pass  # Error already set in download_manager
+
+    return run_download
+
+
+def resume_downloads():
+    """Re-queue downloads a previous run left unfinished; their .part files are resumed."""
+    model_mgr = ModelManager()
+    resumed = DownloadManager().resume_interrupted(
+        lambda d: make_download_func(model_mgr, d.repo_id, d.filename, d.download_id)
+    )
+    if resumed:
+        logger.info(f"Resuming {resumed} interrupted download(s)")
 
 
 @app.post("/models/download")
@@ -104,14 +631,9 @@ def download_model(request: DownloadModelRequest):
     # Create a download record
     download_id = download_mgr.create_download(request.repo_id, request.filename)
 
-    # Start download in background - capture download_id in closure
-    def run_download():
-        try:
-            model_mgr.download_model(request.repo_id, request.filename, download_id=download_id)
-        except Exception:
-            pass  # Error already set in download_manager
-
-    download_mgr.start_download_thread(download_id, run_download)
+    # Start download in background
+    run_download = make_download_func(model_mgr, request.repo_id, request.filename, download_id)
+    download_mgr.start_download_thread(download_id, run_download, priority=request.priority)
 
     return {"download_id": download_id, "status": "started"}
 
@@ -124,6 +646,44 @@ def get_downloads_status():
     return DownloadsStatusResponse(
         downloads=[download_mgr.to_dict(d) for d in downloads],
         active_count=len(download_mgr.get_active_downloads()),
+        queued_count=download_mgr.queued_count(),
+    )
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def download_event_stream(request: Request):
+    """Snapshot of all downloads, then one event per changed download as it happens."""
+    download_mgr = DownloadManager()
+    # Subscribe before the snapshot so no change falls between the two
+    subscription = download_mgr.subscribe()
+    try:
+        downloads = download_mgr.get_all_downloads()
+        yield format_sse("snapshot", {
+            "downloads": [download_mgr.to_dict(d) for d in downloads],
+            "active_count": len(download_mgr.get_active_downloads()),
+        })
+        while not await request.is_disconnected():
+            events = await subscription.next_events(timeout=SSE_KEEPALIVE_SECONDS)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield format_sse("download", event)
+            # Let further progress coalesce before the next write
+            await asyncio.sleep(PROGRESS_EVENT_INTERVAL)
+    finally:
+        download_mgr.unsubscribe(subscription)
+
+
+@app.get("/downloads/events")
+async def download_events(request: Request):
+    return StreamingResponse(
+        download_event_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -136,20 +696,141 @@ def cancel_download(download_id: str):
     return {"status": "cancelled"}
 
 
+def batch_engines() -> list:
+    """One engine per pool worker so a batch uses them all, else the in-process engine."""
+    pool = WorkerPool.get()
+    if pool is not None:
+        return [WorkerEngine(pool, worker) for worker in pool.workers]
+    return [LLMEngine()]
+
+
+def batch_path(filename: str) -> str:
+    if not filename or os.path.basename(filename) != filename:
+        raise HTTPException(status_code=400, detail="Batch files must be plain names in the batches directory")
+    return os.path.join(BATCH_DIR, filename)
+
+
+@app.post("/batch/jobs")
+def start_batch_job(request: BatchJobRequest):
+    """Evaluate every prompt in a JSONL file in the background, writing results as JSONL."""
+    input_path = batch_path(request.input_file)
+    if not os.path.exists(input_path):
+        raise HTTPException(status_code=404, detail="Input file not found")
+    output_name = request.output_file or os.path.splitext(request.input_file)[0] + ".out.jsonl"
+    output_path = batch_path(output_name)
+    if output_path == input_path:
+        raise HTTPException(status_code=400, detail="Output file must differ from the input file")
+
+    batch_mgr = BatchManager()
+    job_id = batch_mgr.create_job(input_path, output_path)
+    params = BatchParams(request.temp, request.top_k, request.top_p, request.repeat_penalty)
+    batch_mgr.start_job_thread(job_id, batch_engines(), params, resume=request.resume)
+    return {"job_id": job_id, "status": "started", "output_file": output_name}
+
+
+@app.get("/batch/jobs", response_model=BatchJobsResponse)
+def list_batch_jobs():
+    batch_mgr = BatchManager()
+    return BatchJobsResponse(jobs=[batch_mgr.to_dict(j) for j in batch_mgr.get_all_jobs()])
+
+
+@app.get("/batch/jobs/{job_id}", response_model=BatchJobInfo)
+def get_batch_job(job_id: str):
+    batch_mgr = BatchManager()
+    job = batch_mgr.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return batch_mgr.to_dict(job)
+
+
+@app.delete("/batch/jobs/{job_id}")
+def cancel_batch_job(job_id: str):
+    if not BatchManager().cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="Batch job not found or cannot be cancelled")
+    return {"status": "cancelled"}
+
+
 @app.post("/models/switch")
 def switch_model(request: SwitchModelRequest):
-    engine = LLMEngine()
+    engine = get_engine()
     # Verify file exists in models dir
     target_path = os.path.join(MODEL_DIR, request.filename)
     if not os.path.exists(target_path):
         raise HTTPException(status_code=404, detail="Model not found")
 
     try:
+        watchdog = MemoryWatchdog()
+        pids = engine_pids()
+        previous = engine.get_current_model()
+        before = watchdog.snapshot(pids)
+        started = time.perf_counter()
         engine.load_model(target_path)
+        watchdog.record_switch(
+            previous,
+            target_path,
+            before,
+            watchdog.snapshot(pids),
+            time.perf_counter() - started,
+            teardown=getattr(engine, "teardown", None),
+        )
 
         # Get friendly name from metadata
         return {"status": "success", "model": request.filename, "friendly_name": request.filename}
+    except InsufficientMemoryError as e:
+        # The current model stays loaded
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to load model {request.filename}: {e}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def engine_pids() -> Optional[list]:
+    """Processes holding the model: the pool workers, or None for this one."""
+    pool = WorkerPool.get()
+    return pool.pids() if pool is not None else None
+
+
+@app.get("/models/memory", response_model=MemoryWatchdogResponse)
+def model_memory():
+    """RSS and mapped files now and around recent switches, to spot models that weren't released."""
+    return MemoryWatchdog().report(engine_pids())
+
+
+def prewarm_response(filename: str, info) -> dict:
+    return {
+        "filename": filename,
+        **PrewarmManager().to_dict(info),
+        "warm_percent": page_cache_percent(info.path),
+    }
+
+
+@app.post("/models/prewarm", response_model=PrewarmInfo)
+def prewarm_model(request: PrewarmRequest):
+    """
+    Start reading a model into the page cache in the background, e.g. while it is hovered
+    in the selector, so a following switch loads from memory. Throttled while inferring.
+    """
+    target_path = os.path.join(MODEL_DIR, request.filename)
+    if os.path.basename(request.filename) != request.filename or not os.path.exists(target_path):
+        raise HTTPException(status_code=404, detail="Model not found")
+    available = available_memory()
+    if available is not None and os.path.getsize(target_path) > available:
+        # It would only evict itself (and everything else) from the cache
+        raise HTTPException(status_code=507, detail="Model is larger than available memory")
+    return prewarm_response(request.filename, PrewarmManager().start(target_path))
+
+
+@app.get("/models/prewarm/{filename}", response_model=PrewarmInfo)
+def get_prewarm(filename: str):
+    info = PrewarmManager().get(os.path.join(MODEL_DIR, filename))
+    if info is None:
+        raise HTTPException(status_code=404, detail="No prewarm for this model")
+    return prewarm_response(filename, info)
+
+
+@app.delete("/models/prewarm/{filename}")
+def cancel_prewarm(filename: str):
+    if not PrewarmManager().cancel(os.path.join(MODEL_DIR, filename)):
+        raise HTTPException(status_code=404, detail="No running prewarm for this model")
+    return {"status": "cancelled"}
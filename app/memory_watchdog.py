@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Switches kept for the /models/memory report
+MEMORY_WATCHDOG_HISTORY = 50
+# RSS growth over the first load of the same model that counts as a suspected leak
+MEMORY_LEAK_TOLERANCE = int(os.environ.get("MEMORY_LEAK_TOLERANCE", str(64 * 1024 * 1024)))
+
+
+def process_memory(pid: Optional[int] = None) -> Optional[dict]:
+    """
+    Resident memory and file mappings of a process (default: this one), from /proc.
+    None where /proc isn't available or the process is gone.
+    """
+    proc = f"/proc/{pid or 'self'}"
+    rss = None
+    files = set()
+    try:
+        with open(f"{proc}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                    break
+        with open(f"{proc}/maps") as f:
+            for line in f:
+                parts = line.split(None, 5)
+                if len(parts) == 6 and parts[5].startswith("/"):
+                    files.add(parts[5].rstrip("\n"))
+    except (OSError, ValueError):
+        return None
+    return {
+        "pid": pid or os.getpid(),
+        "rss_bytes": rss,
+        "mapped_files": len(files),
+        "gguf_mappings": sorted(path for path in files if path.endswith(".gguf")),
+    }
+
+
+@dataclass
+class SwitchRecord:
+    from_model: Optional[str]
+    to_model: str
+    before: List[dict]  # process_memory() per process, before the switch
+    after: List[dict]
+    released: bool  # The old model's file is no longer mapped anywhere, and its handles were freed
+    suspected_leak: bool
+    rss_growth_bytes: int  # Over the first time to_model was loaded
+    duration: float
+    teardown: Optional[dict] = None  # LLMEngine.teardown, for the in-process engine
+    timestamp: float = field(default_factory=time.time)
+
+
+class MemoryWatchdog:
+    """
+    Records RSS and file mappings around each model switch, to check the old model is
+    actually released. Each model's RSS after its first load is the baseline for later
+    loads of it; growing past that by MEMORY_LEAK_TOLERANCE is flagged as a leak.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self.switches = deque(maxlen=MEMORY_WATCHDOG_HISTORY)
+        self.baselines: Dict[str, int] = {}
+        self._records_lock = threading.Lock()
+
+    def snapshot(self, pids: Optional[List[int]] = None) -> List[dict]:
+        return [m for m in (process_memory(pid) for pid in (pids or [None])) if m is not None]
+
+    def record_switch(
+        self,
+        from_model: Optional[str],
+        to_model: str,
+        before: List[dict],
+        after: List[dict],
+        duration: float,
+        teardown: Optional[dict] = None,
+    ) -> SwitchRecord:
+        rss = sum(m["rss_bytes"] or 0 for m in after)
+        mapped = {path for m in after for path in m["gguf_mappings"]}
+        released = from_model is None or from_model == to_model or from_model not in mapped
+        if teardown and not teardown["verified"]:
+            released = False
+        with self._records_lock:
+            baseline = self.baselines.setdefault(to_model, rss)
+            record = SwitchRecord(
+                from_model=from_model,
+                to_model=to_model,
+                before=before,
+                after=after,
+                released=released,
+                suspected_leak=bool(after) and rss - baseline > MEMORY_LEAK_TOLERANCE,
+                rss_growth_bytes=rss - baseline,
+                duration=duration,
+                teardown=teardown,
+            )
+            self.switches.append(record)
+        if not record.released or record.suspected_leak:
+            print(
+                f"Memory watchdog: switch to {os.path.basename(to_model)} "
+                f"{'left the previous model mapped' if not record.released else 'grew RSS'} "
+                f"({record.rss_growth_bytes / (1024 * 1024):+.1f} MB over baseline)"
+            )
+        return record
+
+    def report(self, pids: Optional[List[int]] = None) -> dict:
+        with self._records_lock:
+            switches = [record.__dict__.copy() for record in self.switches]
+        return {
+            "current": self.snapshot(pids),
+            "switches": switches,
+            "suspected_leak": any(not s["released"] or s["suspected_leak"] for s in switches),
+        }
@@ -0,0 +1,150 @@
+import os
+import re
+import subprocess
+import sys
+from typing import Optional, Tuple
+
+DEFAULT_N_CTX = 2048
+MIN_N_CTX = 512
+N_BATCH = 512  # llama-cpp-python default
+# Memory left free for the OS, the server and the page cache of everything else
+MEMORY_RESERVE_BYTES = 512 * 1024 * 1024
+# Fixed llama.cpp overhead: graph metadata, tokenizer tables, small buffers
+BASE_OVERHEAD_BYTES = 64 * 1024 * 1024
+
+# Bytes per KV cache element by cache type
+KV_TYPE_BYTES = {"f32": 4, "f16": 2, "q8_0": 1.0625, "q4_0": 0.5625}
+
+
+class InsufficientMemoryError(MemoryError):
+    def __init__(self, message: str, estimate: dict, available: int):
+        super().__init__(message)
+        self.estimate = estimate
+        self.available = available
+
+
+def estimate_footprint(
+    size_bytes: int,
+    gguf: dict,
+    n_ctx: int = DEFAULT_N_CTX,
+    kv_type: str = "f16",
+    logits_all: bool = True,
+    n_batch: int = N_BATCH,
+) -> dict:
+    """
+    Predict the resident memory of a loaded model from its GGUF metadata.
+    Approximate by design: it only has to be right to within the reserve margin.
+    """
+    n_layer = gguf.get("block_count") or 0
+    n_embd = gguf.get("embedding_length") or 0
+    n_head = gguf.get("head_count") or 1
+    n_head_kv = gguf.get("head_count_kv") or n_head
+    n_vocab = gguf.get("vocab_size") or 0
+    key_length = gguf.get("key_length") or n_embd // n_head
+    value_length = gguf.get("value_length") or n_embd // n_head
+
+    # The weights are mmapped; once touched, all of them are resident
+    weights = size_bytes
+    kv_cache = int(n_layer * n_ctx * n_head_kv * (key_length + value_length) * KV_TYPE_BYTES[kv_type])
+    # llama.cpp's output buffer holds one batch of logits; llama-cpp-python keeps its own
+    # float32 scores array with a row per context position when logits_all is set
+    logits = (n_batch + (n_ctx if logits_all else n_batch)) * n_vocab * 4
+    # Compute graph for one batch: output projection, attention scores, activations
+    scratch = n_batch * (n_vocab + n_head * n_ctx + 4 * n_embd) * 4 + BASE_OVERHEAD_BYTES
+
+    return {
+        "n_ctx": n_ctx,
+        "weights_bytes": weights,
+        "kv_cache_bytes": kv_cache,
+        "logits_bytes": logits,
+        "scratch_bytes": scratch,
+        "total_bytes": weights + kv_cache + logits + scratch,
+    }
+
+
+def _vm_stat_available(output: str) -> Optional[int]:
+    """Free, speculative and inactive pages from macOS vm_stat output, in bytes."""
+    page_size = re.search(r"page size of (\d+) bytes", output)
+    pages = dict(re.findall(r"^Pages (free|speculative|inactive):\s+(\d+)\.", output, re.MULTILINE))
+    if not page_size or "free" not in pages:
+        return None
+    return sum(int(n) for n in pages.values()) * int(page_size.group(1))
+
+
+def _host_available_memory() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+        return None
+    except OSError:
+        pass
+    if sys.platform == "darwin":
+        # No /proc, and sysconf has no free page count; inactive pages are reclaimable too
+        try:
+            result = subprocess.run(["vm_stat"], capture_output=True, text=True, timeout=5)
+            return _vm_stat_available(result.stdout)
+        except (OSError, subprocess.SubprocessError):
+            return None
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def available_memory() -> Optional[int]:
+    """Bytes that can be allocated without swapping, or None if it can't be determined."""
+    available = _host_available_memory()
+
+    # A cgroup limit (containers) can be much tighter than the host's free memory
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            with open("/sys/fs/cgroup/memory.current") as f:
+                headroom = int(limit) - int(f.read().strip())
+            available = headroom if available is None else min(available, headroom)
+    except (OSError, ValueError):
+        pass
+
+    return available
+
+
+def plan_context(
+    size_bytes: int,
+    gguf: dict,
+    n_ctx: int = DEFAULT_N_CTX,
+    available: Optional[int] = None,
+    freed_bytes: int = 0,
+) -> Tuple[int, dict]:
+    """
+    Pick the largest context (halving from n_ctx down to MIN_N_CTX) whose estimated
+    footprint fits in available memory plus whatever unloading the current model frees.
+    Raises InsufficientMemoryError if even MIN_N_CTX doesn't fit.
+    """
+    if available is None:
+        available = available_memory()
+    if gguf.get("context_length"):
+        n_ctx = min(n_ctx, gguf["context_length"])
+
+    estimate = estimate_footprint(size_bytes, gguf, n_ctx)
+    if available is None:
+        return n_ctx, estimate
+
+    budget = available + freed_bytes - MEMORY_RESERVE_BYTES
+    while True:
+        estimate = estimate_footprint(size_bytes, gguf, n_ctx)
+        if estimate["total_bytes"] <= budget:
+            return n_ctx, estimate
+        if n_ctx // 2 < MIN_N_CTX:
+            break
+        n_ctx //= 2
+
+    mb = 1024 * 1024
+    raise InsufficientMemoryError(
+        f"Model needs about {estimate['total_bytes'] // mb} MB even at n_ctx={n_ctx}, "
+        f"but only {max(budget, 0) // mb} MB is available",
+        estimate,
+        available,
+    )
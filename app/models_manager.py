@@ -1,10 +1,14 @@
 import os
-import glob
-import time
 from urllib.parse import urlparse
-from huggingface_hub import HfApi, hf_hub_download
+from huggingface_hub import HfApi, hf_hub_url
+from huggingface_hub.utils import build_hf_headers
 
 from app.download_manager import DownloadManager, DownloadState
+from app.gguf_catalog import get_catalog
+from app.hub_lookup import get_hub_lookup
+from app.model_memory import InsufficientMemoryError, available_memory, plan_context
+from app.prewarm import PrewarmManager
+from app.ranged_download import RangedDownload
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
 
@@ -37,98 +41,102 @@ def parse_huggingface_url(url: str) -> str:
     return f"{path_parts[0]}/{path_parts[1]}"
 
 
-def make_progress_tracker_class(download_id: str, download_manager: DownloadManager):
-    """Factory function to create a tqdm-like class for huggingface_hub."""
-    class _ProgressTracker:
-        def __init__(self, total=None, desc=None, unit=None, unit_scale=False, **kwargs):
-            self.download_id = download_id
-            self.manager = download_manager
-            self.total = total or 0
-            self.n = 0
-            self._last_update = 0
-            self._start_time = time.time()
-
-        def update(self, n):
-            """Update progress by n bytes."""
-            self.n += n
-            current_time = time.time()
-
-            # Throttle updates to every 250ms
-            if current_time - self._last_update < 0.25:
-                return
-            self._last_update = current_time
-
-            # Check if download was cancelled
-            download = self.manager.get_download(self.download_id)
-            if not download or download.state == DownloadState.CANCELLED:
-                raise InterruptedError("Download cancelled")
-
-            # Calculate progress
-            if self.total > 0:
-                pct = min((self.n / self.total * 100), 100)
-                self.manager.update_progress(
-                    self.download_id,
-                    progress=pct,
-                    bytes_downloaded=self.n,
-                    total_bytes=self.total,
-                )
+def make_progress_callback(download_id: str, download_manager: DownloadManager):
+    """Progress callback for RangedDownload that reports into DownloadManager."""
+    def on_progress(bytes_downloaded: int, total_bytes: int):
+        pct = min(bytes_downloaded / total_bytes * 100, 100) if total_bytes > 0 else 0.0
+        download_manager.update_progress(
+            download_id,
+            progress=pct,
+            bytes_downloaded=bytes_downloaded,
+            total_bytes=total_bytes,
+        )
 
-        def close(self):
-            """Called when download completes."""
-            pass
+    return on_progress
 
-        def __enter__(self):
-            return self
 
-        def __exit__(self, *args):
-            self.close()
+def make_cancel_check(download_id: str, download_manager: DownloadManager):
+    """Cancel check for RangedDownload, polled between reads."""
+    def is_cancelled() -> bool:
+        download = download_manager.get_download(download_id)
+        return not download or download.state == DownloadState.CANCELLED
 
-    return _ProgressTracker
+    return is_cancelled
 
 
 class ModelManager:
-    def list_local_models(self):
-        models = []
+    def list_local_models(self, freed_bytes: int = 0):
+        """
+        List local GGUFs with their metadata and estimated memory footprint.
+        freed_bytes is what unloading the current model would release.
+        """
         if not os.path.exists(MODEL_DIR):
             return []
 
-        for file_path in glob.glob(os.path.join(MODEL_DIR, "*.gguf")):
+        repo_ids = self._downloaded_repo_ids()
+        available = available_memory()
+        prewarm = PrewarmManager()
+        models = []
+        # Cached by path/size/mtime, so this only parses new or changed files
+        for entry in get_catalog(MODEL_DIR).list():
+            file_path = entry["path"]
             filename = os.path.basename(file_path)
-            size_bytes = os.path.getsize(file_path)
+            gguf = entry["gguf"] or {}
 
             models.append(
                 {
                     "filename": filename,
-                    "friendly_name": filename,
-                    "size_mb": round(size_bytes / (1024 * 1024), 2),
+                    "friendly_name": gguf.get("name") or filename,
+                    "size_mb": round(entry["size_bytes"] / (1024 * 1024), 2),
                     "path": file_path,
-                    "repo_id": "",
+                    "repo_id": repo_ids.get(filename, ""),
+                    "architecture": gguf.get("architecture"),
+                    "parameter_count": gguf.get("parameter_count"),
+                    "quantization": gguf.get("quantization"),
+                    "context_length": gguf.get("context_length"),
+                    "vocab_size": gguf.get("vocab_size"),
+                    "has_chat_template": bool(gguf.get("chat_template")),
+                    **self._memory_fields(entry, available, freed_bytes),
+                    "warm_percent": prewarm.warm_percent(file_path),
+                    "prewarm": prewarm.to_dict(prewarm.get(file_path)),
                 }
             )
         return sorted(models, key=lambda x: x["filename"])
 
-    def list_remote_files(self, repo_id: str):
+    def _memory_fields(self, entry: dict, available, freed_bytes: int) -> dict:
+        if not entry["gguf"]:
+            return {"estimated_memory_mb": None, "n_ctx": None, "fits_in_memory": None}
+        try:
+            n_ctx, estimate = plan_context(
+                entry["size_bytes"], entry["gguf"], available=available, freed_bytes=freed_bytes
+            )
+            fits = True if available is not None else None
+        except InsufficientMemoryError as e:
+            n_ctx, estimate, fits = None, e.estimate, False
+        return {
+            "estimated_memory_mb": round(estimate["total_bytes"] / (1024 * 1024), 1),
+            "n_ctx": n_ctx,
+            "fits_in_memory": fits,
+        }
+
+    def _downloaded_repo_ids(self) -> dict:
+        """Map local filenames to the repo they were downloaded from."""
+        return {
+            os.path.basename(d.filename): d.repo_id
+            for d in DownloadManager().get_all_downloads()
+            if d.state == DownloadState.COMPLETED
+        }
+
+    async def list_remote_files(self, repo_id: str):
         # Parse URL if provided
         try:
             repo_id = parse_huggingface_url(repo_id)
         except ValueError:
-            pass  # Already parsed or invalid format, let HfApi handle it
+            pass  # Already parsed or invalid format, let the Hub reject it
 
-        api = HfApi()
         try:
-            files = api.list_repo_tree(repo_id=repo_id, recursive=True)
-            gguf_files = []
-            for f in files:
-                if f.rfilename.endswith(".gguf"):
-                    gguf_files.append(
-                        {
-                            "filename": f.rfilename,
-                            "size_mb": round(f.size / (1024 * 1024), 2)
-                            if f.size
-                            else 0,
-                        }
-                    )
-            return gguf_files
+            # Cached per repo; repeat lookups skip the network entirely
+            return await get_hub_lookup().list_gguf_files(repo_id)
         except Exception as e:
             return {"error": str(e)}
 
@@ -145,26 +153,40 @@ class ModelManager:
             pass  # Already parsed or invalid format, let hf_hub_download handle it
 
         manager = DownloadManager() if download_id else None
-        tqdm_class = None
+        on_progress = None
+        is_cancelled = None
+        throttle = None
 
         # Set up progress tracking if download_id provided
         if manager and download_id:
             manager.set_state(download_id, DownloadState.IN_PROGRESS)
-            tqdm_class = make_progress_tracker_class(download_id, manager)
+            on_progress = make_progress_callback(download_id, manager)
+            is_cancelled = make_cancel_check(download_id, manager)
+            throttle = manager.limiter.consume
 
         try:
             # Determine local file path
             local_filename = os.path.basename(filename)
             local_path = os.path.join(MODEL_DIR, local_filename)
 
-            # Download with progress tracking
-            path = hf_hub_download(
-                repo_id=repo_id,
-                filename=filename,
-                local_dir=MODEL_DIR,
-                local_dir_use_symlinks=False,
-                tqdm_class=tqdm_class,
-            )
+            # Size and SHA256 come from the repo metadata (LFS pointer)
+            info = HfApi().get_paths_info(repo_id, [filename])
+            if not info:
+                raise FileNotFoundError(f"{filename} not found in {repo_id}")
+            remote = info[0]
+            sha256 = remote.lfs.sha256 if remote.lfs else None
+
+            # Parallel ranged download; resumes from <file>.part if interrupted
+            RangedDownload(
+                hf_hub_url(repo_id, filename),
+                local_path,
+                total_bytes=remote.size,
+                sha256=sha256,
+                headers=build_hf_headers(),
+                on_progress=on_progress,
+                is_cancelled=is_cancelled,
+                throttle=throttle,
+            ).run()
 
             if manager and download_id:
                 # Get file size for final update
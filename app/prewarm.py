@@ -0,0 +1,200 @@
+import ctypes
+import ctypes.util
+import mmap
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from app.download_manager import BandwidthLimiter, DownloadManager, DownloadState
+
+# Bytes paged in per step; each step is one madvise + touch + throttle check
+PREWARM_CHUNK_BYTES = 16 * 1024 * 1024
+# Read rate cap in bytes/s (0 = unlimited), and a lower one while inference is running
+PREWARM_BANDWIDTH_LIMIT = int(os.environ.get("PREWARM_BANDWIDTH_LIMIT", "0"))
+PREWARM_INFERENCE_BANDWIDTH_LIMIT = int(os.environ.get("PREWARM_INFERENCE_BANDWIDTH_LIMIT", str(64 * 1024 * 1024)))
+# Seconds a file's page cache measurement is reused by /models (mapping big files isn't free)
+WARM_PERCENT_TTL = float(os.environ.get("WARM_PERCENT_TTL", "30"))
+
+_libc = None
+if hasattr(mmap, "MADV_WILLNEED"):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        _libc.mmap.restype = ctypes.c_void_p
+        _libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+        _libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        _libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+    except (OSError, AttributeError):
+        _libc = None
+
+
+def page_cache_percent(path: str) -> Optional[float]:
+    """
+    How much of a file is in the page cache (0-100), from mincore() on a fresh mapping.
+    None where mincore isn't available.
+    """
+    if _libc is None:
+        return None
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return 100.0
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        addr = _libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            return None
+        try:
+            pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+            vec = (ctypes.c_ubyte * pages)()
+            if _libc.mincore(addr, size, vec) != 0:
+                return None
+            resident = bytes(vec).translate(_LOW_BIT).count(1)
+            return round(resident / pages * 100, 1)
+        finally:
+            _libc.munmap(addr, size)
+    finally:
+        os.close(fd)
+
+
+# mincore sets bit 0 for resident pages; other bits are reserved
+_LOW_BIT = bytes(i & 1 for i in range(256))
+
+
+@dataclass
+class PrewarmInfo:
+    path: str
+    state: DownloadState = DownloadState.PENDING  # Same lifecycle as a download
+    bytes_done: int = 0
+    total_bytes: int = 0
+    error_message: str = ""
+
+
+class PrewarmManager:
+    """
+    Pages GGUF files into the OS page cache in the background, so switching to one reads
+    from memory instead of disk. One file is prewarmed at a time; a new request replaces
+    the running one, since the user has moved on to another model.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._jobs: Dict[str, PrewarmInfo] = {}
+        self._jobs_lock = threading.Lock()
+        self._current: Optional[PrewarmInfo] = None
+        self._warm: Dict[str, tuple] = {}  # path -> (measured at, (size, mtime), percent)
+        self.limiter = BandwidthLimiter(self.current_bandwidth_limit)
+
+    def current_bandwidth_limit(self) -> int:
+        limits = [PREWARM_BANDWIDTH_LIMIT]
+        if PREWARM_INFERENCE_BANDWIDTH_LIMIT and DownloadManager().inference_active():
+            limits.append(PREWARM_INFERENCE_BANDWIDTH_LIMIT)
+        limits = [limit for limit in limits if limit > 0]
+        return min(limits) if limits else 0
+
+    def start(self, path: str) -> PrewarmInfo:
+        """Start prewarming path (no-op if it is already running), cancelling any other file."""
+        with self._jobs_lock:
+            current = self._current
+            if current and current.path == path and current.state in (DownloadState.PENDING, DownloadState.IN_PROGRESS):
+                return current
+            if current and current.state in (DownloadState.PENDING, DownloadState.IN_PROGRESS):
+                current.state = DownloadState.CANCELLED
+            info = PrewarmInfo(path=path, total_bytes=os.path.getsize(path))
+            self._jobs[path] = info
+            self._current = info
+        threading.Thread(target=self._run, args=(info,), daemon=True).start()
+        return info
+
+    def cancel(self, path: str) -> bool:
+        with self._jobs_lock:
+            info = self._jobs.get(path)
+            if info and info.state in (DownloadState.PENDING, DownloadState.IN_PROGRESS):
+                info.state = DownloadState.CANCELLED
+                return True
+        return False
+
+    def get(self, path: str) -> Optional[PrewarmInfo]:
+        with self._jobs_lock:
+            return self._jobs.get(path)
+
+    def warm_percent(self, path: str) -> Optional[float]:
+        """page_cache_percent, measured at most every WARM_PERCENT_TTL seconds per unchanged file."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (stat.st_size, stat.st_mtime_ns)
+        now = time.monotonic()
+        with self._jobs_lock:
+            cached = self._warm.get(path)
+        if cached and cached[1] == key and now - cached[0] < WARM_PERCENT_TTL:
+            return cached[2]
+        percent = page_cache_percent(path)
+        with self._jobs_lock:
+            self._warm[path] = (now, key, percent)
+        return percent
+
+    def _run(self, info: PrewarmInfo):
+        with self._jobs_lock:
+            # Cancelled or superseded before the thread got going
+            if info.state != DownloadState.PENDING:
+                return
+            info.state = DownloadState.IN_PROGRESS
+        try:
+            with open(info.path, "rb") as f:
+                if info.total_bytes == 0:
+                    info.state = DownloadState.COMPLETED
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    self._page_in(info, mm)
+        except (OSError, ValueError) as e:
+            info.error_message = str(e)
+            info.state = DownloadState.FAILED
+            return
+        finally:
+            with self._jobs_lock:
+                self._warm.pop(info.path, None)  # Measure again now the file has been read
+        if info.state == DownloadState.IN_PROGRESS:
+            info.state = DownloadState.COMPLETED
+
+    def _page_in(self, info: PrewarmInfo, mm: mmap.mmap):
+        view = memoryview(mm)
+        try:
+            for offset in range(0, info.total_bytes, PREWARM_CHUNK_BYTES):
+                if info.state != DownloadState.IN_PROGRESS:
+                    return
+                n = min(PREWARM_CHUNK_BYTES, info.total_bytes - offset)
+                if hasattr(mm, "madvise"):
+                    # Queue readahead for the chunk, then fault in one byte per page to wait for it
+                    mm.madvise(mmap.MADV_WILLNEED, offset, n)
+                bytes(view[offset:offset + n:mmap.PAGESIZE])
+                info.bytes_done = offset + n
+                self.limiter.consume(n)
+        finally:
+            view.release()
+
+    def to_dict(self, info: Optional[PrewarmInfo]) -> Optional[dict]:
+        if info is None:
+            return None
+        return {
+            "state": info.state.value,
+            "progress": round(info.bytes_done / info.total_bytes * 100, 1) if info.total_bytes else 100.0,
+            "error_message": info.error_message,
+        }
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+# Size of one Range request. Completed chunks are recorded in the manifest, so this
+# is also the most work a crash or cancel can lose per connection.
+CHUNK_SIZE = 16 * 1024 * 1024
+NUM_CONNECTIONS = 4
+MAX_CHUNK_RETRIES = 3
+READ_SIZE = 1024 * 1024
+
+
+def resume_progress(dest_path: str) -> Optional[Tuple[int, int]]:
+    """(bytes already downloaded, total bytes) from a resume manifest, or None if there is none."""
+    try:
+        with open(dest_path + ".part.json") as f:
+            manifest = json.load(f)
+        total_bytes, chunk_size = manifest["total_bytes"], manifest["chunk_size"]
+        done = manifest["done"]
+    except (OSError, ValueError, KeyError):
+        return None
+    downloaded = sum(min(chunk_size, total_bytes - i * chunk_size) for i in done)
+    return downloaded, total_bytes
+
+
+class RangedDownload:
+    """
+    Download one file over several concurrent HTTP Range connections.
+
+    Chunks are written straight into a preallocated (sparse) `<dest>.part` file.
+    `<dest>.part.json` records which chunks are done, so an interrupted download
+    resumes where it left off. The file is renamed into place only after its
+    SHA256 (when known) has been verified.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        dest_path: str,
+        total_bytes: int,
+        sha256: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        connections: int = NUM_CONNECTIONS,
+        chunk_size: int = CHUNK_SIZE,
+        client: Optional[httpx.Client] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+        throttle: Optional[Callable[[int], None]] = None,
+    ):
+        self.url = url
+        self.dest_path = dest_path
+        self.part_path = dest_path + ".part"
+        self.manifest_path = dest_path + ".part.json"
+        self.total_bytes = total_bytes
+        self.sha256 = sha256
+        self.headers = headers or {}
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.throttle = throttle
+
+        self._client = client
+        self._lock = threading.Lock()
+        self._done: set = set()
+        self._bytes_downloaded = 0
+        self._error: Optional[BaseException] = None
+
+    @property
+    def num_chunks(self) -> int:
+        return -(-self.total_bytes // self.chunk_size)
+
+    def chunk_range(self, index: int):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.total_bytes) - 1
+        return start, end
+
+    def run(self) -> str:
+        """Download (or resume) the file and return its final path."""
+        self._prepare()
+        pending = [i for i in range(self.num_chunks) if i not in self._done]
+
+        if pending:
+            owns_client = self._client is None
+            client = self._client or httpx.Client(
+                follow_redirects=True,
+                timeout=httpx.Timeout(30.0, read=60.0),
+                limits=httpx.Limits(max_connections=self.connections),
+            )
+            try:
+                self._fetch_chunks(client, pending)
+            finally:
+                if owns_client:
+                    client.close()
+
+        self._verify()
+        os.replace(self.part_path, self.dest_path)
+        os.remove(self.manifest_path)
+        return self.dest_path
+
+    def _prepare(self):
+        """Load a matching resume manifest, or start over with a fresh sparse file."""
+        manifest = self._read_manifest()
+        if (
+            manifest
+            and manifest.get("url") == self.url
+            and manifest.get("total_bytes") == self.total_bytes
+            and manifest.get("sha256") == self.sha256
+            and manifest.get("chunk_size") == self.chunk_size
+            and os.path.exists(self.part_path)
+            and os.path.getsize(self.part_path) == self.total_bytes
+        ):
+            self._done = set(manifest.get("done", []))
+        else:
+            self._done = set()
+            os.makedirs(os.path.dirname(self.part_path) or ".", exist_ok=True)
+            with open(self.part_path, "wb") as f:
+                # Extends with a hole: disk blocks are only allocated as chunks land
+                f.truncate(self.total_bytes)
+            self._write_manifest()
+
+        self._bytes_downloaded = sum(
+            self.chunk_range(i)[1] - self.chunk_range(i)[0] + 1 for i in self._done
+        )
+        self._report_progress()
+
+    def _fetch_chunks(self, client: httpx.Client, pending: List[int]):
+        queue = list(reversed(pending))
+        fd = os.open(self.part_path, os.O_WRONLY)
+
+        def worker():
+            while True:
+                with self._lock:
+                    if not queue or self._error is not None:
+                        return
+                    index = queue.pop()
+                try:
+                    self._fetch_chunk(client, fd, index)
+                except BaseException as e:
+                    with self._lock:
+                        if self._error is None:
+                            self._error = e
+                    return
+
+        threads = [
+            threading.Thread(target=worker, daemon=True)
+            for _ in range(min(self.connections, len(pending)))
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.close(fd)
+
+        if self._error is not None:
+            raise self._error
+
+    def _fetch_chunk(self, client: httpx.Client, fd: int, index: int):
+        start, end = self.chunk_range(index)
+        for attempt in range(MAX_CHUNK_RETRIES):
+            written = 0
+            try:
+                headers = {**self.headers, "Range": f"bytes={start}-{end}"}
+                with client.stream("GET", self.url, headers=headers) as response:
+                    if response.status_code != 206 and not (
+                        response.status_code == 200 and start == 0 and end == self.total_bytes - 1
+                    ):
+                        response.raise_for_status()
+                        raise RuntimeError(
+                            f"Server ignored Range request (HTTP {response.status_code})"
+                        )
+                    for data in response.iter_bytes(READ_SIZE):
+                        if self.is_cancelled():
+                            raise InterruptedError("Download cancelled")
+                        if written + len(data) > end - start + 1:
+                            raise RuntimeError("Server sent more data than requested")
+                        os.pwrite(fd, data, start + written)
+                        written += len(data)
+                        self._add_progress(len(data))
+                        if self.throttle:
+                            self.throttle(len(data))
+                if written != end - start + 1:
+                    raise httpx.ReadError(f"Chunk {index} ended early ({written} bytes)")
+                break
+            except (httpx.TransportError, httpx.HTTPStatusError):
+                # Roll the progress back; the whole chunk is fetched again
+                self._add_progress(-written)
+                if attempt == MAX_CHUNK_RETRIES - 1:
+                    raise
+            except BaseException:
+                self._add_progress(-written)
+                raise
+
+        with self._lock:
+            self._done.add(index)
+            self._write_manifest()
+
+    def _add_progress(self, n: int):
+        with self._lock:
+            self._bytes_downloaded += n
+        self._report_progress()
+
+    def _report_progress(self):
+        if self.on_progress:
+            self.on_progress(self._bytes_downloaded, self.total_bytes)
+
+    def _read_manifest(self) -> Optional[dict]:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "url": self.url,
+                    "total_bytes": self.total_bytes,
+                    "sha256": self.sha256,
+                    "chunk_size": self.chunk_size,
+                    "done": sorted(self._done),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.manifest_path)
+
+    def _verify(self):
+        if not self.sha256:
+            return
+        digest = hashlib.sha256()
+        with open(self.part_path, "rb") as f:
+            while data := f.read(READ_SIZE):
+                digest.update(data)
+        if digest.hexdigest() != self.sha256.lower():
+            # Corrupt data can't be resumed from; start clean next time
+            os.remove(self.part_path)
+            os.remove(self.manifest_path)
+            raise ValueError(f"SHA256 mismatch for {os.path.basename(self.dest_path)}")
@@ -1,5 +1,26 @@
-from pydantic import BaseModel
-from typing import List, Optional
+import re
+
+from pydantic import BaseModel, field_validator
+from typing import Dict, List, Literal, Optional
+
+
+class TokenFilter(BaseModel):
+    """Only rank tokens meeting all of the given constraints (applied to the logits)."""
+
+    prefix: Optional[str] = None  # Token text starts with this
+    partial: bool = False  # Also allow tokens that are a shorter prefix of `prefix`
+    classes: Optional[List[Literal["letter", "upper", "lower", "digit", "space", "punct"]]] = None
+    regex: Optional[str] = None  # Token text fully matches this
+
+    @field_validator("regex")
+    @classmethod
+    def check_regex(cls, value):
+        if value is not None:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"Invalid regex: {e}")
+        return value
 
 
 class GenerationRequest(BaseModel):
@@ -8,6 +29,24 @@ class GenerationRequest(BaseModel):
     top_k: int = 40
     top_p: float = 0.95
     repeat_penalty: float = 1.0
+    debug_timing: bool = False  # Include a per-request timing breakdown
+    profile: bool = False  # Save a cProfile trace of this request to disk
+    session_id: Optional[str] = None  # Reuse this session's cached tokenization
+    token_filter: Optional[TokenFilter] = None
+
+
+class RequestTimingsInfo(BaseModel):
+    total_ms: float
+    queue_wait_ms: float
+    tokenize_ms: float
+    prefill_tokens: int
+    prefill_ms: float
+    decode_ms: float
+    sampler_ms: float
+    cache_hit: bool
+    cached_tokens: int
+    llama_perf: Optional[Dict[str, float]] = None
+    profile_path: Optional[str] = None
 
 
 class TokenInfo(BaseModel):
@@ -16,10 +55,49 @@ class TokenInfo(BaseModel):
     logprob: float
     cumulative_prob: Optional[float] = 0.0
     excluded: Optional[bool] = False
+    token_id: Optional[int] = None  # Known when the context was evaluated as token IDs
 
 
 class GenerationResponse(BaseModel):
     candidates: List[TokenInfo]
+    timings: Optional[RequestTimingsInfo] = None
+
+
+class ContextOp(BaseModel):
+    op: Literal["set_text", "append_text", "append_tokens", "truncate", "observe"]
+    text: str = ""  # set_text / append_text
+    token_ids: List[int] = []  # append_tokens; observe: the candidate IDs shown
+    n_tokens: int = 0  # truncate: keep the first n_tokens
+    logprobs: List[float] = []  # observe: the candidates' logprobs
+
+
+class SessionGenerationRequest(BaseModel):
+    base_version: Optional[int] = None  # Session version the ops apply to
+    ops: List[ContextOp] = []
+    temp: float = 0.8
+    top_k: int = 40
+    top_p: float = 0.95
+    repeat_penalty: float = 1.0
+    debug_timing: bool = False
+    profile: bool = False
+    token_filter: Optional[TokenFilter] = None
+
+
+class SessionGenerationResponse(GenerationResponse):
+    session_version: int
+    n_tokens: int
+
+
+class TokenizeRequest(BaseModel):
+    text: str
+    session_id: Optional[str] = None
+
+
+class TokenizeResponse(BaseModel):
+    token_ids: List[int]
+    offsets: List[int]  # Byte offset in the UTF-8 text where each token starts
+    session_id: Optional[str] = None
+    version: Optional[int] = None
 
 
 class BeamPathToken(BaseModel):
@@ -38,19 +116,66 @@ class BeamSearchRequest(BaseModel):
     context: str
     num_paths: int = 3  # Number of paths to generate
     depth: int = 1  # Initial depth (tokens per path)
+    debug_timing: bool = False
+    profile: bool = False
 
 
 class BeamSearchResponse(BaseModel):
     paths: List[BeamPath]
+    timings: Optional[RequestTimingsInfo] = None
 
 
 class SwitchModelRequest(BaseModel):
     filename: str
 
 
+class PrewarmRequest(BaseModel):
+    filename: str
+
+
+class ProcessMemory(BaseModel):
+    pid: int
+    rss_bytes: Optional[int] = None
+    mapped_files: int
+    gguf_mappings: List[str]
+
+
+class TeardownInfo(BaseModel):
+    verified: bool  # Every native handle of the old model was freed
+    leaked_handles: List[str]
+
+
+class ModelSwitchMemory(BaseModel):
+    from_model: Optional[str] = None
+    to_model: str
+    before: List[ProcessMemory]
+    after: List[ProcessMemory]
+    released: bool
+    suspected_leak: bool
+    rss_growth_bytes: int
+    duration: float
+    teardown: Optional[TeardownInfo] = None
+    timestamp: float
+
+
+class MemoryWatchdogResponse(BaseModel):
+    current: List[ProcessMemory]
+    switches: List[ModelSwitchMemory]
+    suspected_leak: bool
+
+
+class PrewarmInfo(BaseModel):
+    filename: str
+    state: str
+    progress: float  # Percent of the file read so far
+    warm_percent: Optional[float] = None  # Percent resident in the page cache, if measurable
+    error_message: str = ""
+
+
 class DownloadModelRequest(BaseModel):
     repo_id: str
     filename: str
+    priority: int = 0  # Higher starts first when downloads are queued
 
 
 class DownloadStartResponse(BaseModel):
@@ -75,3 +200,216 @@ class DownloadStatusInfo(BaseModel):
 class DownloadsStatusResponse(BaseModel):
     downloads: List[DownloadStatusInfo]
     active_count: int
+    queued_count: int = 0
+
+
+class SessionBeamSearchRequest(BaseModel):
+    base_version: Optional[int] = None
+    ops: List[ContextOp] = []
+    node_id: Optional[str] = None  # Branch from this path instead of the context
+    num_paths: int = 3
+    depth: int = 1
+    temp: float = 0.8
+    top_k: int = 40
+    top_p: float = 0.95
+    repeat_penalty: float = 1.0
+
+
+class SessionBeamSearchResponse(BeamSearchResponse):
+    session_version: int
+
+
+class BeamNodeRequest(BaseModel):
+    temp: float = 0.8
+    top_k: int = 40
+    top_p: float = 0.95
+    repeat_penalty: float = 1.0
+
+
+class BeamExtendResponse(BaseModel):
+    path: BeamPath
+
+
+class BeamAdoptResponse(BaseModel):
+    session_version: int
+    text: str
+    candidates: List[TokenInfo]
+
+
+class SpeculativeConfigRequest(BaseModel):
+    mode: Literal["off", "ngram", "draft"] = "off"
+    draft_model: Optional[str] = None  # Filename in the models directory, for mode "draft"
+    num_draft: int = 4  # Tokens drafted per verification pass
+
+
+class SpeculativeStatsInfo(BaseModel):
+    passes: int
+    drafted: int
+    accepted: int
+    generated: int
+    acceptance_rate: float
+    tokens_per_pass: float
+
+
+class SpeculativeConfigResponse(BaseModel):
+    mode: str
+    draft_model: Optional[str] = None
+    num_draft: int
+    stats: SpeculativeStatsInfo  # Totals for the session
+
+
+class SessionGenerateRequest(BaseModel):
+    base_version: Optional[int] = None
+    ops: List[ContextOp] = []
+    max_tokens: int = 16
+    greedy: bool = False  # Take the top candidate instead of sampling
+    temp: float = 0.8
+    top_k: int = 40
+    top_p: float = 0.95
+    repeat_penalty: float = 1.0
+    debug_timing: bool = False
+    profile: bool = False
+
+
+class GeneratedToken(BaseModel):
+    token: str
+    token_id: int
+    prob: float  # 0-1, as in beam paths
+    candidates: List[TokenInfo]  # Distribution the token was chosen from
+
+
+class SessionGenerateResponse(BaseModel):
+    tokens: List[GeneratedToken]
+    text: str  # Generated text (not appended to the session)
+    session_version: int
+    speculative: SpeculativeStatsInfo  # This request only
+    timings: Optional[RequestTimingsInfo] = None
+
+
+class ChatMessage(BaseModel):
+    role: str  # "system", "user" or "assistant"
+    content: str
+
+
+class ChatRequest(BaseModel):
+    messages: List[ChatMessage]
+    assistant_prefix: str = ""  # The reply generated so far
+    session_id: Optional[str] = None  # Routes to the same worker when LLM_WORKERS is set
+    temp: float = 0.8
+    top_k: int = 40
+    top_p: float = 0.95
+    repeat_penalty: float = 1.0
+    debug_timing: bool = False
+    profile: bool = False
+
+
+class ChatResponse(GenerationResponse):
+    prompt: str  # The conversation rendered with the model's chat template
+    n_tokens: int
+    restored_tokens: int  # Prompt tokens restored from a cached turn boundary (0 if none)
+    stop: List[str]  # Texts that end the assistant's turn
+
+
+class ChatRenderRequest(BaseModel):
+    messages: List[ChatMessage]
+    add_generation_prompt: bool = False
+
+
+class ChatRenderResponse(BaseModel):
+    prompt: str
+
+
+class SessionSweepRequest(BaseModel):
+    base_version: Optional[int] = None
+    ops: List[ContextOp] = []
+    # Every combination of these is post-processed from one evaluation of the context
+    temps: List[float] = [0.8]
+    top_ks: List[int] = [40]
+    top_ps: List[float] = [0.95]
+    repeat_penalties: List[float] = [1.0]
+
+
+class SweepToken(BaseModel):
+    token: str
+    token_id: Optional[int] = None
+    logprob: float  # Raw, before any sampling settings
+
+
+class SweepConfig(BaseModel):
+    temp: float
+    top_k: int
+    top_p: float
+    repeat_penalty: float
+    # Candidates in display order: indexes into `tokens` plus TokenInfo fields as parallel arrays
+    index: List[int]
+    prob: List[float]
+    logprob: List[float]
+    cumulative_prob: List[float]
+    excluded: List[bool]
+
+
+class SessionSweepResponse(BaseModel):
+    tokens: List[SweepToken]
+    configs: List[SweepConfig]
+    session_version: int
+
+
+class BatchJobRequest(BaseModel):
+    input_file: str  # JSONL in the batches directory, one {"prompt": ...} object per line
+    output_file: Optional[str] = None  # Defaults to <input name>.out.jsonl
+    temp: float = 0.8
+    top_k: int = 40
+    top_p: float = 0.95
+    repeat_penalty: float = 1.0
+    resume: bool = False  # Keep the output's finished prompts and evaluate the rest
+
+
+class BatchJobInfo(BaseModel):
+    job_id: str
+    input_file: str
+    output_file: str
+    state: str
+    progress: float
+    prompts_done: int
+    total_prompts: int
+    failed_prompts: int
+    error_message: str
+    started_at: Optional[str] = None
+    completed_at: Optional[str] = None
+
+
+class BatchJobsResponse(BaseModel):
+    jobs: List[BatchJobInfo]
+
+
+class CoalesceStats(BaseModel):
+    executed: int  # Inference calls that ran
+    coalesced: int  # Calls that waited for an identical in-flight call instead
+    in_flight: int
+
+
+class InferenceStatsResponse(BaseModel):
+    coalescing: CoalesceStats
+
+
+class HistoryStepRequest(BaseModel):
+    # Sampling settings to show the restored distribution with
+    temp: float = 0.8
+    top_k: int = 40
+    top_p: float = 0.95
+
+
+class HistoryStepResponse(BaseModel):
+    text: str
+    session_version: int
+    n_tokens: int
+    candidates: List[TokenInfo]  # Empty when the distribution wasn't recorded
+    position: int
+    steps: int
+
+
+class HistoryInfo(BaseModel):
+    steps: int
+    position: int  # Steps before this one are done; the rest can be redone
+    capacity: int
+    nbytes: int
@@ -0,0 +1,373 @@
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from app.beam_tree import BeamTree
+from app.history import SessionHistory
+from app.speculative import SpeculativeConfig, SpeculativeStats
+
+MAX_SESSIONS = 256
+# Distributions handed out ahead of the context (generated or beam steps) kept per session
+MAX_OFFERED_STEPS = 64
+# Tokens before an edit that are re-tokenized too, since BPE merges can span the edit point
+STABLE_MARGIN = 2
+
+
+@dataclass
+class Session:
+    session_id: str
+    data: bytes = b""  # UTF-8 encoded context
+    token_ids: List[int] = field(default_factory=list)
+    offsets: List[int] = field(default_factory=list)  # Byte offset where each token starts
+    n_prefix: int = 0  # Leading tokens with no text (BOS)
+    model_path: Optional[str] = None
+    version: int = 0
+    last_used: float = field(default_factory=time.time)
+    beam_tree: Optional[BeamTree] = field(default=None, repr=False)
+    speculative: SpeculativeConfig = field(default_factory=SpeculativeConfig)
+    speculative_stats: SpeculativeStats = field(default_factory=SpeculativeStats)
+    # (version, model_path, top_k, raw top logprobs) for the current context
+    top_logprobs: Optional[tuple] = field(default=None, repr=False)
+    history: SessionHistory = field(default_factory=SessionHistory, repr=False)
+    # (token_ids, candidate IDs, logprobs) of the distribution last shown for the context
+    shown: Optional[tuple] = field(default=None, repr=False)
+    # Context length -> (hash of the tokens before it, candidate IDs, logprobs) for distributions
+    # the client got past the context, recorded if it goes on to take those tokens
+    offered: OrderedDict = field(default_factory=OrderedDict, repr=False)
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    @property
+    def text(self) -> str:
+        return self.data.decode("utf-8", errors="ignore")
+
+
+def _piece_offsets(pieces: List[bytes], start: int) -> List[int]:
+    offsets = []
+    pos = start
+    for piece in pieces:
+        offsets.append(pos)
+        pos += len(piece)
+    return offsets
+
+
+def tokenize_with_offsets(data: bytes, engine):
+    """Tokenize `data` as a full prompt. Returns (token_ids, offsets, n_prefix)."""
+    prefix = engine.prefix_tokens()
+    ids = engine.tokenize(data) if data else []
+    offsets = [0] * len(prefix) + _piece_offsets(engine.token_pieces(ids), 0)
+    return prefix + ids, offsets, len(prefix)
+
+
+class SessionVersionError(Exception):
+    """Raised when a client's delta is based on a stale session version."""
+
+    def __init__(self, message: str, version: int):
+        super().__init__(message)
+        self.version = version
+
+
+class SessionManager:
+    """Holds per-client context state, most importantly an incremental tokenization cache."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+    def get_session(self, session_id: str) -> Optional[Session]:
+        with self._sessions_lock:
+            session = self._sessions.get(session_id)
+            if session:
+                self._sessions.move_to_end(session_id)
+                session.last_used = time.time()
+            return session
+
+    def get_or_create(self, session_id: str) -> Session:
+        with self._sessions_lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id=session_id)
+                self._sessions[session_id] = session
+                # Evict least recently used sessions
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_used = time.time()
+            return session
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._sessions_lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def sync_text(self, session_id: str, text: str, engine) -> Session:
+        """
+        Bring a session's cached tokenization up to date with `text`.
+        Only the tail after the last stable token boundary is re-tokenized.
+        """
+        session = self.get_or_create(session_id)
+        data = text.encode("utf-8")
+        with session.lock:
+            model_path = engine.get_current_model()
+            if session.model_path != model_path or not session.token_ids:
+                self._tokenize_full(session, data, engine)
+            elif data != session.data:
+                if not self._tokenize_tail(session, data, engine):
+                    self._tokenize_full(session, data, engine)
+            return session
+
+    def apply_ops(self, session_id: str, base_version: Optional[int], ops: list, engine) -> Session:
+        """
+        Apply context deltas (set_text, append_text, append_tokens, truncate) to a session.
+        base_version must match the session's version unless the first op is set_text.
+        An observe op reports the distribution the client showed for the context so far
+        (from its cache), so the token taken next is recorded like one after /next-tokens.
+        """
+        session = self.get_or_create(session_id)
+        with session.lock:
+            resync = bool(ops) and ops[0].op == "set_text"
+            if not resync:
+                if base_version is None or base_version != session.version:
+                    raise SessionVersionError("Session version mismatch", session.version)
+                if session.model_path != engine.get_current_model():
+                    # Token IDs from another model are meaningless; make the client resend text
+                    raise SessionVersionError("Model changed, resend context", session.version)
+
+            for op in ops:
+                before = session.token_ids
+                if op.op == "observe":
+                    session.shown = (list(session.token_ids), list(op.token_ids), list(op.logprobs))
+                    continue
+                if op.op == "set_text":
+                    self.sync_text(session_id, op.text, engine)
+                elif op.op == "append_text":
+                    data = session.data + op.text.encode("utf-8")
+                    if not self._tokenize_tail(session, data, engine):
+                        self._tokenize_full(session, data, engine)
+                elif op.op == "append_tokens":
+                    self._append_tokens(session, op.token_ids, engine)
+                elif op.op == "truncate":
+                    self._truncate(session, op.n_tokens)
+                self._record_choice(session, before)
+            return session
+
+    def observe(self, session: Session, token_ids: List[int], candidates: list):
+        """Remember the candidates shown after token_ids, to record with the token taken next."""
+        if any(c.get("token_id") is None for c in candidates):
+            return
+        with session.lock:
+            session.shown = (
+                token_ids,
+                [c["token_id"] for c in candidates],
+                [c["logprob"] for c in candidates],
+            )
+
+    def offer(self, session: Session, prompt_tokens: List[int], steps: list):
+        """Remember the candidates at each generated step after prompt_tokens, in case the client takes them."""
+        with session.lock:
+            tokens = list(prompt_tokens)
+            for step in steps:
+                candidates = step["candidates"]
+                if any(c.get("token_id") is None for c in candidates):
+                    return
+                self._offer(session, tokens, [c["token_id"] for c in candidates], [c["logprob"] for c in candidates])
+                tokens.append(step["token_id"])
+
+    def _offer(self, session: Session, token_ids: List[int], candidate_ids: List[int], logprobs: List[float]):
+        n = len(token_ids)
+        session.offered.pop(n, None)
+        session.offered[n] = (hash(tuple(token_ids)), list(candidate_ids), list(logprobs))
+        while len(session.offered) > MAX_OFFERED_STEPS:
+            session.offered.popitem(last=False)
+
+    def _record_choice(self, session: Session, before: List[int]):
+        """Add history steps for new tokens taken after a distribution that was shown or offered."""
+        tokens = session.token_ids
+        common = len(os.path.commonprefix([before, tokens]))
+        shown = session.shown
+        if shown is not None and tokens[:len(shown[0])] != shown[0]:
+            shown = session.shown = None  # Edited before that point
+        for n in range(common, len(tokens)):
+            if shown is not None and len(shown[0]) == n:
+                _, candidate_ids, logprobs = shown
+                session.shown = None
+            elif n in session.offered and session.offered[n][0] == hash(tuple(tokens[:n])):
+                _, candidate_ids, logprobs = session.offered[n]
+            else:
+                continue
+            session.history.record(n, tokens[n], candidate_ids, logprobs)
+        for n in [n for n in session.offered if n < len(tokens)]:
+            del session.offered[n]  # Taken, or passed by with other tokens
+
+    def undo(self, session_id: str) -> Session:
+        """
+        Step back before the last recorded token: the context is cut to where its
+        distribution was shown, and that distribution is shown again.
+        Raises KeyError if there is nothing to undo.
+        """
+        session = self.get_session(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        with session.lock:
+            history = session.history
+            if history.position == 0:
+                raise KeyError(session_id)
+            step = history.step(history.position - 1)
+            if len(session.token_ids) < step["context_len"]:
+                raise KeyError(session_id)  # The context was edited back past this step
+            self._truncate(session, step["context_len"])
+            history.position -= 1
+            session.shown = (list(session.token_ids), step["candidate_ids"], step["logprobs"])
+            return session
+
+    def redo(self, session_id: str, engine) -> Session:
+        """Re-take the token of the next undone step. Raises KeyError if there is none."""
+        session = self.get_session(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        with session.lock:
+            history = session.history
+            if history.position >= history.steps:
+                raise KeyError(session_id)
+            step = history.step(history.position)
+            if len(session.token_ids) != step["context_len"]:
+                raise KeyError(session_id)  # The context has moved on since the undo
+            self._append_tokens(session, [step["token_id"]], engine)
+            history.position += 1
+            session.shown = None
+            if history.position < history.steps:
+                following = history.step(history.position)
+                if following["context_len"] == len(session.token_ids):
+                    session.shown = (list(session.token_ids), following["candidate_ids"], following["logprobs"])
+            return session
+
+    def top_logprobs(self, session: Session, engine, top_k: int, timings=None) -> list:
+        """
+        Raw top logprobs after the session's context. Kept until the context changes, so
+        requests that only change sampling settings don't evaluate the model again.
+        """
+        with session.lock:
+            key = (session.version, session.model_path)
+            cached = session.top_logprobs
+            if cached and cached[:2] == key and cached[2] >= top_k:
+                return cached[3][:top_k]
+            top_logprobs = engine.get_top_logprobs(list(session.token_ids), top_k, timings)
+            session.top_logprobs = key + (top_k, top_logprobs)
+            return top_logprobs
+
+    def beam_tree(self, session: Session) -> BeamTree:
+        """Return the session's beam tree, starting a fresh one if the context or model has moved on."""
+        with session.lock:
+            tree = session.beam_tree
+            if tree is None or tree.root.token_ids != session.token_ids or tree.model_path != session.model_path:
+                tree = BeamTree(session.token_ids, session.text, session.model_path)
+                session.beam_tree = tree
+            return tree
+
+    def beam_node(self, session: Session, node_id: str, engine):
+        """A node of the session's beam tree, or None if it's gone or the tree is from another model."""
+        tree = session.beam_tree
+        if tree is None or tree.model_path != session.model_path or session.model_path != engine.get_current_model():
+            return None
+        return tree.get(node_id)
+
+    def adopt_beam_node(self, session_id: str, node_id: str, engine) -> Session:
+        """
+        Move the session's context to the end of a beam path. The path's tokens are appended
+        as-is and the tree is re-rooted there, so its cached distributions stay usable.
+        """
+        session = self.get_session(session_id)
+        if session is None:
+            raise KeyError(node_id)
+        with session.lock:
+            node = self.beam_node(session, node_id, engine)
+            tree = session.beam_tree
+            if node is None or tree.root.token_ids != session.token_ids:
+                raise KeyError(node_id)
+            path_tokens = tree.path_tokens(node)
+            # The distributions along the path were shown as it was built; record the tokens taken
+            before = session.token_ids
+            for n_tokens, top_logprobs in tree.path_distributions(node):
+                self._offer(
+                    session,
+                    path_tokens[:n_tokens],
+                    [token_id for _, _, token_id in top_logprobs],
+                    [logprob for _, logprob, _ in top_logprobs],
+                )
+            self._append_tokens(session, path_tokens[len(session.token_ids):], engine)
+            self._record_choice(session, before)
+            tree.reroot(node, session.text)
+            return session
+
+    def _append_tokens(self, session: Session, token_ids: List[int], engine):
+        """Append exact token IDs (e.g. a chosen candidate) without re-tokenizing anything."""
+        if not token_ids:
+            return
+        pieces = engine.token_pieces(token_ids)
+        session.token_ids = session.token_ids + list(token_ids)
+        session.offsets = session.offsets + _piece_offsets(pieces, len(session.data))
+        session.data = session.data + b"".join(pieces)
+        session.version += 1
+
+    def _truncate(self, session: Session, n_tokens: int):
+        n_tokens = max(n_tokens, session.n_prefix)
+        if n_tokens >= len(session.token_ids):
+            return
+        session.data = session.data[: session.offsets[n_tokens]]
+        session.token_ids = session.token_ids[:n_tokens]
+        session.offsets = session.offsets[:n_tokens]
+        session.version += 1
+
+    def _tokenize_full(self, session: Session, data: bytes, engine):
+        if session.model_path != engine.get_current_model():
+            # Token IDs from another model are meaningless
+            session.history.clear()
+            session.shown = None
+            session.offered.clear()
+        session.token_ids, session.offsets, session.n_prefix = tokenize_with_offsets(data, engine)
+        session.data = data
+        session.model_path = engine.get_current_model()
+        session.version += 1
+
+    def _tokenize_tail(self, session: Session, data: bytes, engine) -> bool:
+        """Re-tokenize from just before the first changed byte. Returns False to request a full pass."""
+        if data.startswith(session.data):
+            common = len(session.data)  # Plain append, the common case
+        else:
+            common = len(os.path.commonprefix([session.data, data]))
+        # Last token starting at or before the first changed byte may have changed
+        changed = bisect.bisect_right(session.offsets, common) - 1
+        start = changed - STABLE_MARGIN
+        if start <= session.n_prefix:
+            return False
+
+        tail_start = session.offsets[start]
+        tail = data[tail_start:]
+        ids = engine.tokenize(tail) if tail else []
+        pieces = engine.token_pieces(ids)
+        # Tokenizers that rewrite text (e.g. a SentencePiece space prefix) can't be spliced
+        if sum(len(p) for p in pieces) != len(tail):
+            return False
+
+        session.token_ids = session.token_ids[:start] + ids
+        session.offsets = session.offsets[:start] + _piece_offsets(pieces, tail_start)
+        session.data = data
+        session.version += 1
+        return True
@@ -0,0 +1,79 @@
+import json
+import threading
+from typing import Callable, Dict, Hashable
+
+
+def call_key(*parts) -> tuple:
+    """Hashable key for a call's arguments: lists become tuples, dicts canonical JSON."""
+    key = []
+    for part in parts:
+        if isinstance(part, dict):
+            part = json.dumps(part, sort_keys=True)
+        elif isinstance(part, list):
+            part = tuple(part)
+        key.append(part)
+    return tuple(key)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is running, further calls
+    with the same key wait for it and share its result (or exception) instead of running.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0  # Calls that ran
+        self.coalesced = 0  # Calls answered by another call's result
+
+    def do(self, key: Hashable, fn: Callable, on_wait: Callable = None):
+        """
+        Run fn() unless a call with the same key is in flight; then wait for that one.
+        on_wait, if given, is a context manager factory wrapped around the wait (e.g. timing).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.executed += 1
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            if on_wait is None:
+                call.done.wait()
+            else:
+                with on_wait():
+                    call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,162 @@
+import random
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+DEFAULT_NUM_DRAFT = 4
+MAX_NUM_DRAFT = 16
+# Longest suffix n-gram looked up in the context when drafting by prompt lookup
+NGRAM_MAX = 3
+
+
+@dataclass
+class SpeculativeConfig:
+    mode: str = "off"  # "off", "ngram" (prompt lookup) or "draft" (small draft model)
+    draft_model: Optional[str] = None  # Path of the draft GGUF when mode is "draft"
+    num_draft: int = DEFAULT_NUM_DRAFT  # Tokens proposed per verification pass
+
+
+@dataclass
+class SpeculativeStats:
+    passes: int = 0  # Batched verification passes of the main model
+    drafted: int = 0
+    accepted: int = 0
+    generated: int = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+    def add(self, other: "SpeculativeStats"):
+        self.passes += other.passes
+        self.drafted += other.drafted
+        self.accepted += other.accepted
+        self.generated += other.generated
+
+    def to_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "acceptance_rate": self.acceptance_rate,
+            # Tokens per main-model pass; 1.0 is plain one-token-at-a-time decoding
+            "tokens_per_pass": self.generated / self.passes if self.passes else 0.0,
+        }
+
+
+def ngram_draft(tokens: List[int], n_draft: int, max_ngram: int = NGRAM_MAX) -> List[int]:
+    """
+    Prompt-lookup drafting: find the most recent earlier occurrence of the context's
+    last n tokens and propose whatever followed it. Free, and good on repetitive text.
+    """
+    for n in range(min(max_ngram, len(tokens) - 1), 0, -1):
+        suffix = tokens[-n:]
+        for start in range(len(tokens) - n - 1, -1, -1):
+            if tokens[start:start + n] == suffix:
+                follow = tokens[start + n:start + n + n_draft]
+                if follow:
+                    return follow
+    return []
+
+
+def propose(engine, config: Optional[SpeculativeConfig], tokens: List[int], n_draft: int) -> List[int]:
+    """Draft up to n_draft tokens following `tokens` according to the session's config."""
+    if config is None or n_draft <= 0:
+        return []
+    n_draft = min(n_draft, config.num_draft)
+    if config.mode == "ngram":
+        return ngram_draft(tokens, n_draft)
+    if config.mode == "draft" and config.draft_model:
+        return engine.draft_tokens(config.draft_model, tokens, n_draft)
+    return []
+
+
+def _choose(valid: List[dict], proposed: Optional[int], greedy: bool, rng) -> dict:
+    """
+    Pick the next token from the main model's candidates, given a drafted token.
+
+    Drafts are deterministic proposals, so the draft distribution is one-hot: the drafted
+    token is accepted with its probability under the main model, and a rejection samples
+    from the remaining candidates. Either way the result is distributed exactly as a
+    direct sample from the main model would be.
+    """
+    if greedy:
+        return valid[0]
+    total = sum(c["prob"] for c in valid)
+    if proposed is not None:
+        drafted = next((c for c in valid if c["token_id"] == proposed), None)
+        if drafted is not None:
+            if rng.random() * total < drafted["prob"]:
+                return drafted
+            rest = [c for c in valid if c is not drafted]
+            if rest:
+                valid, total = rest, total - drafted["prob"]
+    pick = rng.random() * total
+    for c in valid:
+        pick -= c["prob"]
+        if pick <= 0:
+            return c
+    return valid[-1]
+
+
+def generate(
+    engine,
+    prompt_tokens: List[int],
+    prompt_text: str,
+    max_tokens: int,
+    config: Optional[SpeculativeConfig] = None,
+    greedy: bool = False,
+    temp: float = 0.8,
+    top_k: int = 40,
+    top_p: float = 0.95,
+    repeat_penalty: float = 1.0,
+    stats: Optional[SpeculativeStats] = None,
+    timings=None,
+    rng=random,
+) -> List[dict]:
+    """
+    Generate up to max_tokens tokens, verifying drafted tokens in one batched pass of the
+    main model. Greedy takes the top non-excluded candidate each step (as beam extension
+    does); otherwise tokens are sampled from the non-excluded candidates (as auto-infer does).
+
+    Returns one step per token: token, token_id, prob (0-1), the full candidate list at
+    that position, and the raw top logprobs it was computed from.
+    """
+    stats = stats if stats is not None else SpeculativeStats()
+    stop_tokens = set(engine.stop_tokens())
+    tokens = list(prompt_tokens)
+    text = prompt_text
+    steps = []
+
+    while len(steps) < max_tokens:
+        # Verification always yields one token past the draft, so draft one fewer than needed
+        draft = propose(engine, config, tokens, max_tokens - len(steps) - 1)
+        rows = engine.verify_top_logprobs(tokens, draft, top_k, timings=timings)
+        stats.passes += 1
+        stats.drafted += len(draft)
+
+        for i, top_logprobs in enumerate(rows):
+            candidates = engine.postprocess_candidates(top_logprobs, text, temp, top_p, repeat_penalty)
+            valid = [c for c in candidates if not c.get("excluded", False)]
+            if not valid:
+                return steps
+            proposed = draft[i] if i < len(draft) else None
+            choice = _choose(valid, proposed, greedy, rng)
+
+            steps.append({
+                "token": choice["token"],
+                "token_id": choice["token_id"],
+                "prob": choice["prob"] / 100.0,
+                "candidates": candidates,
+                "top_logprobs": top_logprobs,
+            })
+            stats.generated += 1
+            tokens.append(choice["token_id"])
+            text += choice["token"]
+
+            accepted = proposed is not None and choice["token_id"] == proposed
+            stats.accepted += accepted
+
+            if choice["token_id"] in stop_tokens or len(steps) >= max_tokens:
+                return steps
+            if not accepted:
+                break  # The rest of the draft followed a different token
+
+    return steps
@@ -4,12 +4,16 @@ const tempSlider = document.getElementById('temp-slider');
 const topkSlider = document.getElementById('topk-slider');
 const toppSlider = document.getElementById('topp-slider');
 const penaltySlider = document.getElementById('penalty-slider');
+const filterModeSelect = document.getElementById('filter-mode');
+const filterInput = document.getElementById('filter-input');
 const themeToggleBtn = document.getElementById('theme-toggle');
 const starterSelect = document.getElementById('starter-select');
 const clearContextBtn = document.getElementById('clear-context');
 const syntaxToggleBtn = document.getElementById('syntax-toggle');
 const revealToggleBtn = document.getElementById('reveal-toggle');
 const autoInferBtn = document.getElementById('auto-infer');
+const historyUndoBtn = document.getElementById('history-undo');
+const historyRedoBtn = document.getElementById('history-redo');
 
 // Chat mode elements
 const modeToggles = document.querySelectorAll('.mode-toggle');
@@ -22,6 +26,9 @@ const chatUserInput = document.getElementById('chat-user-input');
 const chatSendBtn = document.getElementById('chat-send-btn');
 
 // State
+const SESSION_ID = newSessionId();  // Lets the server keep this tab's context cached
+let sessionVersion = null;  // Server-side context version our deltas are based on
+let sessionText = '';  // Context text as of sessionVersion
 let debounceTimer;
 let autoInferRunning = false;
 let isLoadingCandidates = false;
@@ -35,7 +42,7 @@ let consecutiveErrors = 0;  // Track consecutive API errors
 
 // Downloads state
 let downloads = {};
-let downloadPollInterval = null;
+let downloadEvents = null;
 
 // Beam search state
 let beamPaths = [];
@@ -53,6 +60,26 @@ let tokensHidden = false;
 let currentAssistantContent = '';
 let isFirstAssistantToken = false;  // Track first token to strip leading whitespace
 
+// crypto.randomUUID() only exists in secure contexts (HTTPS or localhost), so build a
+// v4 UUID from getRandomValues when it's missing, or from Math.random as a last resort
+function newSessionId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    const bytes = new Uint8Array(16);
+    if (window.crypto && crypto.getRandomValues) {
+        crypto.getRandomValues(bytes);
+    } else {
+        for (let i = 0; i < bytes.length; i++) {
+            bytes[i] = Math.floor(Math.random() * 256) ^ ((Date.now() >> (i % 4) * 8) & 0xff);
+        }
+    }
+    bytes[6] = (bytes[6] & 0x0f) | 0x40;
+    bytes[8] = (bytes[8] & 0x3f) | 0x80;
+    const hex = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+    return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-${hex.slice(12, 16)}-${hex.slice(16, 20)}-${hex.slice(20)}`;
+}
+
 // Theme switching
 function setTheme(theme) {
     document.documentElement.setAttribute('data-theme', theme);
@@ -133,10 +160,8 @@ function switchMode(mode) {
         contextMode.classList.add('active');
         chatMode.classList.remove('active');
         chatMode.classList.add('hidden');
-        // Sync chat messages to context textarea
-        syncChatToContext();
-        // Refresh candidates for the context
-        fetchCandidates();
+        // Sync chat messages to context textarea, then refresh candidates for it
+        syncChatToContext().then(fetchCandidates);
     } else {
         chatMode.classList.remove('hidden');
         chatMode.classList.add('active');
@@ -152,8 +177,7 @@ function switchMode(mode) {
             currentCandidates = [];
         } else {
             // Sync to context and fetch candidates
-            syncChatToContext();
-            fetchCandidates();
+            syncChatToContext().then(fetchCandidates);
         }
     }
 }
@@ -180,6 +204,36 @@ if (starterSelect) {
 }
 
 // Clear context button
+// Undo/redo through the session's server-side history: each step's distribution was
+// recorded when it was shown, so going back needs no inference
+async function stepHistory(direction) {
+    if (currentMode !== 'context' || autoInferRunning || contextInput.value !== sessionText) return;
+    try {
+        const res = await fetch(`/sessions/${SESSION_ID}/history/${direction}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(samplingParams())
+        });
+        if (!res.ok) return;  // Nothing to undo/redo
+        const data = await res.json();
+        contextInput.value = data.text;
+        sessionText = data.text;
+        sessionVersion = data.session_version;
+        updateSyntaxHighlight();
+        if (data.candidates.length && !tokenFilter()) {
+            candidateCachePut(candidateCacheKey(data.text, samplingParams()), data.candidates);
+            renderCandidates(data.candidates);
+        } else {
+            fetchCandidates();
+        }
+    } catch (e) {
+        console.error('History step failed:', e);
+    }
+}
+
+historyUndoBtn.addEventListener('click', () => stepHistory('undo'));
+historyRedoBtn.addEventListener('click', () => stepHistory('redo'));
+
 if (clearContextBtn) {
     clearContextBtn.addEventListener('click', () => {
         if (currentMode === 'chat') {
@@ -251,6 +305,53 @@ function flashSelectedToken(token) {
     }
 }
 
+// Auto-infer plans ahead: one /generate request decodes several tokens (drafted and verified
+// in batches when the session has speculative decoding on), and each step's distribution
+// goes into the candidate cache, so the next few steps need no round trip.
+const AUTO_INFER_PLAN_TOKENS = 8;
+let autoInferPlan = [];  // [{ text, token }]: the token sampled server-side after `text`
+let planAbort = null;
+
+async function fetchAutoInferPlan() {
+    const text = contextInput.value;
+    // Planned tokens are sampled without the token filter
+    if (!text || planAbort || currentMode !== 'context' || tokenFilter()) return;
+    const params = samplingParams();
+    const controller = new AbortController();
+    planAbort = controller;
+    try {
+        const response = await postSessionRequest('/generate', text, {
+            ...params,
+            max_tokens: AUTO_INFER_PLAN_TOKENS
+        }, controller.signal);
+        if (!response.ok) return;
+        const data = await response.json();
+        sessionVersion = data.session_version;
+        sessionText = text;
+        const plan = [];
+        let context = text;
+        for (const step of data.tokens) {
+            candidateCachePut(candidateCacheKey(context, params), step.candidates);
+            plan.push({ text: context, token: step.token });
+            context += step.token;
+        }
+        autoInferPlan = plan;
+    } catch (e) {
+        if (e.name !== 'AbortError') console.error('[AutoInfer] Plan error:', e.message);
+    } finally {
+        if (planAbort === controller) planAbort = null;
+    }
+}
+
+// The planned token for the current text, if the plan still matches it
+function nextPlannedToken() {
+    const text = contextInput.value;
+    while (autoInferPlan.length && autoInferPlan[0].text !== text) {
+        autoInferPlan.shift();
+    }
+    return autoInferPlan.length ? autoInferPlan.shift().token : null;
+}
+
 function startAutoInfer() {
     autoInferRunning = true;
     autoInferBtn.textContent = '■';
@@ -276,7 +377,11 @@ function startAutoInfer() {
         );
         if (!eligible.length) return;  // No eligible tokens
 
-        const selected = weightedRandom(eligible);
+        const planned = nextPlannedToken();
+        const selected = (planned !== null && eligible.find(c => c.token === planned)) || weightedRandom(eligible);
+        if (autoInferPlan.length < 2) {
+            fetchAutoInferPlan();
+        }
         const scheduledGenId = candidatesGenerationId;
         pendingSelection = { token: selected.token, genId: scheduledGenId };
         flashSelectedToken(selected.token);
@@ -303,55 +408,305 @@ function stopAutoInfer() {
     autoInferInterval = null;
     pendingSelection = null;
     lastSelectedToken = null;
+    autoInferPlan = [];
+    if (planAbort) {
+        planAbort.abort();
+    }
     if (selectionTimeoutId) {
         clearTimeout(selectionTimeoutId);
         selectionTimeoutId = null;
     }
 }
 
+// Distributions shown from the candidate cache since the last sync, as [{ text, candidates }].
+// The server never saw them, so the next request reports them with observe ops, and the
+// tokens taken after them still go into the session's history.
+const MAX_CACHE_OBSERVATIONS = 32;
+let cacheObservations = [];
+
+function observeCachedCandidates(text, candidates) {
+    if (candidates.some(c => c.token_id === null)) return;
+    cacheObservations = cacheObservations.filter(o => o.text !== text);
+    cacheObservations.push({ text, candidates });
+    if (cacheObservations.length > MAX_CACHE_OBSERVATIONS) cacheObservations.shift();
+}
+
+// Describe how to get from the server's copy of the context to `text`
+function buildContextOps(text) {
+    if (sessionVersion !== null && text.startsWith(sessionText)) {
+        // Observations on the way to `text`, shortest first; the rest are for other branches
+        cacheObservations = cacheObservations
+            .filter(o => o.text.startsWith(sessionText) && text.startsWith(o.text))
+            .sort((a, b) => a.text.length - b.text.length);
+        const ops = [];
+        let position = sessionText.length;
+        for (const { text: observed, candidates } of cacheObservations) {
+            if (observed.length > position) {
+                ops.push({ op: 'append_text', text: observed.slice(position) });
+                position = observed.length;
+            }
+            ops.push({
+                op: 'observe',
+                token_ids: candidates.map(c => c.token_id),
+                logprobs: candidates.map(c => c.logprob)
+            });
+        }
+        if (text.length > position) {
+            ops.push({ op: 'append_text', text: text.slice(position) });
+        }
+        return ops;
+    }
+    cacheObservations = [];
+    return [{ op: 'set_text', text: text }];
+}
+
+function samplingParams() {
+    return {
+        temp: parseFloat(tempSlider.value),
+        top_k: parseInt(topkSlider.value),
+        top_p: parseFloat(toppSlider.value),
+        repeat_penalty: parseFloat(penaltySlider.value)
+    };
+}
+
+// Token filter (see TokenFilter in app/schemas.py), or null when the filter box is empty.
+// Spaces matter: "Starts with ' th'" asks for word-initial tokens.
+function tokenFilter() {
+    const value = filterInput.value;
+    if (!value) return null;
+    return filterModeSelect.value === 'regex' ? { regex: value } : { prefix: value };
+}
+
+// Sampling parameters plus the token filter, when one is set: the candidate request body
+function candidateParams() {
+    const filter = tokenFilter();
+    return filter ? { ...samplingParams(), token_filter: filter } : samplingParams();
+}
+
+// POST to a session endpoint with context deltas, resyncing once if the server's copy is stale
+async function postSessionRequest(path, text, params, signal, accept = 'application/json') {
+    let reported = [];
+    const send = () => {
+        const ops = buildContextOps(text);
+        reported = cacheObservations.slice();  // buildContextOps keeps just the ones it reports
+        return fetch(`/sessions/${SESSION_ID}${path}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': accept },
+            body: JSON.stringify({
+                base_version: sessionVersion,
+                ops,
+                ...params
+            }),
+            signal
+        });
+    };
+    let response = await send();
+    if (response.status === 409) {
+        // Server-side context is out of sync (restart, model switch, aborted request): resend full text
+        sessionVersion = null;
+        response = await send();
+    }
+    if (response.ok) {
+        cacheObservations = cacheObservations.filter(o => !reported.includes(o));
+    }
+    return response;
+}
+
+// Columnar candidates: a JSON header, then the numeric columns as little-endian typed arrays
+// (see app/encoding.py). Saves building and parsing an object per candidate.
+const COLUMNAR_TYPE = 'application/vnd.llm-explorer.columns';
+const COLUMN_TYPES = { f4: Float32Array, i4: Int32Array, u1: Uint8Array };
+
+function decodeColumnar(buffer) {
+    const view = new DataView(buffer);
+    const headerLength = view.getUint32(4, true);
+    const data = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    let offset = 8 + headerLength + (-headerLength & 3);
+    for (const spec of data.arrays) {
+        const Type = COLUMN_TYPES[spec.dtype];
+        data[spec.name] = new Type(buffer, offset, spec.length);
+        const size = Type.BYTES_PER_ELEMENT * spec.length;
+        offset += size + (-size & 3);
+    }
+    delete data.arrays;
+    return data;
+}
+
+function candidatesFromColumns(data) {
+    return data.token.map((token, i) => ({
+        token,
+        prob: data.prob[i],
+        logprob: data.logprob[i],
+        cumulative_prob: data.cumulative_prob[i],
+        excluded: data.excluded[i] === 1,
+        token_id: data.token_id[i] < 0 ? null : data.token_id[i]
+    }));
+}
+
+// Distributions by context and sampling params. They depend only on the loaded model,
+// so they stay valid until a model switch; older entries are revalidated in the background.
+const CANDIDATE_CACHE_SIZE = 200;
+const CANDIDATE_CACHE_FRESH_MS = 60000;
+const candidateCache = new Map();  // Map keeps insertion order, so the first key is least recent
+let candidatesAbort = null;  // Controller for the in-flight /next-tokens request
+
+function candidateCacheKey(text, params) {
+    return JSON.stringify([text, params]);
+}
+
+function candidateCacheGet(key) {
+    const entry = candidateCache.get(key);
+    if (entry) {
+        candidateCache.delete(key);
+        candidateCache.set(key, entry);
+    }
+    return entry;
+}
+
+function candidateCachePut(key, candidates) {
+    candidateCache.delete(key);
+    candidateCache.set(key, { candidates, time: Date.now() });
+    while (candidateCache.size > CANDIDATE_CACHE_SIZE) {
+        candidateCache.delete(candidateCache.keys().next().value);
+    }
+}
+
+// Show a cached distribution for the current text right away, if there is one
+function renderCachedCandidates() {
+    const entry = candidateCacheGet(candidateCacheKey(contextInput.value, candidateParams()));
+    if (entry && entry.candidates !== currentCandidates) {
+        renderCandidates(entry.candidates);
+        observeCachedCandidates(contextInput.value, entry.candidates);
+    }
+    return entry;
+}
+
 async function fetchCandidates() {
+    if (currentMode === 'chat' && isGeneratingResponse) {
+        return fetchChatCandidates();
+    }
     const text = contextInput.value;
     if (!text) return;
+    const params = candidateParams();
+    const key = candidateCacheKey(text, params);
+
+    const cached = renderCachedCandidates();
+    if (cached && Date.now() - cached.time < CANDIDATE_CACHE_FRESH_MS) {
+        return;
+    }
+
+    // A newer request makes any in-flight one obsolete
+    if (candidatesAbort) {
+        candidatesAbort.abort();
+    }
+    const controller = new AbortController();
+    candidatesAbort = controller;
+    // A cached result is already on screen, so a revalidation doesn't hold up auto-infer
+    isLoadingCandidates = !cached;
+
+    try {
+        const response = await postSessionRequest('/next-tokens', text, params, controller.signal, COLUMNAR_TYPE);
+        await checkResponse(response);
+
+        const data = decodeColumnar(await response.arrayBuffer());
+        data.candidates = candidatesFromColumns(data);
+        sessionVersion = data.session_version;
+        sessionText = text;
+        consecutiveErrors = 0;  // Reset error counter on success
+        candidateCachePut(key, data.candidates);
+        // Skip the re-render when revalidation found nothing new
+        if (!cached || JSON.stringify(cached.candidates) !== JSON.stringify(data.candidates)) {
+            renderCandidates(data.candidates);
+        }
+    } catch (e) {
+        handleCandidatesError(e);
+    } finally {
+        if (candidatesAbort === controller) {
+            candidatesAbort = null;
+            isLoadingCandidates = false;
+        }
+    }
+}
+
+async function checkResponse(response) {
+    if (response.ok) return;
+    let errorMsg = "API Error: " + response.status;
+    try {
+        const errData = await response.json();
+        if (errData.detail) {
+            errorMsg = errData.detail;
+        }
+    } catch (_) {}
+    throw new Error(errorMsg);
+}
+
+function handleCandidatesError(e) {
+    if (e.name === 'AbortError') return;
+    console.error('[AutoInfer] Fetch error:', e.message);
+    consecutiveErrors++;
+    // Stop auto-infer after 2 consecutive errors to prevent repetition loop
+    if (consecutiveErrors >= 2 && autoInferRunning) {
+        console.error('[AutoInfer] Stopping due to consecutive errors');
+        stopAutoInfer();
+        alert('Auto-inference stopped due to API error: ' + e.message);
+    }
+}
+
+// Chat mode: the server renders the conversation with the model's own chat template
+// and caches each completed turn, so only the reply generated so far is sent as text
+let chatStopStrings = [];  // Texts that end the assistant's turn, from the template
+let lastChatPrompt = null;  // Rendered conversation last shown in the context box
+let chatAbort = null;
+
+function chatRequestMessages() {
+    const messages = [];
+    const systemPrompt = systemPromptInput.value.trim();
+    if (systemPrompt) {
+        messages.push({ role: 'system', content: systemPrompt });
+    }
+    return messages.concat(chatMessages);
+}
+
+function showChatPrompt(prompt) {
+    lastChatPrompt = prompt;
+    contextInput.value = prompt;
+    updateSyntaxHighlight();
+}
+
+async function fetchChatCandidates() {
+    if (chatAbort) {
+        chatAbort.abort();
+    }
+    const controller = new AbortController();
+    chatAbort = controller;
     isLoadingCandidates = true;
 
     try {
-        const response = await fetch('/next-tokens', {
+        const response = await fetch('/chat', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                text: text,
-                temp: parseFloat(tempSlider.value),
-                top_k: parseInt(topkSlider.value),
-                top_p: parseFloat(toppSlider.value),
-                repeat_penalty: parseFloat(penaltySlider.value)
-            })
+                messages: chatRequestMessages(),
+                assistant_prefix: currentAssistantContent,
+                session_id: SESSION_ID,
+                ...samplingParams()
+            }),
+            signal: controller.signal
         });
-
-        if (!response.ok) {
-            let errorMsg = "API Error: " + response.status;
-            try {
-                const errData = await response.json();
-                if (errData.detail) {
-                    errorMsg = errData.detail;
-                }
-            } catch (_) {}
-            throw new Error(errorMsg);
-        }
+        await checkResponse(response);
 
         const data = await response.json();
-        consecutiveErrors = 0;  // Reset error counter on success
+        chatStopStrings = data.stop;
+        showChatPrompt(data.prompt);
+        consecutiveErrors = 0;
         renderCandidates(data.candidates);
     } catch (e) {
-        console.error('[AutoInfer] Fetch error:', e.message);
-        consecutiveErrors++;
-        // Stop auto-infer after 2 consecutive errors to prevent repetition loop
-        if (consecutiveErrors >= 2 && autoInferRunning) {
-            console.error('[AutoInfer] Stopping due to consecutive errors');
-            stopAutoInfer();
-            alert('Auto-inference stopped due to API error: ' + e.message);
-        }
+        handleCandidatesError(e);
     } finally {
-        isLoadingCandidates = false;
+        if (chatAbort === controller) {
+            chatAbort = null;
+            isLoadingCandidates = false;
+        }
     }
 }
 
@@ -363,35 +718,159 @@ function getProbColor(prob) {
     return `hsl(${hue}, ${sat}%, ${light}%)`;
 }
 
+// Candidate rows are keyed by token and reused between renders. Only properties that
+// changed are written, once per animation frame, and only rows in view are in the DOM.
+const CANDIDATE_OVERSCAN = 8;
+let candidateRows = new Map();  // candidate key -> row element
+const candidateRowPool = [];  // Detached rows kept for reuse
+let candidateRowHeight = 0;
+let candidateSpacers = null;
+let candidatesFrame = null;
+
 function renderCandidates(candidates) {
-    candidatesList.innerHTML = '';
     currentCandidates = candidates;
     candidatesGenerationId++;  // New batch of candidates
     console.log('[AutoInfer] New candidates, generation:', candidatesGenerationId, 'lastSelected:', lastSelectedToken);
+    scheduleCandidatesRender();
+}
 
-    candidates.forEach(c => {
-        const div = document.createElement('div');
-        div.className = 'candidate-item';
-        if (c.excluded) {
-            div.classList.add('excluded');
-        }
-        div.onclick = () => selectToken(c.token);
+function scheduleCandidatesRender() {
+    if (candidatesFrame === null) {
+        candidatesFrame = requestAnimationFrame(flushCandidates);
+    }
+}
 
-        const barColor = getProbColor(c.prob);
+// Token ids are unique; different ids can decode to the same text (e.g. partial UTF-8)
+function candidateKeys(candidates) {
+    const seen = new Map();
+    return candidates.map(c => {
+        const base = c.token_id !== undefined && c.token_id !== null ? `id:${c.token_id}` : `t:${c.token}`;
+        const n = seen.get(base) || 0;
+        seen.set(base, n + 1);
+        return n ? `${base}#${n}` : base;
+    });
+}
 
-        div.innerHTML = `
-            <span class="token-text">${escapeHtml(c.token)}</span>
-            <div class="prob-bar-container">
-                <div class="prob-bar" style="width: ${c.prob}%; background-color: ${barColor}"></div>
-            </div>
-            <span class="prob-text">${c.prob.toFixed(1)}%</span>
-        `;
+function createCandidateRow() {
+    const div = document.createElement('div');
+    div.className = 'candidate-item';
+    div.innerHTML = `
+        <span class="token-text"></span>
+        <div class="prob-bar-container">
+            <div class="prob-bar"></div>
+        </div>
+        <span class="prob-text"></span>
+    `;
+    div._parts = {
+        token: div.querySelector('.token-text'),
+        bar: div.querySelector('.prob-bar'),
+        prob: div.querySelector('.prob-text'),
+    };
+    div._state = {};
+    return div;
+}
+
+function updateCandidateRow(div, c) {
+    const state = div._state;
+    if (state.token !== c.token) {
+        div._parts.token.textContent = visualizeWhitespace(c.token);
         div.dataset.token = c.token;
+        state.token = c.token;
+    }
+    if (state.prob !== c.prob) {
+        div._parts.bar.style.width = `${c.prob}%`;
+        div._parts.prob.textContent = `${c.prob.toFixed(1)}%`;
         div.dataset.prob = c.prob;
-        candidatesList.appendChild(div);
+        state.prob = c.prob;
+    }
+    const color = getProbColor(c.prob);
+    if (state.color !== color) {
+        div._parts.bar.style.backgroundColor = color;
+        state.color = color;
+    }
+    if (state.excluded !== !!c.excluded) {
+        div.classList.toggle('excluded', !!c.excluded);
+        state.excluded = !!c.excluded;
+    }
+}
+
+function flushCandidates() {
+    candidatesFrame = null;
+
+    // Other code (loading and error messages) may have replaced the list contents
+    if (!candidateSpacers || candidateSpacers.top.parentNode !== candidatesList) {
+        candidatesList.innerHTML = '';
+        candidateRows = new Map();
+        candidateSpacers = {
+            top: document.createElement('div'),
+            bottom: document.createElement('div'),
+        };
+        candidatesList.append(candidateSpacers.top, candidateSpacers.bottom);
+    }
+
+    const candidates = currentCandidates;
+    let first = 0;
+    let last = candidates.length;
+    if (candidateRowHeight > 0) {
+        const viewTop = candidatesList.scrollTop;
+        const viewBottom = viewTop + candidatesList.clientHeight;
+        first = Math.max(0, Math.floor(viewTop / candidateRowHeight) - CANDIDATE_OVERSCAN);
+        last = Math.min(candidates.length, Math.ceil(viewBottom / candidateRowHeight) + CANDIDATE_OVERSCAN);
+    }
+    const visible = candidates.slice(first, last);
+    const keys = candidateKeys(visible);
+
+    // Recycle rows whose candidate is no longer shown
+    const wanted = new Set(keys);
+    const spare = [];
+    for (const [key, row] of candidateRows) {
+        if (!wanted.has(key)) {
+            candidateRows.delete(key);
+            spare.push(row);
+        }
+    }
+
+    let cursor = candidateSpacers.top.nextSibling;
+    visible.forEach((c, i) => {
+        let row = candidateRows.get(keys[i]);
+        if (!row) {
+            row = spare.pop() || candidateRowPool.pop() || createCandidateRow();
+            candidateRows.set(keys[i], row);
+        }
+        updateCandidateRow(row, c);
+        // Only touch the DOM order when this row is out of place
+        if (row !== cursor) {
+            candidatesList.insertBefore(row, cursor);
+        } else {
+            cursor = cursor.nextSibling;
+        }
+    });
+    spare.forEach(row => {
+        row.remove();
+        candidateRowPool.push(row);
     });
+
+    if (!candidateRowHeight && visible.length) {
+        const firstRow = candidateRows.get(keys[0]);
+        const style = getComputedStyle(firstRow);
+        candidateRowHeight = firstRow.offsetHeight + parseFloat(style.marginBottom || 0);
+        if (candidateRowHeight && candidates.length > CANDIDATE_OVERSCAN * 2) {
+            scheduleCandidatesRender();  // Re-run with virtualization now that rows can be measured
+        }
+    }
+    candidateSpacers.top.style.height = `${first * candidateRowHeight}px`;
+    candidateSpacers.bottom.style.height = `${(candidates.length - last) * candidateRowHeight}px`;
 }
 
+candidatesList.addEventListener('scroll', scheduleCandidatesRender, { passive: true });
+
+candidatesList.addEventListener('click', (e) => {
+    const row = e.target.closest('.candidate-item');
+    if (row && row.dataset.token !== undefined) {
+        selectToken(row.dataset.token);
+    }
+});
+
 async function selectToken(token) {
     if (isSelectingToken) {
         console.log('[AutoInfer] selectToken blocked, already selecting');
@@ -406,7 +885,6 @@ async function selectToken(token) {
     if (currentMode === 'chat' && isGeneratingResponse) {
         // Chat mode: append to assistant response
         addAssistantToken(token);
-        syncChatToContext();
         textForEndCheck = currentAssistantContent;
     } else {
         // Context mode: original behavior
@@ -424,7 +902,7 @@ async function selectToken(token) {
     // Strip trailing whitespace first (models often add newlines after end tokens)
     const textForEndCheckStripped = textForEndCheck.trimEnd();
     const endTokenPatterns = ['<|end_of_text|>', '<|im_end|>', '<|eot|>', '</s>', '<end>', '<|END|>'];
-    for (const pattern of endTokenPatterns) {
+    for (const pattern of endTokenPatterns.concat(chatStopStrings)) {
         if (textForEndCheckStripped.endsWith(pattern)) {
             if (autoInferRunning) {
                 stopAutoInfer();
@@ -451,12 +929,12 @@ function repr(s) {
 
 function escapeHtml(text) {
     // Basic escaping and visualizing spaces
+    return visualizeWhitespace(escapeHtmlPreserveWhitespace(text));
+}
+
+function visualizeWhitespace(text) {
+    // For plain text (textContent) that should still show spaces and newlines
     return text
-        .replace(/&/g, "&amp;")
-        .replace(/</g, "&lt;")
-        .replace(/>/g, "&gt;")
-        .replace(/"/g, "&quot;")
-        .replace(/'/g, "&#039;")
         .replace(/\n/g, "␤") // Visualize newlines
         .replace(/ /g, "·"); // Visualize spaces
 }
@@ -523,6 +1001,10 @@ contextInput.addEventListener('input', () => {
     if (currentMode === 'chat') return;
 
     clearTimeout(debounceTimer);
+    // Going back over earlier text (undo, deletes) is served from the cache without waiting
+    if (!beamView.classList.contains('active')) {
+        renderCachedCandidates();
+    }
     debounceTimer = setTimeout(() => {
         // Check if we're in beam view (has active class, not hidden)
         const inBeamView = beamView.classList.contains('active');
@@ -536,10 +1018,109 @@ contextInput.addEventListener('input', () => {
     updateSyntaxHighlight();
 });
 
+// Sampling sliders: when one is grabbed, fetch the candidates for each of its positions
+// in one /sweep request (the context is evaluated once) and put them in the candidate
+// cache, so dragging re-renders without waiting for the server.
+const SWEEP_PARAMS = new Map([
+    [tempSlider, 'temp'],
+    [topkSlider, 'top_k'],
+    [toppSlider, 'top_p'],
+    [penaltySlider, 'repeat_penalty']
+]);
+let sweepAbort = null;
+
+function sliderPositions(slider) {
+    const min = parseFloat(slider.min);
+    const max = parseFloat(slider.max);
+    const step = slider.step ? parseFloat(slider.step) : 1;
+    // Round like the slider does, so values match the cache keys of samplingParams()
+    const decimals = (slider.step.split('.')[1] || '').length;
+    const values = [];
+    for (let i = 0; min + i * step <= max + step / 2; i++) {
+        values.push(parseFloat((min + i * step).toFixed(decimals)));
+    }
+    return values;
+}
+
+async function prefetchSliderSweep(slider) {
+    const text = contextInput.value;
+    if (!text || currentMode === 'chat' || tokenFilter()) return;
+    const name = SWEEP_PARAMS.get(slider);
+    const params = samplingParams();
+    const grid = {
+        temps: [params.temp],
+        top_ks: [params.top_k],
+        top_ps: [params.top_p],
+        repeat_penalties: [params.repeat_penalty]
+    };
+    const gridKey = { temp: 'temps', top_k: 'top_ks', top_p: 'top_ps', repeat_penalty: 'repeat_penalties' }[name];
+    grid[gridKey] = sliderPositions(slider);
+
+    if (sweepAbort) {
+        sweepAbort.abort();
+    }
+    const controller = new AbortController();
+    sweepAbort = controller;
+    try {
+        const response = await postSessionRequest('/sweep', text, grid, controller.signal);
+        await checkResponse(response);
+        const data = await response.json();
+        sessionVersion = data.session_version;
+        sessionText = text;
+        for (const config of data.configs) {
+            const candidates = config.index.map((tokenIndex, i) => ({
+                token: data.tokens[tokenIndex].token,
+                prob: config.prob[i],
+                logprob: config.logprob[i],
+                cumulative_prob: config.cumulative_prob[i],
+                excluded: config.excluded[i],
+                token_id: data.tokens[tokenIndex].token_id
+            }));
+            const key = candidateCacheKey(text, {
+                temp: config.temp,
+                top_k: config.top_k,
+                top_p: config.top_p,
+                repeat_penalty: config.repeat_penalty
+            });
+            candidateCachePut(key, candidates);
+        }
+    } catch (e) {
+        if (e.name !== 'AbortError') console.error('Sweep failed:', e.message);
+    } finally {
+        if (sweepAbort === controller) sweepAbort = null;
+    }
+}
+
+// Token filter: ranks only matching tokens, server-side on the logits
+function filterIsValid() {
+    if (filterModeSelect.value !== 'regex') return true;
+    try {
+        new RegExp(filterInput.value);  // Close enough to Python's syntax to catch typos
+        return true;
+    } catch (_) {
+        return false;
+    }
+}
+
+[filterInput, filterModeSelect].forEach(control => {
+    control.addEventListener(control === filterInput ? 'input' : 'change', () => {
+        const valid = filterIsValid();
+        filterInput.classList.toggle('invalid', !valid);
+        clearTimeout(debounceTimer);
+        if (!valid) return;
+        renderCachedCandidates();
+        debounceTimer = setTimeout(fetchCandidates, 500);
+    });
+});
+
 // Update controls
 [tempSlider, topkSlider, toppSlider, penaltySlider].forEach(input => {
+    input.addEventListener('pointerdown', () => prefetchSliderSweep(input));
+    input.addEventListener('focus', () => prefetchSliderSweep(input));
     input.addEventListener('input', (e) => {
         e.target.previousElementSibling.querySelector('span').textContent = e.target.value;
+        // Swept positions render immediately; the debounced fetch is a no-op for them
+        renderCachedCandidates();
         clearTimeout(debounceTimer);
         debounceTimer = setTimeout(fetchCandidates, 500);
     });
@@ -548,7 +1129,7 @@ contextInput.addEventListener('input', () => {
 // Initial load
 contextInput.value = "Once upon a time, there was a";
 fetchCandidates();
-startDownloadPolling(); // Check for any existing downloads on load
+startDownloadStream(); // Subscribe to download progress, including existing downloads
 
 // Make download indicator clickable to open model modal
 const downloadIndicator = document.getElementById('download-indicator');
@@ -589,38 +1170,36 @@ function parseRepoInput(input) {
     return input;
 }
 
-async function startDownloadPolling() {
-    if (downloadPollInterval) return;
-
-    await updateDownloadsStatus();
+function startDownloadStream() {
+    if (downloadEvents) return;
 
-    downloadPollInterval = setInterval(async () => {
-        const hasActive = await updateDownloadsStatus();
-        if (!hasActive) {
-            clearInterval(downloadPollInterval);
-            downloadPollInterval = null;
-        }
-    }, 1500);
-}
-
-async function updateDownloadsStatus() {
-    try {
-        const res = await fetch('/downloads/status');
-        const data = await res.json();
+    // The server pushes a snapshot on connect, then one event per changed download
+    downloadEvents = new EventSource('/downloads/events');
 
+    downloadEvents.addEventListener('snapshot', (e) => {
+        const data = JSON.parse(e.data);
         downloads = {};
         data.downloads.forEach(d => {
             downloads[d.download_id] = d;
         });
-
         renderDownloads();
         updateDownloadIndicator(data.active_count);
+    });
 
-        return data.active_count > 0;
-    } catch (e) {
-        console.error('Failed to fetch download status:', e);
-        return false;
-    }
+    downloadEvents.addEventListener('download', (e) => {
+        const d = JSON.parse(e.data);
+        downloads[d.download_id] = {...downloads[d.download_id], ...d};
+        renderDownloads();
+        updateDownloadIndicator(countActiveDownloads());
+    });
+
+    // EventSource reconnects on its own; the new snapshot resyncs the list
+}
+
+function countActiveDownloads() {
+    return Object.values(downloads).filter(
+        d => d.state === 'in_progress' || d.state === 'pending'
+    ).length;
 }
 
 function updateDownloadIndicator(activeCount) {
@@ -810,7 +1389,7 @@ function toggleModelModal(show) {
     if (show) {
         modelModal.classList.remove('hidden');
         loadLocalModels();
-        updateDownloadsStatus(); // Load current download status
+        renderDownloads(); // Kept current by the download event stream
     } else {
         modelModal.classList.add('hidden');
     }
@@ -860,6 +1439,12 @@ tabBtns.forEach(btn => {
 });
 
 // API Calls
+function formatParamCount(n) {
+    if (n >= 1e9) return (n / 1e9).toFixed(1) + 'B';
+    if (n >= 1e6) return (n / 1e6).toFixed(0) + 'M';
+    return (n / 1e3).toFixed(0) + 'K';
+}
+
 async function loadLocalModels() {
     localModelList.innerHTML = '<li>Loading...</li>';
     try {
@@ -871,14 +1456,30 @@ async function loadLocalModels() {
             // Use friendly_name if available, otherwise fall back to filename
             const displayName = m.friendly_name || m.filename;
             const showFilename = m.friendly_name && m.friendly_name !== m.filename;
+            const details = [
+                m.architecture,
+                m.parameter_count ? formatParamCount(m.parameter_count) : null,
+                m.quantization,
+                m.context_length ? `${m.context_length} ctx` : null,
+                `${m.size_mb} MB`,
+                m.estimated_memory_mb ? `~${(m.estimated_memory_mb / 1024).toFixed(1)} GB RAM` : null,
+                m.fits_in_memory === false ? 'too large for available memory' : null,
+            ].filter(Boolean).join(' · ');
             li.innerHTML = `
                 <div class="model-info">
                     <strong>${escapeHtml(displayName)}</strong>
                     ${showFilename ? `<small class="model-filename">${escapeHtml(m.filename)}</small>` : ''}
-                    <small>${m.size_mb} MB</small>
+                    <small>${escapeHtml(details)}</small>
+                    <small class="model-warm">${formatWarm(m.warm_percent)}</small>
                 </div>
                 <button class="action-btn" onclick="switchModel('${m.filename}')">Load</button>
             `;
+            // Hovering or focusing a model is a good hint it's next: start paging it in
+            if (m.fits_in_memory !== false && m.warm_percent !== 100) {
+                const start = () => prewarmModel(m.filename, li.querySelector('.model-warm'));
+                li.addEventListener('mouseenter', start, {once: true});
+                li.addEventListener('focusin', start, {once: true});
+            }
             localModelList.appendChild(li);
         });
     } catch (e) {
@@ -886,6 +1487,30 @@ async function loadLocalModels() {
     }
 }
 
+function formatWarm(percent) {
+    return percent === null || percent === undefined ? '' : `${Math.round(percent)}% in memory`;
+}
+
+async function prewarmModel(filename, warmEl) {
+    try {
+        let res = await fetch('/models/prewarm', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename})
+        });
+        // Poll while the selector is open; the prewarm carries on without it
+        while (res.ok && !modelModal.classList.contains('hidden')) {
+            const info = await res.json();
+            warmEl.textContent = formatWarm(info.warm_percent ?? info.progress);
+            if (info.state !== 'pending' && info.state !== 'in_progress') break;
+            await new Promise(resolve => setTimeout(resolve, 500));
+            res = await fetch(`/models/prewarm/${encodeURIComponent(filename)}`);
+        }
+    } catch (e) {
+        console.warn('Prewarm failed:', e);
+    }
+}
+
 async function switchModel(filename) {
     modelSelectorBtn.textContent = "Loading...";
     modelSelectorBtn.disabled = true;
@@ -917,9 +1542,17 @@ async function switchModel(filename) {
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({filename})
         });
-        if (!res.ok) throw new Error("Failed to switch");
+        if (!res.ok) {
+            // e.g. 507 when the model won't fit in memory
+            const err = await res.json().catch(() => ({}));
+            throw new Error(err.detail || "Failed to switch");
+        }
         const data = await res.json();
 
+        // Distributions from the previous model no longer apply
+        candidateCache.clear();
+        autoInferPlan = [];
+
         // Use friendly_name if available, otherwise filename
         const displayName = data.friendly_name || data.model || filename;
         modelSelectorBtn.textContent = displayName + " ▾";
@@ -995,8 +1628,8 @@ window.downloadModel = async (repo, filename) => {
         const data = await res.json();
 
         if (data.download_id) {
-            // Download started in background
-            startDownloadPolling();
+            // Download started in background; progress arrives over the event stream
+            startDownloadStream();
         }
     } catch (e) {
         console.error('Failed to start download:', e);
@@ -1031,57 +1664,35 @@ const SYSTEM_PRESETS = {
     educator: 'SYSTEM INSTRUCTION: You are an educator. You explain concepts clearly, use examples, and check for understanding. End your response with:<|end_of_text|>'
 };
 
-function syncChatToContext() {
-    // Build full context from chat messages
-    const systemPrompt = systemPromptInput.value.trim();
-    let fullContext = systemPrompt;
-
-    chatMessages.forEach(msg => {
-        if (msg.role === 'user') {
-            fullContext += '\n\nUSER: ' + msg.content;
-        } else {
-            fullContext += '\n\nASSISTANT: ' + msg.content;
-        }
-    });
-
-    // If assistant is currently generating, add their label and partial content
-    if (isGeneratingResponse) {
-        fullContext += '\n\nASSISTANT:' + currentAssistantContent;
-    }
-
-    contextInput.value = fullContext;
-    updateSyntaxHighlight();
-}
-
-function syncContextToChat() {
-    const text = contextInput.value.trim();
-    if (!text) {
-        chatMessages = [];
+// Show the conversation in the context box, rendered with the model's chat template
+async function syncChatToContext() {
+    // While a reply is generated, each /chat response brings the rendered prompt along
+    if (isGeneratingResponse) return;
+    const messages = chatRequestMessages();
+    if (!messages.length) {
+        showChatPrompt('');
         return;
     }
-
-    // Parse system instruction
-    const systemMatch = text.match(/(SYSTEM INSTRUCTION:.*?)(?=\n\nUSER:|$)/s);
-    if (systemMatch) {
-        systemPromptInput.value = systemMatch[1].trim();
+    try {
+        const response = await fetch('/chat/render', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ messages })
+        });
+        await checkResponse(response);
+        showChatPrompt((await response.json()).prompt);
+    } catch (e) {
+        console.error('Failed to render chat:', e.message);
     }
+}
 
-    // Parse messages (simple alternating pattern)
-    chatMessages = [];
-    const lines = text.split('\n\n');
-
-    for (const line of lines) {
-        if (line.startsWith('USER:')) {
-            chatMessages.push({
-                role: 'user',
-                content: line.slice(5).trim()
-            });
-        } else if (line.startsWith('ASSISTANT:')) {
-            chatMessages.push({
-                role: 'assistant',
-                content: line.slice(10).trim()
-            });
-        }
+// The chat keeps its structured messages: the context box shows them rendered with the
+// model's template, which can't be parsed back reliably, so edits made there stay in context mode
+function syncContextToChat() {
+    // Unchanged since it was rendered from the chat: the messages are still current
+    if (lastChatPrompt !== null && contextInput.value === lastChatPrompt) return;
+    if (contextInput.value.trim()) {
+        showNotification('Context edits are not carried into chat; the conversation is unchanged');
     }
 }
 
@@ -1138,7 +1749,7 @@ function finishAssistantMessage() {
         // Strip end token patterns from the content (chat mode only)
         let cleanedContent = currentAssistantContent;
         const endTokenPatterns = ['<|end_of_text|>', '<|im_end|>', '<|eot|>', '</s>', '<end>', '<|END|>'];
-        for (const pattern of endTokenPatterns) {
+        for (const pattern of endTokenPatterns.concat(chatStopStrings)) {
             cleanedContent = cleanedContent.replace(pattern, '');
         }
         // Strip leading whitespace for saved message (display only)
@@ -1194,8 +1805,7 @@ async function sendChatMessage() {
     chatUserInput.disabled = true;
     chatSendBtn.disabled = true;
 
-    // Sync to context and fetch candidates
-    syncChatToContext();
+    // Fetch candidates for the reply (this also shows the rendered prompt in the context box)
     await fetchCandidates();
 
     // Start auto-inference
@@ -1277,6 +1887,7 @@ function scheduleBeamGenerate() {
 
 // Track current beam generation request to ignore stale results
 let currentBeamRequestId = 0;
+let beamAbort = null;  // Controller for the in-flight beam search
 
 async function generateBeamPaths() {
     const context = contextInput.value.trim();
@@ -1287,6 +1898,11 @@ async function generateBeamPaths() {
 
     // Increment request ID and capture it for this request
     const requestId = ++currentBeamRequestId;
+    if (beamAbort) {
+        beamAbort.abort();  // Drop the superseded search instead of just ignoring its result
+    }
+    beamAbort = new AbortController();
+    const signal = beamAbort.signal;
     isBeamLoading = true;
     beamPathsGrid.innerHTML = '<div class="beam-loading">Generating paths...</div>';
 
@@ -1294,15 +1910,12 @@ async function generateBeamPaths() {
         const numPaths = parseInt(beamPathsSlider.value);
         const depth = parseInt(beamDepthSlider.value);
 
-        const res = await fetch('/beam/search', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({
-                context: context,
-                num_paths: numPaths,
-                depth: depth
-            })
-        });
+        const text = contextInput.value;
+        const res = await postSessionRequest('/beam/search', text, {
+            num_paths: numPaths,
+            depth: depth,
+            ...samplingParams()
+        }, signal);
 
         // Ignore response if a newer request has been initiated
         if (requestId !== currentBeamRequestId) {
@@ -1312,6 +1925,8 @@ async function generateBeamPaths() {
         if (!res.ok) throw new Error('Failed to generate paths');
 
         const data = await res.json();
+        sessionVersion = data.session_version;
+        sessionText = text;
         // Deduplicate paths by text (keep first occurrence)
         const seenTexts = new Set();
         beamPaths = data.paths.filter(p => {
@@ -1337,44 +1952,140 @@ async function generateBeamPaths() {
     }
 }
 
+// Beam cards are keyed by path id; extending a path appends its new tokens in place
+let beamCards = new Map();  // path id -> card element
+let beamFrame = null;
+
 function renderBeamPaths() {
+    if (beamFrame === null) {
+        beamFrame = requestAnimationFrame(flushBeamPaths);
+    }
+}
+
+function createBeamCard(pathId) {
+    const card = document.createElement('div');
+    card.className = 'beam-path-card';
+    card.dataset.pathId = pathId;
+    card.innerHTML = `
+        <div class="beam-path-header">
+            <span class="beam-path-title"></span>
+            <span class="beam-path-prob"></span>
+        </div>
+        <div class="beam-path-text"></div>
+        <div class="beam-path-tokens"></div>
+        <div class="beam-path-actions">
+            <button class="beam-action-btn extend">Extend</button>
+            <button class="beam-action-btn adopt">Adopt</button>
+        </div>
+    `;
+    card._parts = {
+        title: card.querySelector('.beam-path-title'),
+        prob: card.querySelector('.beam-path-prob'),
+        text: card.querySelector('.beam-path-text'),
+        tokens: card.querySelector('.beam-path-tokens'),
+        extend: card.querySelector('.extend'),
+    };
+    card._state = { tokens: [] };
+    return card;
+}
+
+function createBeamToken(t) {
+    const span = document.createElement('span');
+    span.className = 'beam-token';
+    span.innerHTML = `${escapeHtml(t.token)} <span class="beam-token-prob">${(t.prob * 100).toFixed(1)}%</span>`;
+    return span;
+}
+
+function updateBeamCard(card, path, index) {
+    const state = card._state;
+    const parts = card._parts;
+    const title = `Path ${index + 1}`;
+    if (state.title !== title) {
+        parts.title.textContent = title;
+        state.title = title;
+    }
+    // Format cumulative probability as percentage
+    const probPct = `${(path.cumulative_prob * 100).toFixed(2)}%`;
+    if (state.prob !== probPct) {
+        parts.prob.textContent = probPct;
+        state.prob = probPct;
+    }
+    const text = path.text.slice(contextInput.value.length);
+    if (state.text !== text) {
+        parts.text.textContent = visualizeWhitespace(text);
+        state.text = text;
+    }
+
+    // Keep the token spans that still match and append the rest
+    let keep = 0;
+    while (keep < state.tokens.length && keep < path.tokens.length &&
+           state.tokens[keep].token === path.tokens[keep].token &&
+           state.tokens[keep].prob === path.tokens[keep].prob) {
+        keep++;
+    }
+    while (parts.tokens.childNodes.length > keep) {
+        parts.tokens.lastChild.remove();
+    }
+    path.tokens.slice(keep).forEach(t => parts.tokens.appendChild(createBeamToken(t)));
+    state.tokens = path.tokens.map(t => ({ token: t.token, prob: t.prob }));
+
+    if (parts.extend.disabled) {
+        parts.extend.disabled = false;
+        parts.extend.textContent = 'Extend';
+    }
+}
+
+function flushBeamPaths() {
+    beamFrame = null;
+
     if (!beamPaths || beamPaths.length === 0) {
+        beamCards = new Map();
         beamPathsGrid.innerHTML = '<div class="beam-empty-state"><p>No paths generated</p></div>';
         return;
     }
 
-    beamPathsGrid.innerHTML = '';
+    // Loading and empty states replace the grid contents; start over if they did
+    const firstCard = beamCards.values().next().value;
+    if (!firstCard || firstCard.parentNode !== beamPathsGrid) {
+        beamPathsGrid.innerHTML = '';
+        beamCards = new Map();
+    }
 
-    beamPaths.forEach((path, index) => {
-        const card = document.createElement('div');
-        card.className = 'beam-path-card';
-        card.dataset.pathId = path.id;
-
-        // Format cumulative probability as percentage
-        const probPct = (path.cumulative_prob * 100).toFixed(2);
-
-        // Build tokens display
-        const tokensHtml = path.tokens.map(t =>
-            `<span class="beam-token">${escapeHtml(t.token)} <span class="beam-token-prob">${(t.prob * 100).toFixed(1)}%</span></span>`
-        ).join('');
-
-        card.innerHTML = `
-            <div class="beam-path-header">
-                <span class="beam-path-title">Path ${index + 1}</span>
-                <span class="beam-path-prob">${probPct}%</span>
-            </div>
-            <div class="beam-path-text">${escapeHtml(path.text.slice(contextInput.value.length))}</div>
-            <div class="beam-path-tokens">${tokensHtml}</div>
-            <div class="beam-path-actions">
-                <button class="beam-action-btn extend" onclick="extendBeamPath('${path.id}')">Extend</button>
-                <button class="beam-action-btn adopt" onclick="adoptBeamPath('${path.id}')">Adopt</button>
-            </div>
-        `;
+    const wanted = new Set(beamPaths.map(p => p.id));
+    for (const [id, card] of beamCards) {
+        if (!wanted.has(id)) {
+            card.remove();
+            beamCards.delete(id);
+        }
+    }
 
-        beamPathsGrid.appendChild(card);
+    let cursor = beamPathsGrid.firstChild;
+    beamPaths.forEach((path, index) => {
+        let card = beamCards.get(path.id);
+        if (!card) {
+            card = createBeamCard(path.id);
+            beamCards.set(path.id, card);
+        }
+        updateBeamCard(card, path, index);
+        if (card !== cursor) {
+            beamPathsGrid.insertBefore(card, cursor);
+        } else {
+            cursor = cursor.nextSibling;
+        }
     });
 }
 
+beamPathsGrid.addEventListener('click', (e) => {
+    const button = e.target.closest('.beam-action-btn');
+    const card = e.target.closest('.beam-path-card');
+    if (!button || !card) return;
+    if (button.classList.contains('extend')) {
+        extendBeamPath(card.dataset.pathId);
+    } else if (button.classList.contains('adopt')) {
+        adoptBeamPath(card.dataset.pathId);
+    }
+});
+
 async function extendBeamPath(pathId) {
     const path = beamPaths.find(p => p.id === pathId);
     if (!path) return;
@@ -1389,29 +2100,23 @@ async function extendBeamPath(pathId) {
     }
 
     try {
-        const res = await fetch('/beam/search', {
+        // The server keeps explored paths in a tree, so only the new token is decoded
+        const res = await fetch(`/sessions/${SESSION_ID}/beam/${pathId}/extend`, {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({
-                context: path.text,
-                num_paths: 1,
-                depth: 1
-            })
+            body: JSON.stringify(samplingParams())
         });
 
         if (!res.ok) throw new Error('Failed to extend path');
 
         const data = await res.json();
-        if (data.paths && data.paths.length > 0) {
-            const newPath = data.paths[0];
+        const newPath = data.path;
+        path.id = newPath.id;
+        path.text = newPath.text;
+        path.tokens = newPath.tokens;
+        path.cumulative_prob = newPath.cumulative_prob;
 
-            // Update the path
-            path.text = newPath.text;
-            path.tokens = [...path.tokens, ...newPath.tokens];
-            path.cumulative_prob *= newPath.cumulative_prob;
-
-            renderBeamPaths();
-        }
+        renderBeamPaths();
     } catch (e) {
         console.error(e);
         if (card) {
@@ -1424,14 +2129,32 @@ async function extendBeamPath(pathId) {
     }
 }
 
-function adoptBeamPath(pathId) {
+async function adoptBeamPath(pathId) {
     const path = beamPaths.find(p => p.id === pathId);
     if (!path) return;
 
-    // Set the context to the path's text
-    contextInput.value = path.text;
-    updateSyntaxHighlight();
-    fetchCandidates();
+    try {
+        // Moves the server-side context to the path; its distribution is usually cached
+        const res = await fetch(`/sessions/${SESSION_ID}/beam/${pathId}/adopt`, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(samplingParams())
+        });
+        if (!res.ok) throw new Error('Failed to adopt path');
+        const data = await res.json();
+        contextInput.value = data.text;
+        sessionText = data.text;
+        sessionVersion = data.session_version;
+        updateSyntaxHighlight();
+        candidateCachePut(candidateCacheKey(data.text, samplingParams()), data.candidates);
+        renderCandidates(data.candidates);
+    } catch (e) {
+        console.error(e);
+        // Set the context to the path's text
+        contextInput.value = path.text;
+        updateSyntaxHighlight();
+        fetchCandidates();
+    }
 
     // Clear the beam paths and tracked context so new paths will generate
     beamPaths = [];
@@ -1444,6 +2167,8 @@ function adoptBeamPath(pathId) {
 function deleteBeamPath(pathId) {
     beamPaths = beamPaths.filter(p => p.id !== pathId);
     renderBeamPaths();
+    // Free the path's nodes on the server
+    fetch(`/sessions/${SESSION_ID}/beam/${pathId}`, { method: 'DELETE' }).catch(() => {});
 }
 
 // Make beam functions global
@@ -0,0 +1,41 @@
+import itertools
+from typing import List
+
+# Upper bound on sampling configurations per sweep request
+MAX_SWEEP_CONFIGS = 1000
+
+
+def sweep_candidates(
+    engine,
+    top_logprobs: list,
+    prompt: str,
+    temps: List[float],
+    top_ks: List[int],
+    top_ps: List[float],
+    repeat_penalties: List[float],
+) -> dict:
+    """
+    Post-process one raw distribution (top logprobs as from get_top_logprobs) for every
+    combination of sampling settings. The raw tokens are listed once; each configuration
+    refers to them by index, in its own display order, with parallel arrays for the values
+    postprocess_candidates computes.
+    """
+    tokens = [{"token": text, "token_id": token_id, "logprob": logprob} for text, logprob, token_id in top_logprobs]
+    # Token IDs are unknown on the text path, but the texts within one distribution are unique
+    position = {(t[2], t[0]): i for i, t in enumerate(top_logprobs)}
+
+    configs = []
+    for temp, top_k, top_p, penalty in itertools.product(temps, top_ks, top_ps, repeat_penalties):
+        candidates = engine.postprocess_candidates(top_logprobs[:top_k], prompt, temp, top_p, penalty)
+        configs.append({
+            "temp": temp,
+            "top_k": top_k,
+            "top_p": top_p,
+            "repeat_penalty": penalty,
+            "index": [position[(c["token_id"], c["token"])] for c in candidates],
+            "prob": [c["prob"] for c in candidates],
+            "logprob": [c["logprob"] for c in candidates],
+            "cumulative_prob": [c["cumulative_prob"] for c in candidates],
+            "excluded": [c["excluded"] for c in candidates],
+        })
+    return {"tokens": tokens, "configs": configs}
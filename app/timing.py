@@ -0,0 +1,122 @@
+import cProfile
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Dict, Optional
+
+import llama_cpp
+
+PROFILE_DIR = os.path.join(os.path.dirname(__file__), "profiles")
+
+# cProfile can only have one active profiler per interpreter on Python 3.12+
+_profile_lock = threading.Lock()
+
+
+class RequestTimings:
+    """Per-request timing breakdown, filled in as the request moves through the engine."""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.phases_ms: Dict[str, float] = {}
+        self.prefill_tokens = 0
+        self.cached_tokens = 0
+        self.llama_perf: Optional[Dict[str, float]] = None
+        self.profile_path: Optional[str] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a block of code, accumulating into the named phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.phases_ms[name] = self.phases_ms.get(name, 0.0) + elapsed
+
+    def add_perf(self, perf: Optional[Dict[str, float]]):
+        """Accumulate llama.cpp perf counters across several forward passes."""
+        if perf is None:
+            return
+        if self.llama_perf is None:
+            self.llama_perf = {}
+        for key, value in perf.items():
+            self.llama_perf[key] = self.llama_perf.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        perf = self.llama_perf or {}
+        inference_ms = self.phases_ms.get("inference", 0.0)
+        # Prefer llama.cpp's own prefill/decode split; fall back to wall time
+        prefill_ms = perf.get("t_p_eval_ms", inference_ms)
+        decode_ms = perf.get("t_eval_ms", 0.0)
+        return {
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 3),
+            "queue_wait_ms": round(self.phases_ms.get("queue_wait", 0.0), 3),
+            "tokenize_ms": round(self.phases_ms.get("tokenize", 0.0), 3),
+            "prefill_tokens": self.prefill_tokens,
+            "prefill_ms": round(prefill_ms, 3),
+            "decode_ms": round(decode_ms, 3),
+            "sampler_ms": round(self.phases_ms.get("sampler", 0.0), 3),
+            "cache_hit": self.cached_tokens > 0,
+            "cached_tokens": self.cached_tokens,
+            "llama_perf": self.llama_perf,
+            "profile_path": self.profile_path,
+        }
+
+
+def phase(timings: Optional[RequestTimings], name: str):
+    """Return a timing context for `name`, or a no-op when timing is disabled."""
+    if timings is None:
+        return nullcontext()
+    return timings.phase(name)
+
+
+def reset_llama_perf(model):
+    """Reset llama.cpp's context perf counters so the next read covers one call."""
+    try:
+        llama_cpp.llama_perf_context_reset(model.ctx)
+    except (AttributeError, TypeError):
+        pass
+
+
+def read_llama_perf(model) -> Optional[Dict[str, float]]:
+    """Read llama.cpp's context perf counters, or None if unavailable."""
+    try:
+        data = llama_cpp.llama_perf_context(model.ctx)
+    except (AttributeError, TypeError):
+        return None
+    return {
+        "t_p_eval_ms": float(data.t_p_eval_ms),
+        "t_eval_ms": float(data.t_eval_ms),
+        "n_p_eval": int(data.n_p_eval),
+        "n_eval": int(data.n_eval),
+    }
+
+
+@contextmanager
+def profile_request(name: str, timings: Optional[RequestTimings] = None, enabled: bool = True):
+    """
+    Capture a cProfile trace for the enclosed block and save it to PROFILE_DIR.
+    The .prof file can be opened with pstats, snakeviz or converted for speedscope.
+    """
+    if not enabled:
+        yield
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(PROFILE_DIR, f"{stamp}-{name}-{uuid.uuid4().hex[:8]}.prof")
+
+    with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+
+    if timings is not None:
+        timings.profile_path = path
@@ -0,0 +1,201 @@
+import bisect
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# Indexes are cached in this directory next to the model, keyed by file size and mtime
+VOCAB_CACHE_DIR = ".vocab"
+# Bump when the cached arrays change meaning
+VOCAB_INDEX_VERSION = 1
+# Compiled regex masks kept per model
+MAX_CACHED_REGEXES = 32
+
+# Character kinds, one bit each. A token's kinds are the OR over its characters.
+UPPER, LOWER, LETTER, DIGIT, SPACE, PUNCT, OTHER = (1 << i for i in range(7))
+CHAR_CLASSES = {
+    "letter": UPPER | LOWER | LETTER,
+    "upper": UPPER,
+    "lower": LOWER,
+    "digit": DIGIT,
+    "space": SPACE,
+    "punct": PUNCT,
+}
+
+
+def _char_kind(c: str) -> int:
+    if c == "\ufffd":
+        return OTHER  # Decoded from a token that is a partial UTF-8 sequence
+    if c.isupper():
+        return UPPER
+    if c.islower():
+        return LOWER
+    if c.isalpha():
+        return LETTER
+    if c.isdigit():
+        return DIGIT
+    if c.isspace():
+        return SPACE
+    if unicodedata.category(c)[0] in "PS":
+        return PUNCT
+    return OTHER  # Controls, unassigned code points
+
+
+def token_kinds(texts: List[str]) -> np.ndarray:
+    kinds = np.zeros(len(texts), dtype=np.uint8)
+    memo: Dict[str, int] = {}
+    for i, text in enumerate(texts):
+        bits = 0
+        for c in text:
+            kind = memo.get(c)
+            if kind is None:
+                kind = memo[c] = _char_kind(c)
+            bits |= kind
+        kinds[i] = bits
+    return kinds
+
+
+def _prefix_end(prefix: bytes) -> Optional[bytes]:
+    """Smallest byte string greater than every string starting with prefix (None: no bound)."""
+    stripped = prefix.rstrip(b"\xff")
+    if not stripped:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1])
+
+
+class VocabIndex:
+    """
+    Every token's bytes in sorted order, a flattened trie: the tokens starting with a prefix
+    are one contiguous range, found by binary search. Alongside, each token's character
+    kinds as a bitset, so class constraints are one vectorized test over the vocabulary.
+    """
+
+    def __init__(self, blob: bytes, offsets: np.ndarray, order: np.ndarray, kinds: np.ndarray):
+        self.offsets = offsets
+        self.order = order
+        self.kinds = kinds
+        self.pieces = [blob[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        self.sorted_pieces = [self.pieces[i] for i in order]
+        self.texts = [p.decode("utf-8", errors="replace") for p in self.pieces]
+        self._blob = blob
+        self._regexes: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pieces)
+
+    @classmethod
+    def build(cls, pieces: List[bytes]) -> "VocabIndex":
+        offsets = np.zeros(len(pieces) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in pieces])
+        order = np.array(sorted(range(len(pieces)), key=pieces.__getitem__), dtype=np.int32)
+        kinds = token_kinds([p.decode("utf-8", errors="replace") for p in pieces])
+        return cls(b"".join(pieces), offsets, order, kinds)
+
+    @classmethod
+    def for_model(cls, model_path: str, get_pieces: Callable[[], List[bytes]]) -> "VocabIndex":
+        """Load the model's index from the disk cache, building and saving it on a miss."""
+        cache_path = cls.cache_path(model_path)
+        try:
+            with np.load(cache_path) as data:
+                return cls(data["blob"].tobytes(), data["offsets"], data["order"], data["kinds"])
+        except (OSError, KeyError, ValueError):
+            pass
+        index = cls.build(get_pieces())
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = cache_path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                blob=np.frombuffer(index._blob, dtype=np.uint8),
+                offsets=index.offsets,
+                order=index.order,
+                kinds=index.kinds,
+            )
+            os.replace(tmp_path, cache_path)
+            cls._prune_cache(model_path, cache_path)
+        except OSError:
+            pass  # The cache is an optimization; a read-only model dir still works
+        return index
+
+    @staticmethod
+    def _prune_cache(model_path: str, keep: str):
+        """Delete the model's indexes for other sizes, mtimes or versions (replaced or re-downloaded files)."""
+        stale = re.compile(re.escape(os.path.basename(model_path)) + r"\.\d+-\d+\.v\d+\.npz")
+        cache_dir = os.path.dirname(keep)
+        for name in os.listdir(cache_dir):
+            if stale.fullmatch(name) and name != os.path.basename(keep):
+                os.remove(os.path.join(cache_dir, name))
+
+    @staticmethod
+    def cache_path(model_path: str) -> str:
+        stat = os.stat(model_path)
+        name = f"{os.path.basename(model_path)}.{stat.st_size}-{stat.st_mtime_ns}.v{VOCAB_INDEX_VERSION}.npz"
+        return os.path.join(os.path.dirname(model_path), VOCAB_CACHE_DIR, name)
+
+    def prefix_ids(self, prefix: bytes, partial: bool = False) -> np.ndarray:
+        """
+        Tokens whose bytes start with prefix. With partial, also the tokens that are
+        themselves a shorter prefix of it, i.e. every token that can begin spelling it.
+        """
+        lo = bisect.bisect_left(self.sorted_pieces, prefix)
+        end = _prefix_end(prefix)
+        hi = bisect.bisect_left(self.sorted_pieces, end) if end is not None else len(self.sorted_pieces)
+        ids = [self.order[lo:hi]]
+        if partial:
+            for n in range(1, len(prefix)):
+                head = prefix[:n]
+                i = bisect.bisect_left(self.sorted_pieces, head)
+                j = bisect.bisect_right(self.sorted_pieces, head)
+                ids.append(self.order[i:j])
+        return np.concatenate(ids)
+
+    def class_mask(self, classes: List[str]) -> np.ndarray:
+        """Tokens made only of characters in the given classes (see CHAR_CLASSES)."""
+        allowed = 0
+        for name in classes:
+            if name not in CHAR_CLASSES:
+                raise ValueError(f"Unknown character class: {name}")
+            allowed |= CHAR_CLASSES[name]
+        return (self.kinds != 0) & (self.kinds & ~np.uint8(allowed) == 0)
+
+    def regex_mask(self, pattern: str) -> np.ndarray:
+        """Tokens whose text fully matches pattern. Masks are cached per pattern."""
+        with self._lock:
+            mask = self._regexes.get(pattern)
+            if mask is not None:
+                self._regexes.move_to_end(pattern)
+                return mask
+        try:
+            regex = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid regex: {e}")
+        mask = np.fromiter((regex.fullmatch(t) is not None for t in self.texts), dtype=bool, count=len(self))
+        with self._lock:
+            self._regexes[pattern] = mask
+            while len(self._regexes) > MAX_CACHED_REGEXES:
+                self._regexes.popitem(last=False)
+        return mask
+
+    def mask(self, token_filter: Optional[dict]) -> Optional[np.ndarray]:
+        """
+        Allowed-token mask for a filter with any of prefix (+ partial), classes and regex;
+        a token must satisfy all of them. None when the filter constrains nothing.
+        """
+        if not token_filter:
+            return None
+        mask = None
+        if token_filter.get("prefix"):
+            mask = np.zeros(len(self), dtype=bool)
+            mask[self.prefix_ids(token_filter["prefix"].encode("utf-8"), token_filter.get("partial", False))] = True
+        if token_filter.get("classes"):
+            classes = self.class_mask(token_filter["classes"])
+            mask = classes if mask is None else mask & classes
+        if token_filter.get("regex"):
+            regex = self.regex_mask(token_filter["regex"])
+            mask = regex if mask is None else mask & regex
+        return mask
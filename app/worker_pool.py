@@ -0,0 +1,278 @@
+import atexit
+import copy
+import multiprocessing
+import os
+import threading
+import zlib
+from typing import List, Optional, Set
+
+from app.llm import LLMEngine
+from app.model_memory import InsufficientMemoryError
+from app.singleflight import SingleFlight, call_key
+
+# Number of inference worker processes. 0 keeps the single in-process engine.
+NUM_WORKERS = int(os.environ.get("LLM_WORKERS", "0"))
+
+# Engine methods a worker will run on behalf of the router
+WORKER_METHODS = {
+    "get_next_tokens",
+    "get_top_logprobs",
+    "verify_top_logprobs",
+    "draft_tokens",
+    "load_draft_model",
+    "stop_tokens",
+    "chat_template_info",
+    "chat_top_logprobs",
+    "generate_beam_paths",
+    "prefix_tokens",
+    "tokenize",
+    "token_pieces",
+}
+
+# Identical concurrent calls to these share one worker round trip (see SingleFlight)
+COALESCED_METHODS = {"get_next_tokens", "get_top_logprobs"}
+
+
+def partition_cores(num_workers: int, cores: Optional[List[int]] = None) -> List[List[int]]:
+    """Split the usable cores into contiguous groups, one per worker (neighbouring cores share caches)."""
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    groups = []
+    per_worker, extra = divmod(len(cores), num_workers)
+    start = 0
+    for i in range(num_workers):
+        size = per_worker + (1 if i < extra else 0)
+        groups.append(cores[start:start + size] or cores[i % len(cores):i % len(cores) + 1])
+        start += size
+    return groups
+
+
+def serve(conn, engine):
+    """Worker request loop: run engine methods sent over `conn` until told to stop."""
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        method, args, kwargs = message
+        try:
+            if method == "load_model":
+                engine.load_model(*args)
+                result = engine.footprint  # The router keeps it for /models
+            elif method in WORKER_METHODS:
+                result = getattr(engine, method)(*args, **kwargs)
+            else:
+                raise ValueError(f"Unsupported worker method: {method}")
+            # Timings are filled in by the engine; ship them back to the router
+            conn.send(("ok", result, kwargs.get("timings")))
+        except InsufficientMemoryError as e:
+            # Sent as its fields so the router can raise it again (/models/switch answers 507)
+            conn.send(("memory_error", (str(e), e.estimate, e.available), None))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}", None))
+
+
+def _worker_main(conn, model_path: str, cores: List[int]):
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    LLMEngine.model_path_override = model_path
+    LLMEngine.n_threads = len(cores) or None
+    # llama.cpp mmaps the GGUF, so every worker shares the weights through the page cache
+    engine = LLMEngine()
+    conn.send(("ready", engine.footprint, None))
+    serve(conn, engine)
+
+
+class Worker:
+    """Router-side handle for one worker process. Calls are serialized like the engine lock."""
+
+    def __init__(self, index: int, model_path: str, cores: List[int]):
+        self.index = index
+        self.cores = cores
+        self.in_flight = 0
+        self.footprint = None  # Estimated memory of the worker's model (see plan_context)
+        self._lock = threading.Lock()
+        self._start(model_path)
+
+    def _start(self, model_path: str):
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, model_path, self.cores),
+            name=f"llm-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        status, detail, _ = self._conn.recv()
+        if status != "ready":
+            raise RuntimeError(f"Worker {self.index} failed to start: {detail}")
+        self.footprint = detail
+
+    def call(self, method: str, *args, **kwargs):
+        self.in_flight += 1
+        try:
+            with self._lock:
+                self._conn.send((method, args, kwargs))
+                status, result, timings = self._conn.recv()
+        finally:
+            self.in_flight -= 1
+        if status == "memory_error":
+            raise InsufficientMemoryError(*result)
+        if status == "error":
+            raise RuntimeError(result)
+        if timings is not None and kwargs.get("timings") is not None:
+            kwargs["timings"].__dict__.update(timings.__dict__)
+        return result
+
+    def stop(self):
+        try:
+            with self._lock:
+                self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class WorkerEngine:
+    """Drop-in stand-in for LLMEngine that forwards inference to one pool worker."""
+
+    postprocess_candidates = LLMEngine.postprocess_candidates
+
+    def __init__(self, pool: "WorkerPool", worker: Worker):
+        self._pool = pool
+        self._worker = worker
+
+    def __getattr__(self, name):
+        if name in COALESCED_METHODS:
+            return lambda *args, **kwargs: self._coalesced_call(name, *args, **kwargs)
+        if name in WORKER_METHODS:
+            return lambda *args, **kwargs: self._worker.call(name, *args, **kwargs)
+        raise AttributeError(name)
+
+    def _coalesced_call(self, name, *args, **kwargs):
+        """
+        Workers run one call at a time, so duplicates are coalesced here, across all workers,
+        before they queue. Every caller gets its own copy of the result.
+        """
+        options = [x for k in sorted(kwargs) if k != "timings" for x in (k, kwargs[k])]
+        key = call_key(name, self._pool.current_model_path, *args, *options)
+        result = self._pool.flights.do(key, lambda: self._worker.call(name, *args, **kwargs))
+        return copy.deepcopy(result)
+
+    def get_current_model(self) -> str:
+        return self._pool.current_model_path
+
+    def load_model(self, model_path: str):
+        self._pool.load_model(model_path)
+
+
+class WorkerPool:
+    """
+    Optional multi-process inference: N workers, each pinned to its own core group.
+    Requests with a session ID always go to the same worker so its KV cache stays warm.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> Optional["WorkerPool"]:
+        """Return the running pool, starting it on first use. None when LLM_WORKERS is 0."""
+        if NUM_WORKERS <= 0:
+            return None
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    from app.utils import get_model_path
+
+                    cls._instance = cls(NUM_WORKERS, get_model_path())
+                    atexit.register(cls._instance.stop)
+        return cls._instance
+
+    def __init__(self, num_workers: int, model_path: str, workers: Optional[List[Worker]] = None):
+        self.current_model_path = model_path
+        self.flights = SingleFlight()
+        if workers is None:
+            workers = [
+                Worker(i, model_path, cores)
+                for i, cores in enumerate(partition_cores(num_workers))
+            ]
+        self.workers = workers
+        # Workers left without a model by a switch that couldn't be rolled back
+        self.failed_workers: Set[int] = set()
+
+    @property
+    def degraded(self) -> Optional[str]:
+        if not self.failed_workers:
+            return None
+        return (f"{len(self.failed_workers)} of {len(self.workers)} workers have no model loaded "
+                f"(workers {', '.join(str(i) for i in sorted(self.failed_workers))})")
+
+    def worker_for(self, session_id: Optional[str] = None) -> Worker:
+        workers = [w for w in self.workers if w.index not in self.failed_workers] or self.workers
+        if session_id:
+            # crc32 rather than hash() so routing is stable across restarts
+            worker = self.workers[zlib.crc32(session_id.encode("utf-8")) % len(self.workers)]
+            if worker in workers:
+                return worker
+        return min(workers, key=lambda w: w.in_flight)
+
+    def engine_for(self, session_id: Optional[str] = None) -> WorkerEngine:
+        return WorkerEngine(self, self.worker_for(session_id))
+
+    def coalesce_stats(self) -> dict:
+        return self.flights.stats()
+
+    def pids(self) -> List[int]:
+        return [worker.process.pid for worker in self.workers if getattr(worker, "process", None)]
+
+    def footprint_bytes(self) -> int:
+        """
+        Memory a switch would free. The mmapped weights are shared through the page cache, so
+        they count once; the KV cache, logits and scratch buffers are each worker's own.
+        """
+        footprints = [f for f in (getattr(worker, "footprint", None) for worker in self.workers) if f]
+        if not footprints:
+            return 0
+        weights = max(f["weights_bytes"] for f in footprints)
+        return weights + sum(f["total_bytes"] - f["weights_bytes"] for f in footprints)
+
+    def load_model(self, model_path: str):
+        """
+        Switch every worker to model_path. If one fails, the workers tried so far go back to
+        the previous model, so they all keep serving the same one, and the error is raised.
+        Workers that can't reload it either are marked failed and the pool reports itself degraded.
+        """
+        previous = self.current_model_path
+        for i, worker in enumerate(self.workers):
+            try:
+                worker.footprint = worker.call("load_model", model_path)
+            except Exception as e:
+                self._roll_back(self.workers[:i + 1], previous)
+                message = f"Worker {worker.index} failed to load {os.path.basename(model_path)}: {e}"
+                if self.degraded:
+                    message += f"; pool degraded: {self.degraded}"
+                if isinstance(e, InsufficientMemoryError):
+                    raise InsufficientMemoryError(message, e.estimate, e.available) from e
+                raise RuntimeError(message) from e
+        self.current_model_path = model_path
+        self.failed_workers.clear()
+
+    def _roll_back(self, workers: List[Worker], model_path: str):
+        for worker in workers:
+            try:
+                worker.footprint = worker.call("load_model", model_path)
+                self.failed_workers.discard(worker.index)
+            except Exception as e:
+                print(f"Worker {worker.index} failed to reload {os.path.basename(model_path)}: {e}")
+                worker.footprint = None
+                self.failed_workers.add(worker.index)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
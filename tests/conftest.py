@@ -0,0 +1,56 @@
+import pytest
+
+from app.download_manager import DownloadManager
+from app.llm import LLMEngine
+
+
+class ByteEngine:
+    """
+    Stand-in engine: one token per byte after a BOS of 1. The distribution maps the prompt's
+    token IDs to raw top logprobs; every evaluation is recorded as (prompt_tokens, top_k).
+    """
+
+    postprocess_candidates = LLMEngine.postprocess_candidates
+
+    def __init__(self, distribution):
+        self.distribution = distribution
+        self.evaluated = []
+
+    def get_current_model(self):
+        return "/models/a.gguf"
+
+    def prefix_tokens(self):
+        return [1]
+
+    def tokenize(self, data):
+        return list(data)
+
+    def token_pieces(self, token_ids):
+        return [bytes([t]) for t in token_ids]
+
+    def get_top_logprobs(self, prompt_tokens, top_k=40, timings=None):
+        top = self.distribution(list(prompt_tokens))
+        self.evaluated.append((list(prompt_tokens), top_k))
+        return top[:top_k]
+
+    def get_next_tokens(self, prompt, temp=0.8, top_k=40, top_p=0.95, repeat_penalty=1.0, prompt_tokens=None, **kwargs):
+        if prompt_tokens is None:
+            prompt_tokens = self.prefix_tokens() + self.tokenize(prompt.encode())
+        top = self.get_top_logprobs(prompt_tokens, top_k)
+        return self.postprocess_candidates(top, prompt, temp, top_p, repeat_penalty)
+
+
+@pytest.fixture
+def byte_engine():
+    """Builds a ByteEngine from a distribution function."""
+    return ByteEngine
+
+
+@pytest.fixture(autouse=True)
+def download_registry(tmp_path, monkeypatch):
+    # Keep test downloads out of the real registry, which is resumed on server start.
+    # Inference requests create the DownloadManager too (for bandwidth throttling).
+    monkeypatch.setattr("app.download_manager.REGISTRY_PATH", str(tmp_path / "downloads.db"))
+    DownloadManager._instance = None
+    yield
+    DownloadManager._instance = None
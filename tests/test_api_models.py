@@ -1,5 +1,5 @@
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, patch, MagicMock
 from app.main import app
 
 client = TestClient(app)
@@ -18,7 +18,7 @@ def test_list_models(mock_manager_cls):
 @patch("app.main.ModelManager")
 def test_lookup_models(mock_manager_cls):
     mock_instance = mock_manager_cls.return_value
-    mock_instance.list_remote_files.return_value = [{"filename": "remote.gguf"}]
+    mock_instance.list_remote_files = AsyncMock(return_value=[{"filename": "remote.gguf"}])
 
     response = client.get("/models/lookup?repo_id=test/repo")
     assert response.status_code == 200
@@ -26,6 +26,17 @@ def test_lookup_models(mock_manager_cls):
     mock_instance.list_remote_files.assert_called_with("test/repo")
 
 
+@patch("app.main.ModelManager")
+def test_lookup_models_paginates(mock_manager_cls):
+    mock_instance = mock_manager_cls.return_value
+    files = [{"filename": f"m{i}.gguf"} for i in range(5)]
+    mock_instance.list_remote_files = AsyncMock(return_value=files)
+
+    response = client.get("/models/lookup?repo_id=test/repo&offset=2&limit=2")
+    assert response.json() == files[2:4]
+    assert response.headers["X-Total-Count"] == "5"
+
+
 @patch("app.main.ModelManager")
 def test_download_model(mock_manager_cls):
     mock_instance = mock_manager_cls.return_value
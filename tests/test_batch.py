@@ -0,0 +1,118 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app import batch
+from app.batch import BatchManager, BatchParams, plan_lanes, run_batch
+from app.main import app
+
+client = TestClient(app)
+
+
+def echo_last_byte(prompt_tokens):
+    """The candidates depend on the last byte."""
+    if bytes(prompt_tokens[1:]) == b"too long":
+        raise ValueError("Requested tokens exceed context window")
+    return [(chr(prompt_tokens[-1]), -0.1, 100), ("x", -2.4, 101)]
+
+
+def write_prompts(path, prompts):
+    path.write_text("".join(json.dumps(p) + "\n" for p in prompts))
+
+
+def read_output(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    BatchManager._instance = None
+    yield
+    BatchManager._instance = None
+
+
+def test_plan_lanes_groups_shared_prefixes():
+    prompts = ["cat a", "dog b", "cat b", "dog a", "cat c", "dog c"]
+    items = [(list(p.encode()), p) for p in prompts]
+
+    lanes = plan_lanes(items, 2)
+    assert [[p for _, p in lane] for lane in lanes] == [["cat a", "cat b", "cat c"], ["dog a", "dog b", "dog c"]]
+    assert len(plan_lanes(items, 10)) == len(prompts)
+
+
+def test_run_batch_writes_every_prompt(tmp_path, byte_engine):
+    input_path = tmp_path / "prompts.jsonl"
+    output_path = tmp_path / "out.jsonl"
+    write_prompts(input_path, [
+        {"id": "q1", "prompt": "ab"},
+        {"prompt": "aa", "top_k": 1},
+        {"prompt": "too long"},
+    ])
+    engines = [byte_engine(echo_last_byte), byte_engine(echo_last_byte)]
+
+    summary = run_batch(engines, str(input_path), str(output_path), BatchParams(top_p=1.0))
+
+    assert summary == {"total": 3, "done": 3, "failed": 1, "skipped": 0}
+    results = {r["index"]: r for r in read_output(output_path)}
+    assert results[0]["id"] == "q1"
+    assert [c["token"] for c in results[0]["candidates"]] == ["b", "x"]
+    assert [c["token"] for c in results[1]["candidates"]] == ["a"]
+    assert "exceed context" in results[2]["error"]
+
+
+def test_run_batch_resumes_from_output(tmp_path, byte_engine):
+    input_path = tmp_path / "prompts.jsonl"
+    output_path = tmp_path / "out.jsonl"
+    write_prompts(input_path, [{"prompt": p} for p in ["a", "b", "c"]])
+    # A finished line for prompt 1, then a line cut short by a crash
+    output_path.write_text(json.dumps({"index": 1, "candidates": []}) + '\n{"index": 0, "cand')
+
+    engine = byte_engine(echo_last_byte)
+    summary = run_batch([engine], str(input_path), str(output_path), resume=True)
+
+    assert summary["skipped"] == 1
+    assert sorted(bytes(tokens[1:]).decode() for tokens, _ in engine.evaluated) == ["a", "c"]
+    assert sorted(r["index"] for r in read_output(output_path)) == [0, 1, 2]
+
+
+def test_batch_job_endpoint(tmp_path, monkeypatch, byte_engine):
+    monkeypatch.setattr("app.main.BATCH_DIR", str(tmp_path))
+    write_prompts(tmp_path / "prompts.jsonl", [{"prompt": "hi"}, {"prompt": "ho"}])
+    engine = byte_engine(echo_last_byte)
+
+    with patch("app.main.LLMEngine", return_value=engine):
+        missing = client.post("/batch/jobs", json={"input_file": "nope.jsonl"})
+        escaped = client.post("/batch/jobs", json={"input_file": "../prompts.jsonl"})
+        started = client.post("/batch/jobs", json={"input_file": "prompts.jsonl"})
+        job_id = started.json()["job_id"]
+        for _ in range(100):
+            status = client.get(f"/batch/jobs/{job_id}").json()
+            if status["state"] not in ("pending", "in_progress"):
+                break
+            time.sleep(0.01)
+        jobs = client.get("/batch/jobs").json()["jobs"]
+
+    assert missing.status_code == 404
+    assert escaped.status_code == 400
+    assert started.json()["output_file"] == "prompts.out.jsonl"
+    assert status["state"] == "completed"
+    assert status["prompts_done"] == status["total_prompts"] == 2
+    assert status["progress"] == 100.0
+    assert [j["job_id"] for j in jobs] == [job_id]
+    assert len(read_output(tmp_path / "prompts.out.jsonl")) == 2
+    assert client.delete(f"/batch/jobs/{job_id}").status_code == 404
+
+
+def test_cli(tmp_path, byte_engine):
+    input_path = tmp_path / "prompts.jsonl"
+    write_prompts(input_path, [{"prompt": "hi"}])
+    engine = byte_engine(echo_last_byte)
+
+    with patch("app.llm.LLMEngine", return_value=engine):
+        code = batch.main([str(input_path), str(tmp_path / "out.jsonl"), "--model", "m.gguf", "--top-k", "1"])
+
+    assert code == 0
+    assert [c["token"] for c in read_output(tmp_path / "out.jsonl")[0]["candidates"]] == ["i"]
@@ -0,0 +1,173 @@
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+import pytest
+from app.main import app
+from app.llm import LLMEngine
+from app.beam_tree import BeamTree, expand_node, extend_node
+from app.sessions import SessionManager
+
+client = TestClient(app)
+
+
+class TreeEngine:
+    """Stand-in engine: every context has the same three candidates, byte tokens for text."""
+
+    postprocess_candidates = LLMEngine.postprocess_candidates
+
+    def __init__(self):
+        self.evaluated = []
+
+    def get_current_model(self):
+        return "/models/a.gguf"
+
+    def prefix_tokens(self):
+        return [1]
+
+    def tokenize(self, data):
+        return list(data)
+
+    def token_pieces(self, token_ids):
+        return [bytes([t]) if t < 256 else f"<{t}>".encode() for t in token_ids]
+
+    def get_top_logprobs(self, prompt_tokens, top_k=40, timings=None):
+        self.evaluated.append(list(prompt_tokens))
+        return [("<300>", -0.1, 300), ("<301>", -1.0, 301), ("<302>", -3.0, 302)][:top_k]
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    SessionManager._instance = None
+    yield
+    SessionManager._instance = None
+
+
+def test_expand_reuses_cached_distribution():
+    engine = TreeEngine()
+    tree = BeamTree([1, 72, 105], "Hi")
+
+    leaves = expand_node(tree, tree.root, engine, num_paths=2, depth=1, top_p=1.0)
+    assert len(leaves) == 2
+    assert engine.evaluated == [[1, 72, 105]]
+
+    expand_node(tree, tree.root, engine, num_paths=2, depth=1, top_p=1.0)
+    assert len(engine.evaluated) == 1
+
+
+def test_extend_decodes_from_node_and_keeps_id():
+    engine = TreeEngine()
+    tree = BeamTree([1, 72], "H")
+    leaf = expand_node(tree, tree.root, engine, num_paths=1, depth=1)[0]
+
+    extended = extend_node(tree, leaf, engine)
+
+    assert extended is leaf
+    assert engine.evaluated[-1] == [1, 72, 300]
+    assert tree.to_path(leaf)["text"] == "H<300><300>"
+
+
+def test_distributions_inside_a_grown_leaf_survive_a_split():
+    engine = TreeEngine()
+    tree = BeamTree([1, 72], "H")
+    leaf = expand_node(tree, tree.root, engine, num_paths=1, depth=3, top_p=1.0)[0]
+    assert len(engine.evaluated) == 3
+
+    # Branching off after the first generated token splits the leaf there
+    branch = tree.insert(tree.root, [300, 301], [{"token": "<300>", "prob": 0.5}] * 2)
+    expand_node(tree, branch.parent, engine, num_paths=2, depth=1, top_p=1.0)
+
+    assert len(engine.evaluated) == 3
+    assert [n for n, _ in tree.path_distributions(leaf)] == [2, 3, 4]
+
+
+def test_insert_splits_shared_prefix_and_remove_prunes():
+    tree = BeamTree([1], "")
+    steps = [{"token": "a", "prob": 0.5}, {"token": "b", "prob": 0.5}, {"token": "c", "prob": 0.5}]
+    first = tree.insert(tree.root, [10, 11, 12], steps)
+    second = tree.insert(tree.root, [10, 11, 13], steps)
+
+    assert first.parent is second.parent
+    assert first.parent.token_ids == [10, 11]
+    assert tree.path_tokens(first) == [1, 10, 11, 12]
+
+    tree.remove(first.node_id)
+    tree.remove(second.node_id)
+    assert list(tree.nodes) == [tree.root.node_id]
+
+
+def test_adopt_moves_session_context():
+    engine = TreeEngine()
+    manager = SessionManager()
+    session = manager.sync_text("s1", "Hi", engine)
+    tree = manager.beam_tree(session)
+    leaf = expand_node(tree, tree.root, engine, num_paths=1, depth=2)[0]
+    version = session.version
+
+    manager.adopt_beam_node("s1", leaf.node_id, engine)
+
+    assert session.text == "Hi<300><300>"
+    assert session.token_ids == [1, 72, 105, 300, 300]
+    assert session.version > version
+    assert tree.root is leaf
+    assert manager.beam_tree(session) is tree
+    # Both generated tokens were taken from cached distributions, the second from inside the leaf's edge
+    assert session.history.steps == 2
+    assert session.history.step(1)["context_len"] == 4
+
+
+def test_session_beam_endpoints():
+    engine = TreeEngine()
+    with patch("app.main.LLMEngine", return_value=engine):
+        search = client.post("/sessions/abc/beam/search", json={
+            "ops": [{"op": "set_text", "text": "Hi"}],
+            "num_paths": 2,
+            "top_p": 1.0,
+        })
+        paths = search.json()["paths"]
+        extend = client.post(f"/sessions/abc/beam/{paths[0]['id']}/extend", json={})
+        deleted = client.delete(f"/sessions/abc/beam/{paths[1]['id']}")
+        missing = client.post(f"/sessions/abc/beam/{paths[1]['id']}/extend", json={})
+
+    assert search.status_code == 200
+    assert len(paths) == 2
+    assert extend.json()["path"]["id"] == paths[0]["id"]
+    assert len(extend.json()["path"]["tokens"]) == 2
+    assert deleted.status_code == 200
+    assert missing.status_code == 404
+
+
+def test_model_switch_drops_beam_tree():
+    engine = TreeEngine()
+    manager = SessionManager()
+    session = manager.sync_text("s1", "Hi", engine)
+    tree = manager.beam_tree(session)
+    leaf = expand_node(tree, tree.root, engine, num_paths=1, depth=1)[0]
+
+    # Same bytes tokenize to the same IDs under another model, but the tree is still stale
+    engine.get_current_model = lambda: "/models/b.gguf"
+    assert manager.beam_node(session, leaf.node_id, engine) is None
+    with pytest.raises(KeyError):
+        manager.adopt_beam_node("s1", leaf.node_id, engine)
+    with patch("app.main.LLMEngine", return_value=engine):
+        extend = client.post(f"/sessions/s1/beam/{leaf.node_id}/extend", json={})
+    assert extend.status_code == 404
+
+    session = manager.sync_text("s1", "Hi", engine)
+    assert session.token_ids == tree.root.token_ids
+    assert manager.beam_tree(session) is not tree
+
+
+def test_remove_keeps_paths_running_through_the_node():
+    tree = BeamTree([1], "")
+    steps = [{"token": "a", "prob": 0.5}] * 3
+    short = tree.insert(tree.root, [10, 11], steps[:2])
+    longer = tree.insert(tree.root, [10, 11, 12], steps)
+    assert longer.parent is short
+
+    assert tree.remove(short.node_id)
+    assert tree.get(longer.node_id) is longer
+    assert tree.path_tokens(longer) == [1, 10, 11, 12]
+    # Now only a split point, not a path
+    assert not tree.remove(short.node_id)
+
+    tree.remove(longer.node_id)
+    assert list(tree.nodes) == [tree.root.node_id]
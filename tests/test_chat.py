@@ -0,0 +1,109 @@
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app import chat
+from app.chat import build_prompt, render
+from app.llm import LLMEngine
+from app.main import app
+
+client = TestClient(app)
+
+TEMPLATE = (
+    "{{ bos_token }}{% for m in messages %}<|{{ m['role'] }}|>{{ m['content'] }}<|end|>{% endfor %}"
+    "{% if add_generation_prompt %}<|assistant|>{% endif %}"
+)
+SPECIAL = ["<s>", "<|system|>", "<|user|>", "<|assistant|>", "<|end|>"]
+
+
+class ChatEngine:
+    """Stand-in engine: special tokens are single tokens, everything else one token per byte."""
+
+    postprocess_candidates = LLMEngine.postprocess_candidates
+
+    def __init__(self, template=TEMPLATE):
+        self.template = template
+        self.calls = []
+
+    def get_current_model(self):
+        return "/models/chat.gguf"
+
+    def chat_template_info(self):
+        return {"template": self.template, "bos_token": "<s>", "eos_token": "<|end|>", "stop": []}
+
+    def prefix_tokens(self):
+        return [1000]
+
+    def tokenize(self, data):
+        ids = []
+        while data:
+            special = next((s for s in SPECIAL if data.startswith(s.encode())), None)
+            if special:
+                ids.append(1000 + SPECIAL.index(special))
+                data = data[len(special):]
+            else:
+                ids.append(data[0])
+                data = data[1:]
+        return ids
+
+    def token_pieces(self, token_ids):
+        return [SPECIAL[t - 1000].encode() if t >= 1000 else bytes([t]) for t in token_ids]
+
+    def chat_top_logprobs(self, prompt_tokens, boundaries, top_k=40, timings=None):
+        self.calls.append((list(prompt_tokens), list(boundaries)))
+        return {"top_logprobs": [("Hi", -0.2, 72), ("Yo", -1.8, 89)], "restored_tokens": boundaries[-1]}
+
+
+MESSAGES = [
+    {"role": "system", "content": "Be brief"},
+    {"role": "user", "content": "Hello"},
+]
+
+
+def setup_function():
+    chat._prompts.clear()
+
+
+def test_render_uses_gguf_template_and_falls_back_to_chatml():
+    info = ChatEngine().chat_template_info()
+    assert render(info, MESSAGES, True) == "<s><|system|>Be brief<|end|><|user|>Hello<|end|><|assistant|>"
+
+    info["template"] = None
+    assert render(info, MESSAGES[1:], True) == "<|im_start|>user\nHello<|im_end|>\n<|im_start|>assistant\n"
+
+
+def test_build_prompt_marks_turn_boundaries():
+    engine = ChatEngine()
+    built = build_prompt(engine, MESSAGES, assistant_prefix="Su")
+
+    ids = built["token_ids"]
+    # The template's BOS text becomes the model's BOS token, not a second one
+    assert ids.count(1000) == 1
+    assert ids[-2:] == [ord("S"), ord("u")]
+    # Each boundary falls right after a turn's end token
+    assert [ids[b - 1] for b in built["boundaries"]] == [1004, 1004]
+    assert built["boundaries"][1] == len(ids) - 3  # then <|assistant|> and the prefix
+    assert built["stop"] == ["<|end|>"]
+
+
+def test_build_prompt_is_cached_per_conversation():
+    engine = ChatEngine()
+    with patch.object(chat, "render", wraps=chat.render) as spy:
+        build_prompt(engine, MESSAGES, "a")
+        calls = spy.call_count
+        build_prompt(engine, MESSAGES, "ab")
+    assert spy.call_count == calls
+
+
+def test_chat_endpoint():
+    engine = ChatEngine()
+    with patch("app.main.LLMEngine", return_value=engine):
+        response = client.post("/chat", json={"messages": MESSAGES, "assistant_prefix": "", "top_p": 1.0})
+        rendered = client.post("/chat/render", json={"messages": MESSAGES})
+
+    data = response.json()
+    assert response.status_code == 200
+    assert data["prompt"].endswith("<|assistant|>")
+    assert [c["token"] for c in data["candidates"]] == ["Hi", "Yo"]
+    assert data["restored_tokens"] == engine.calls[0][1][-1]
+    assert data["stop"] == ["<|end|>"]
+    assert rendered.json()["prompt"] == "<s><|system|>Be brief<|end|><|user|>Hello<|end|>"
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from app.download_manager import BandwidthLimiter, DownloadManager, DownloadState
+from app.main import download_event_stream
+
+
+class FakeRequest:
+    async def is_disconnected(self):
+        return False
+
+
+@pytest.fixture(autouse=True)
+def model_dir(tmp_path, monkeypatch):
+    # The registry is redirected for every test in conftest.py
+    monkeypatch.setattr("app.download_manager.MODEL_DIR", str(tmp_path))
+
+
+def test_subscription_coalesces_and_throttles_progress():
+    manager = DownloadManager()
+
+    async def run():
+        subscription = manager.subscribe()
+        download_id = manager.create_download("user/repo", "model.gguf")
+
+        def worker():
+            for i in range(1, 50):
+                manager.update_progress(download_id, progress=i, bytes_downloaded=i, total_bytes=100)
+            manager.set_state(download_id, DownloadState.COMPLETED)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+
+        events = await subscription.next_events(timeout=1)
+        manager.unsubscribe(subscription)
+        return events
+
+    events = asyncio.run(run())
+
+    # Only the latest state per download is delivered
+    assert len(events) == 1
+    assert events[0]["state"] == "completed"
+    assert events[0]["progress"] == 49
+    assert manager._subscribers == []
+
+
+def test_progress_without_subscribers_is_not_published():
+    manager = DownloadManager()
+    download_id = manager.create_download("user/repo", "model.gguf")
+    manager.update_progress(download_id, progress=10.0)
+
+    assert manager._last_published == {}
+
+
+def test_event_stream_sends_snapshot_then_changes():
+    manager = DownloadManager()
+    existing = manager.create_download("user/repo", "a.gguf")
+
+    async def run():
+        stream = download_event_stream(FakeRequest())
+        snapshot = await stream.__anext__()
+        manager.set_state(existing, DownloadState.IN_PROGRESS)
+        change = await stream.__anext__()
+        await stream.aclose()
+        return snapshot, change
+
+    snapshot, change = asyncio.run(run())
+
+    assert snapshot.startswith("event: snapshot\n")
+    data = json.loads(snapshot.split("data: ", 1)[1])
+    assert data["active_count"] == 1
+    assert change.startswith("event: download\n")
+    assert json.loads(change.split("data: ", 1)[1])["state"] == "in_progress"
+    assert manager._subscribers == []
+
+
+def test_scheduler_limits_concurrency_and_honours_priority():
+    manager = DownloadManager()
+    manager.max_concurrent = 1
+    release = threading.Event()
+    started = []
+
+    def make_download(name, download_id):
+        def run():
+            manager.set_state(download_id, DownloadState.IN_PROGRESS)
+            started.append(name)
+            release.wait(timeout=5)
+            manager.set_state(download_id, DownloadState.COMPLETED)
+        return run
+
+    ids = {name: manager.create_download("user/repo", f"{name}.gguf") for name in ("a", "b", "c")}
+    manager.start_download_thread(ids["a"], make_download("a", ids["a"]))
+    manager.start_download_thread(ids["b"], make_download("b", ids["b"]))
+    manager.start_download_thread(ids["c"], make_download("c", ids["c"]), priority=5)
+
+    time.sleep(0.1)
+    assert started == ["a"]
+    assert manager.get_download(ids["b"]).state == DownloadState.PENDING
+    assert manager.queued_count() == 2
+
+    release.set()
+    for _ in range(50):
+        if len(started) == 3 and not manager._active_threads:
+            break
+        time.sleep(0.05)
+    assert started == ["a", "c", "b"]
+
+
+def test_cancelled_queued_download_never_starts():
+    manager = DownloadManager()
+    manager.max_concurrent = 0
+    ran = []
+    download_id = manager.create_download("user/repo", "a.gguf")
+    manager.start_download_thread(download_id, lambda: ran.append(True))
+
+    manager.cancel_download(download_id)
+    manager.max_concurrent = 1
+    manager._dispatch()
+
+    assert ran == []
+    assert manager.queued_count() == 0
+
+
+def test_bandwidth_throttles_during_inference():
+    manager = DownloadManager()
+    manager.bandwidth_limit = 10_000_000
+    manager.inference_bandwidth_limit = 1_000_000
+    assert manager.current_bandwidth_limit() == 10_000_000
+
+    manager.inference_started()
+    assert manager.current_bandwidth_limit() == 1_000_000
+    manager.inference_finished()
+    # Still throttled for a short quiet period after the request
+    assert manager.current_bandwidth_limit() == 1_000_000
+
+
+def test_limiter_sleeps_to_hold_rate():
+    limiter = BandwidthLimiter(lambda: 100_000)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.consume(10_000)
+    assert time.monotonic() - start >= 0.25
+
+
+def test_cleanup_runs_automatically(monkeypatch):
+    manager = DownloadManager()
+    download_id = manager.create_download("user/repo", "a.gguf")
+    manager.set_state(download_id, DownloadState.COMPLETED)
+    manager.get_download(download_id).completed_at = manager.get_download(download_id).started_at.replace(year=2000)
+
+    manager._last_cleanup = 0.0
+    monkeypatch.setattr("app.download_manager.CLEANUP_INTERVAL_SECONDS", 0)
+    assert manager.get_all_downloads() == []
+
+
+def test_registry_restores_history_and_reconciles_interrupted(tmp_path):
+    manager = DownloadManager()
+    done = manager.create_download("user/repo", "done.gguf")
+    manager.set_state(done, DownloadState.COMPLETED)
+    partial = manager.create_download("user/repo", "partial.gguf")
+    manager.set_state(partial, DownloadState.IN_PROGRESS)
+    manager.update_progress(partial, progress=10.0, bytes_downloaded=10, total_bytes=100)
+    finished = manager.create_download("user/repo", "sub/finished.gguf")
+    manager.set_state(finished, DownloadState.IN_PROGRESS)
+
+    (tmp_path / "partial.gguf.part.json").write_text(
+        json.dumps({"total_bytes": 100, "chunk_size": 30, "done": [0, 3]})
+    )
+    (tmp_path / "finished.gguf").write_bytes(b"x" * 42)
+
+    # Simulate a restart
+    DownloadManager._instance = None
+    restarted = DownloadManager()
+
+    assert restarted.get_download(done).state == DownloadState.COMPLETED
+    assert restarted.get_download(partial).state == DownloadState.PENDING
+    assert restarted.get_download(partial).bytes_downloaded == 40
+    assert restarted.get_download(finished).state == DownloadState.COMPLETED
+    assert restarted.get_download(finished).total_bytes == 42
+
+    resumed = []
+    count = restarted.resume_interrupted(lambda d: lambda: resumed.append(d.filename))
+    for _ in range(50):
+        if resumed:
+            break
+        time.sleep(0.02)
+    assert count == 1
+    assert resumed == ["partial.gguf"]
+
+
+def test_progress_writes_are_batched():
+    manager = DownloadManager()
+    download_id = manager.create_download("user/repo", "a.gguf")
+    saves = []
+    original_save = manager._registry.save
+    manager._registry.save = lambda records: saves.append(records) or original_save(records)
+
+    for i in range(20):
+        manager.update_progress(download_id, progress=i, bytes_downloaded=i, total_bytes=100)
+    assert saves == []
+
+    manager.flush()
+    assert len(saves) == 1
+    assert saves[0][0]["bytes_downloaded"] == 19
+
+
+def test_download_that_returns_without_finishing_is_failed():
+    manager = DownloadManager()
+    download_id = manager.create_download("user/repo", "a.gguf")
+    manager.start_download_thread(download_id, lambda: None)
+    for _ in range(50):
+        if not manager._active_threads:
+            break
+        time.sleep(0.01)
+
+    download = manager.get_download(download_id)
+    assert download.state == DownloadState.FAILED
+    # Not picked up again on the next start
+    DownloadManager._instance = None
+    assert DownloadManager().resume_interrupted(lambda d: lambda: None) == 0
+
+
+def test_second_download_of_the_same_file_reuses_the_first():
+    manager = DownloadManager()
+    manager.max_concurrent = 0
+    first = manager.create_download("user/repo", "a.gguf")
+    manager.start_download_thread(first, lambda: None)
+
+    # Same local file, even from another repo or folder
+    again = manager.create_download("other/repo", "sub/a.gguf")
+    manager.start_download_thread(again, lambda: None)
+
+    assert again == first
+    assert manager.queued_count() == 1
+    manager.cancel_download(first)
+    assert manager.create_download("user/repo", "a.gguf") != first
@@ -0,0 +1,88 @@
+import numpy as np
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app import encoding
+from app.encoding import BINARY, COLUMNAR_JSON, decode_binary, encode_binary
+from app.main import app
+
+client = TestClient(app)
+
+CANDIDATES = [
+    {"token": " world", "prob": 75.0, "logprob": -0.3, "cumulative_prob": 75.0, "token_id": 1917},
+    {"token": " there", "prob": 25.0, "logprob": -1.4, "cumulative_prob": 100.0, "excluded": True},
+]
+PATHS = [
+    {"id": "a", "text": "Hi there", "tokens": [{"token": " there", "prob": 0.5}], "cumulative_prob": 0.5},
+    {"id": "b", "text": "Hi you all", "tokens": [{"token": " you", "prob": 0.4}, {"token": " all", "prob": 0.5}],
+     "cumulative_prob": 0.2},
+]
+
+
+def test_binary_round_trip():
+    data = encode_binary({
+        "session_version": 7,
+        "token": ["a", "b", "c"],
+        "prob": np.array([0.5, 0.25, 0.125], dtype="<f4"),
+        "excluded": np.array([1, 0, 1], dtype="u1"),
+        "token_id": np.array([1, -1, 3], dtype="<i4"),
+    })
+    assert len(data) % 4 == 0
+
+    decoded = decode_binary(data)
+    assert decoded["session_version"] == 7
+    assert decoded["token"] == ["a", "b", "c"]
+    assert decoded["prob"].tolist() == [0.5, 0.25, 0.125]
+    assert decoded["excluded"].tolist() == [1, 0, 1]
+    assert decoded["token_id"].tolist() == [1, -1, 3]
+
+
+@patch("app.main.LLMEngine")
+def test_next_tokens_json_fills_defaults(mock_engine_cls):
+    mock_engine_cls.return_value.get_next_tokens.return_value = [dict(c, extra="dropped") for c in CANDIDATES]
+
+    response = client.post("/next-tokens", json={"text": "Hello"})
+
+    assert response.headers["content-type"] == "application/json"
+    candidates = response.json()["candidates"]
+    assert candidates[0] == {**CANDIDATES[0], "excluded": False}
+    assert candidates[1] == {**CANDIDATES[1], "token_id": None}
+
+
+@patch("app.main.LLMEngine")
+def test_next_tokens_binary(mock_engine_cls):
+    mock_engine_cls.return_value.get_next_tokens.return_value = CANDIDATES
+
+    response = client.post("/next-tokens", json={"text": "Hello"}, headers={"Accept": BINARY})
+
+    assert response.headers["content-type"] == BINARY
+    data = decode_binary(response.content)
+    assert data["token"] == [" world", " there"]
+    assert data["token_id"].tolist() == [1917, -1]
+    assert data["excluded"].tolist() == [0, 1]
+    np.testing.assert_allclose(data["prob"], [75.0, 25.0])
+    assert data["timings"] is None
+
+
+@patch("app.main.LLMEngine")
+def test_beam_search_columnar_json(mock_engine_cls):
+    mock_engine_cls.return_value.generate_beam_paths.return_value = PATHS
+
+    response = client.post("/beam/search", json={"context": "Hi"}, headers={"Accept": COLUMNAR_JSON})
+
+    assert response.headers["content-type"] == COLUMNAR_JSON
+    data = response.json()
+    assert data["id"] == ["a", "b"]
+    assert data["token_offsets"] == [0, 1, 3]
+    assert data["token"] == [" there", " you", " all"]
+    assert "paths" not in data
+
+
+def test_msgpack_falls_back_to_json_when_unavailable(monkeypatch):
+    monkeypatch.setattr(encoding, "msgpack", None)
+    with patch("app.main.LLMEngine") as mock_engine_cls:
+        mock_engine_cls.return_value.get_next_tokens.return_value = CANDIDATES
+        response = client.post("/next-tokens", json={"text": "Hello"}, headers={"Accept": "application/msgpack"})
+
+    assert response.headers["content-type"] == "application/json"
+    assert len(response.json()["candidates"]) == 2
@@ -0,0 +1,98 @@
+import os
+import struct
+from unittest.mock import patch
+from app.gguf_catalog import ModelCatalog, summarize_gguf
+
+
+def _string(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("<Q", len(data)) + data
+
+
+def write_gguf(path, name="tiny", vocab=100):
+    """Minimal GGUF v3: a few KV pairs, a token array and two tensor infos, no tensor data."""
+    kvs = [
+        (_string("general.architecture"), 8, _string("llama")),
+        (_string("general.name"), 8, _string(name)),
+        (_string("general.file_type"), 4, struct.pack("<I", 15)),
+        (_string("llama.context_length"), 4, struct.pack("<I", 4096)),
+        (_string("llama.block_count"), 4, struct.pack("<I", 2)),
+        (_string("tokenizer.chat_template"), 8, _string("{{ messages }}")),
+        (
+            _string("tokenizer.ggml.tokens"),
+            9,
+            struct.pack("<IQ", 8, vocab) + b"".join(_string(f"t{i}") for i in range(vocab)),
+        ),
+    ]
+    tensors = [("token_embd.weight", [64, vocab]), ("output_norm.weight", [64])]
+    with open(path, "wb") as f:
+        f.write(b"GGUF" + struct.pack("<IQQ", 3, len(tensors), len(kvs)))
+        for key, value_type, value in kvs:
+            f.write(key + struct.pack("<I", value_type) + value)
+        for tensor_name, dims in tensors:
+            f.write(_string(tensor_name) + struct.pack("<I", len(dims)))
+            f.write(b"".join(struct.pack("<Q", d) for d in dims))
+            f.write(struct.pack("<IQ", 0, 0))
+
+
+def test_summarize_reads_header_only_fields(tmp_path):
+    path = str(tmp_path / "tiny.gguf")
+    write_gguf(path)
+
+    info = summarize_gguf(path)
+
+    assert info["name"] == "tiny"
+    assert info["architecture"] == "llama"
+    assert info["quantization"] == "Q4_K_M"
+    assert info["context_length"] == 4096
+    assert info["vocab_size"] == 100
+    assert info["parameter_count"] == 64 * 100 + 64
+    assert info["chat_template"] == "{{ messages }}"
+
+
+def test_catalog_parses_each_file_once_until_it_changes(tmp_path):
+    path = str(tmp_path / "tiny.gguf")
+    write_gguf(path)
+    catalog = ModelCatalog(str(tmp_path))
+
+    with patch("app.gguf_catalog.summarize_gguf", wraps=summarize_gguf) as parse:
+        assert catalog.list()[0]["gguf"]["name"] == "tiny"
+        catalog.list()
+        assert parse.call_count == 1
+
+        write_gguf(path, name="renamed", vocab=120)
+        assert catalog.get(path)["gguf"]["name"] == "renamed"
+        assert parse.call_count == 2
+
+    # A fresh catalog is warm from catalog.json
+    with patch("app.gguf_catalog.summarize_gguf") as parse:
+        assert ModelCatalog(str(tmp_path)).list()[0]["gguf"]["vocab_size"] == 120
+        parse.assert_not_called()
+
+
+def test_catalog_notices_a_file_rewritten_in_place(tmp_path):
+    path = str(tmp_path / "tiny.gguf")
+    write_gguf(path)
+    catalog = ModelCatalog(str(tmp_path))
+    catalog.list()  # Writing catalog.json changed the directory mtime once
+    assert catalog.list()[0]["gguf"]["name"] == "tiny"
+    dir_stat = os.stat(tmp_path)
+
+    write_gguf(path, name="redownloaded", vocab=120)
+    os.utime(tmp_path, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+    assert catalog.list()[0]["gguf"]["name"] == "redownloaded"
+
+
+def test_catalog_drops_removed_files_and_records_bad_ones(tmp_path):
+    good = str(tmp_path / "good.gguf")
+    write_gguf(good)
+    (tmp_path / "broken.gguf").write_bytes(b"not a model")
+    catalog = ModelCatalog(str(tmp_path))
+
+    entries = catalog.list()
+    assert [os.path.basename(e["path"]) for e in entries] == ["broken.gguf", "good.gguf"]
+    assert entries[0]["gguf"] is None and "not a GGUF" in entries[0]["error"]
+
+    os.remove(good)
+    assert len(catalog.list()) == 1
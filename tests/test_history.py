@@ -0,0 +1,145 @@
+import io
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.history import SessionHistory
+from app.main import app
+from app.schemas import ContextOp
+from app.sessions import SessionManager
+
+client = TestClient(app)
+
+
+def test_ring_buffer_grows_then_overwrites_oldest():
+    history = SessionHistory(max_steps=100, top_k=3)
+    for i in range(130):
+        history.record(i, 7, [7, 8, 9, 10], [-0.1, -1.0, -2.0, -3.0])
+
+    assert history.capacity == 100
+    assert history.steps == history.position == 100
+    assert history.step(0)["context_len"] == 30
+    assert history.step(99)["context_len"] == 129
+    step = history.step(99)
+    # Only top_k candidates are kept, logprobs as float16
+    assert step["candidate_ids"] == [7, 8, 9] and step["rank"] == 0
+    assert step["logprobs"] == pytest.approx([-0.1, -1.0, -2.0], abs=1e-3)
+    assert history.logprobs.dtype == np.float16 and history.candidate_ids.dtype == np.int32
+
+
+def test_recording_after_undo_drops_redo_steps():
+    history = SessionHistory(max_steps=10, top_k=2)
+    for i in range(3):
+        history.record(i, 5, [4, 5], [-0.5, -1.0])
+    history.position = 1
+    history.record(1, 6, [4, 5], [-0.5, -1.0])
+
+    assert history.steps == history.position == 2
+    assert history.step(1)["token_id"] == 6 and history.step(1)["rank"] == -1
+
+
+def test_npz_export():
+    history = SessionHistory(max_steps=10, top_k=2)
+    history.record(3, 5, [4, 5], [-0.5, -1.0])
+    data = np.load(io.BytesIO(history.to_npz()))
+
+    assert data["token_id"].tolist() == [5]
+    assert data["rank"].tolist() == [1]
+    assert data["candidate_ids"].tolist() == [[4, 5]]
+    assert int(data["position"]) == 1
+
+
+def a_or_b(prompt_tokens):
+    """The next token is always 'a' or 'b'."""
+    return [("a", -0.3, ord("a")), ("b", -1.4, ord("b"))]
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    SessionManager._instance = None
+    yield
+    SessionManager._instance = None
+
+
+def test_undo_restores_distribution_without_inference(byte_engine):
+    engine = byte_engine(a_or_b)
+    with patch("app.main.LLMEngine", return_value=engine):
+        first = client.post("/sessions/s/next-tokens", json={"ops": [{"op": "set_text", "text": "x"}]}).json()
+        # The user takes "b", the second candidate
+        client.post("/sessions/s/next-tokens", json={
+            "base_version": first["session_version"],
+            "ops": [{"op": "append_text", "text": "b"}],
+        })
+        calls = len(engine.evaluated)
+        undone = client.post("/sessions/s/history/undo", json={"top_p": 1.0})
+        nothing = client.post("/sessions/s/history/undo")
+        redone = client.post("/sessions/s/history/redo")
+        info = client.get("/sessions/s/history").json()
+        export = client.get("/sessions/s/history/export")
+
+    assert len(engine.evaluated) == calls
+    data = undone.json()
+    assert data["text"] == "x"
+    assert [c["token"] for c in data["candidates"]] == ["a", "b"]
+    assert data["position"] == 0 and data["steps"] == 1
+    assert nothing.status_code == 409
+    assert redone.json()["text"] == "xb"
+    assert info["steps"] == info["position"] == 1
+    assert np.load(io.BytesIO(export.content))["rank"].tolist() == [1]
+
+
+def test_observe_op_records_token_taken_after_cached_distribution(byte_engine):
+    engine = byte_engine(a_or_b)
+    with patch("app.main.LLMEngine", return_value=engine):
+        first = client.post("/sessions/s/next-tokens", json={"ops": [{"op": "set_text", "text": "x"}]}).json()
+        # "a" is taken, then the client shows its cached distribution after "xa" and takes "b"
+        client.post("/sessions/s/next-tokens", json={
+            "base_version": first["session_version"],
+            "ops": [
+                {"op": "append_text", "text": "a"},
+                {"op": "observe", "token_ids": [ord("b"), ord("a")], "logprobs": [-0.2, -1.7]},
+                {"op": "append_text", "text": "b"},
+            ],
+        })
+
+    history = SessionManager().get_session("s").history
+    assert history.steps == 2
+    assert history.step(1)["context_len"] == 3 and history.step(1)["token_id"] == ord("b")
+    assert history.step(1)["candidate_ids"] == [ord("b"), ord("a")]
+
+
+def test_offered_steps_are_recorded_when_taken(byte_engine):
+    engine = byte_engine(a_or_b)
+    manager = SessionManager()
+    session = manager.sync_text("s", "x", engine)
+    step = lambda token: {
+        "token_id": ord(token),
+        "candidates": [{"token_id": ord("a"), "logprob": -0.3}, {"token_id": ord("b"), "logprob": -1.4}],
+    }
+    manager.offer(session, list(session.token_ids), [step("a"), step("b"), step("a")])
+    # The client takes two of the generated tokens, then types something else
+    manager.apply_ops("s", session.version, [ContextOp(op="append_text", text="abz")], engine)
+
+    history = session.history
+    assert [history.step(i)["token_id"] for i in range(history.steps)] == [ord("a"), ord("b"), ord("z")]
+    assert [history.step(i)["rank"] for i in range(history.steps)] == [0, 1, -1]
+    assert not session.offered
+
+
+def test_adopting_a_beam_path_records_its_cached_steps(byte_engine):
+    engine = byte_engine(a_or_b)
+    manager = SessionManager()
+    session = manager.sync_text("s", "x", engine)
+    tree = manager.beam_tree(session)
+    tree.root.top_logprobs = [("a", -0.3, ord("a")), ("b", -1.4, ord("b"))]
+    middle = tree.insert(tree.root, [ord("b")], [{"token": "b", "prob": 0.25}])
+    middle.top_logprobs = [("a", -0.1, ord("a"))]
+    leaf = tree.insert(middle, [ord("a")], [{"token": "a", "prob": 0.9}])
+    manager.adopt_beam_node("s", leaf.node_id, engine)
+
+    history = session.history
+    assert session.text == "xba"
+    assert [history.step(i)["token_id"] for i in range(history.steps)] == [ord("b"), ord("a")]
+    assert history.step(0)["rank"] == 1
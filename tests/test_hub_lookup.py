@@ -0,0 +1,82 @@
+import asyncio
+import httpx
+from app.hub_lookup import HubLookup
+
+
+def make_hub(pages, etag='"v1"'):
+    """Stand-in Hub: serves `pages` of tree entries linked by cursor and honours If-None-Match."""
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        page = int(request.url.params.get("cursor", "0"))
+        headers = {"ETag": etag}
+        if page + 1 < len(pages):
+            next_url = f"{request.url.copy_set_param('cursor', page + 1)}"
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return httpx.Response(200, json=pages[page], headers=headers)
+
+    return httpx.MockTransport(handler), requests
+
+
+PAGES = [
+    [
+        {"type": "file", "path": "model-Q4_K_M.gguf", "size": 5 * 1024 * 1024},
+        {"type": "file", "path": "README.md", "size": 10},
+    ],
+    [
+        {"type": "directory", "path": "sub"},
+        {"type": "file", "path": "sub/model-Q8_0.gguf", "size": 8 * 1024 * 1024},
+    ],
+]
+
+
+def test_lookup_walks_pages_and_caches():
+    transport, requests = make_hub(PAGES)
+    lookup = HubLookup(endpoint="http://mirror.local", transport=transport)
+
+    async def run():
+        first = await lookup.list_gguf_files("user/repo")
+        second = await lookup.list_gguf_files("user/repo")
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first == [
+        {"filename": "model-Q4_K_M.gguf", "size_mb": 5.0},
+        {"filename": "sub/model-Q8_0.gguf", "size_mb": 8.0},
+    ]
+    assert second == first
+    assert len(requests) == 2  # two pages, then served from cache
+    assert requests[0].url.host == "mirror.local"
+    assert requests[0].url.path == "/api/models/user/repo/tree/main"
+
+
+def test_expired_listing_is_revalidated_with_etag():
+    transport, requests = make_hub(PAGES)
+    lookup = HubLookup(endpoint="http://mirror.local", ttl=0, transport=transport)
+
+    async def run():
+        await lookup.list_gguf_files("user/repo")
+        return await lookup.list_gguf_files("user/repo")
+
+    files = asyncio.run(run())
+
+    assert len(files) == 2
+    assert len(requests) == 3
+    assert requests[-1].headers["If-None-Match"] == '"v1"'
+
+
+def test_concurrent_lookups_share_one_fetch():
+    transport, requests = make_hub([PAGES[0]])
+    lookup = HubLookup(endpoint="http://mirror.local", transport=transport)
+
+    async def run():
+        return await asyncio.gather(*(lookup.list_gguf_files("user/repo") for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert all(r == results[0] for r in results)
+    assert len(requests) == 1
@@ -44,3 +44,24 @@ def test_get_next_tokens(mock_get_path, mock_llama):
         echo=False,
     )
     assert len(tokens) > 0
+
+
+def test_cached_prompt_reuses_logits_until_a_restore():
+    from app.loadtest import StubModel
+
+    engine = object.__new__(LLMEngine)
+    engine.model = StubModel(decode_ms=0.0, prefill_ms=0.0)
+    evaluated = []
+    eval_tokens = engine.model.eval
+    engine.model.eval = lambda tokens: evaluated.append(list(tokens)) or eval_tokens(tokens)
+    prompt = [256, 72, 105]
+
+    first = engine._eval_logits(prompt)
+    engine._eval_logits(prompt)
+    assert evaluated == [prompt]
+
+    # A KV cache restore brings back the tokens but not their logits
+    engine.logits_valid = False
+    again = engine._eval_logits(prompt)
+    assert evaluated[-1] == [105]
+    assert (again == first).all()
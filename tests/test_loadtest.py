@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.llm import LLMEngine
+from app.loadtest import Recorder, SimulatedUser, StubEngine, assign_users, find_saturation, run_load
+from app.sessions import SessionManager
+
+
+def test_assign_users_follows_the_mix():
+    kinds = assign_users(7, {"auto": 2, "typing": 2, "beam": 1, "chat": 1, "models": 1})
+    assert sorted(kinds) == sorted(["auto", "auto", "typing", "typing", "beam", "chat", "models"])
+    assert assign_users(3, {"auto": 1, "beam": 0}) == ["auto"] * 3
+
+
+def test_recorder_summary_percentiles():
+    recorder = Recorder()
+    for ms in range(1, 101):
+        recorder.record("POST /chat", ms / 1000, ok=ms != 100)
+    recorder.aborted["POST /chat"] += 2
+
+    endpoint = recorder.summary(duration=10.0)["endpoints"]["POST /chat"]
+    assert endpoint["requests"] == 100 and endpoint["throughput"] == 10.0
+    assert endpoint["p50_ms"] == pytest.approx(50.5) and endpoint["p99_ms"] == pytest.approx(99.0, abs=0.1)
+    assert endpoint["error_rate"] == 0.01 and endpoint["aborted"] == 2
+
+
+def test_saturation_is_where_throughput_stops_scaling():
+    stages = [
+        {"users": 2, "throughput": 10.0, "error_rate": 0.0},
+        {"users": 4, "throughput": 19.0, "error_rate": 0.0},
+        {"users": 8, "throughput": 20.0, "error_rate": 0.0},
+    ]
+    assert find_saturation(stages) == 8
+    assert find_saturation(stages[:2]) is None
+
+
+@pytest.fixture
+def stub_engine():
+    SessionManager._instance = None
+    LLMEngine._instance = StubEngine(decode_ms=1.0, prefill_ms=0.0)
+    yield LLMEngine._instance
+    LLMEngine._instance = None
+    SessionManager._instance = None
+
+
+def test_stub_engine_serves_the_ui_endpoints(stub_engine):
+    assert LLMEngine() is stub_engine
+    mix = {"auto": 1, "typing": 1, "beam": 1, "chat": 1, "models": 1}
+    report = asyncio.run(run_load([5], duration=1.0, mix=mix))
+
+    stage = report["stages"][0]
+    assert stage["users"] == 5 and stage["error_rate"] == 0.0
+    endpoints = stage["endpoints"]
+    assert endpoints["POST /sessions/{id}/next-tokens"]["requests"] > 0
+    assert endpoints["POST /chat"]["requests"] > 0
+    assert endpoints["GET /models"]["requests"] > 0
+    # One event stream per user, held for the whole run
+    assert endpoints["GET /downloads/events"]["requests"] == 5
+    # Auto-infer takes planned tokens without fetching their distributions
+    assert endpoints["POST /sessions/{id}/generate"]["requests"] > 0
+
+
+def test_context_ops_report_cached_distributions():
+    user = SimulatedUser(None, Recorder(), 0, 0)
+    user.version, user.server_text = 3, "The"
+    candidates = [{"token_id": 7, "logprob": -0.5}]
+    user.observations = [("The cat", candidates), ("Other", candidates), ("The", candidates)]
+
+    assert user.context_ops("The cat sat") == [
+        {"op": "observe", "token_ids": [7], "logprobs": [-0.5]},
+        {"op": "append_text", "text": " cat"},
+        {"op": "observe", "token_ids": [7], "logprobs": [-0.5]},
+        {"op": "append_text", "text": " sat"},
+    ]
+    assert [o[0] for o in user.observations] == ["The", "The cat"]
@@ -0,0 +1,129 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+
+from app.llm import LLMEngine, close_llama
+from app.main import app
+from app.memory_watchdog import MEMORY_LEAK_TOLERANCE, MemoryWatchdog, process_memory
+
+client = TestClient(app)
+
+has_proc = pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc")
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    MemoryWatchdog._instance = None
+    yield
+    MemoryWatchdog._instance = None
+
+
+def memory(rss, *gguf):
+    return {"pid": 1, "rss_bytes": rss, "mapped_files": 10, "gguf_mappings": list(gguf)}
+
+
+@has_proc
+def test_process_memory_reads_rss_and_mappings(tmp_path):
+    import mmap
+
+    path = tmp_path / "m.gguf"
+    path.write_bytes(b"\0" * 4096)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ):
+        info = process_memory()
+
+    assert info["rss_bytes"] > 0 and info["mapped_files"] > 0
+    assert str(path) in info["gguf_mappings"]
+
+
+def test_switch_records_flag_unreleased_models_and_growth():
+    watchdog = MemoryWatchdog()
+    watchdog.record_switch(None, "/a.gguf", [], [memory(100, "/a.gguf")], 0.1)
+    watchdog.record_switch("/a.gguf", "/b.gguf", [], [memory(200, "/b.gguf")], 0.1)
+    clean = watchdog.record_switch("/b.gguf", "/a.gguf", [], [memory(150, "/a.gguf")], 0.1)
+    assert clean.released and not clean.suspected_leak and clean.rss_growth_bytes == 50
+    assert not watchdog.report()["suspected_leak"]
+
+    # The old model is still mapped, and RSS grew past the first load of b
+    stuck = watchdog.record_switch(
+        "/a.gguf", "/b.gguf", [], [memory(200 + MEMORY_LEAK_TOLERANCE + 1, "/a.gguf", "/b.gguf")], 0.1
+    )
+    assert not stuck.released and stuck.suspected_leak
+    assert watchdog.report()["suspected_leak"]
+
+    unfreed = watchdog.record_switch(
+        "/b.gguf", "/a.gguf", [], [memory(100, "/a.gguf")], 0.1, teardown={"verified": False, "leaked_handles": ["context"]}
+    )
+    assert not unfreed.released
+
+
+def test_close_llama_frees_sampler_and_reports_leftover_handles():
+    sampler = MagicMock()
+    llama = SimpleNamespace(
+        _sampler=sampler,
+        _model=SimpleNamespace(model=None),
+        _ctx=SimpleNamespace(ctx="still-set"),
+        _batch=SimpleNamespace(batch=None),
+        close=MagicMock(),
+    )
+
+    assert close_llama(llama) == ["context"]
+    sampler.close.assert_called_once()
+    llama.close.assert_called_once()
+    assert llama._sampler is None
+
+
+def test_unload_closes_model_and_drafts():
+    engine = object.__new__(LLMEngine)
+    closed = []
+    engine.model = "main"
+    engine.draft_models = {"/draft.gguf": "draft"}
+    with patch("app.llm.close_llama", side_effect=lambda llama: closed.append(llama) or []):
+        engine._unload()
+
+    assert closed == ["main", "draft"]
+    assert engine.model is None and not engine.draft_models
+    assert engine.teardown == {"verified": True, "leaked_handles": []}
+
+
+def test_switch_endpoint_records_memory():
+    mock_engine = MagicMock()
+    mock_engine.get_current_model.return_value = "/models/a.gguf"
+    mock_engine.teardown = {"verified": True, "leaked_handles": []}
+    with patch("app.main.LLMEngine", return_value=mock_engine), patch("app.main.os.path.exists", return_value=True):
+        client.post("/models/switch", json={"filename": "b.gguf"})
+        response = client.get("/models/memory")
+
+    assert response.status_code == 200
+    switch = response.json()["switches"][0]
+    assert switch["from_model"] == "/models/a.gguf" and switch["to_model"].endswith("b.gguf")
+    assert switch["teardown"]["verified"]
+
+
+# Two small GGUFs to switch between, e.g. LLM_TEST_MODELS=a.gguf,b.gguf
+TEST_MODELS = [path for path in os.environ.get("LLM_TEST_MODELS", "").split(",") if path]
+SWITCHES = 40
+
+
+@has_proc
+@pytest.mark.skipif(len(TEST_MODELS) != 2, reason="set LLM_TEST_MODELS to two GGUF paths")
+def test_repeated_switches_keep_memory_bounded():
+    LLMEngine._instance = None
+    LLMEngine.model_path_override = TEST_MODELS[0]
+    try:
+        engine = LLMEngine()
+        watchdog = MemoryWatchdog()
+        for i in range(SWITCHES):
+            target = TEST_MODELS[(i + 1) % 2]
+            previous, before = engine.get_current_model(), watchdog.snapshot()
+            engine.load_model(target)
+            engine.get_top_logprobs(engine.prefix_tokens() + engine.tokenize(b"hello"), 5)
+            record = watchdog.record_switch(previous, target, before, watchdog.snapshot(), 0.0, engine.teardown)
+
+            assert record.released, f"switch {i} left {previous} loaded"
+            assert not record.suspected_leak, f"RSS grew {record.rss_growth_bytes} bytes by switch {i}"
+    finally:
+        LLMEngine._instance = None
+        LLMEngine.model_path_override = None
@@ -0,0 +1,87 @@
+from unittest.mock import patch
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.model_memory import (
+    InsufficientMemoryError,
+    MEMORY_RESERVE_BYTES,
+    available_memory,
+    estimate_footprint,
+    plan_context,
+)
+
+client = TestClient(app)
+
+MB = 1024 * 1024
+# Roughly Llama 3.1 8B
+LLAMA_8B = {
+    "block_count": 32,
+    "embedding_length": 4096,
+    "head_count": 32,
+    "head_count_kv": 8,
+    "vocab_size": 128256,
+    "context_length": 131072,
+}
+
+
+def test_estimate_counts_kv_cache_and_logits():
+    estimate = estimate_footprint(8000 * MB, LLAMA_8B, n_ctx=2048)
+
+    # 2 (K and V) x 32 layers x 2048 positions x 8 KV heads x 128 dims x 2 bytes
+    assert estimate["kv_cache_bytes"] == 2 * 32 * 2048 * 8 * 128 * 2
+    assert estimate["logits_bytes"] == (512 + 2048) * 128256 * 4
+    assert estimate["total_bytes"] == sum(
+        estimate[k] for k in ("weights_bytes", "kv_cache_bytes", "logits_bytes", "scratch_bytes")
+    )
+
+
+def test_plan_shrinks_context_to_fit():
+    full = estimate_footprint(8000 * MB, LLAMA_8B, n_ctx=2048)["total_bytes"]
+    available = full + MEMORY_RESERVE_BYTES - 1
+
+    n_ctx, estimate = plan_context(8000 * MB, LLAMA_8B, 2048, available=available)
+
+    assert n_ctx == 1024
+    assert estimate["total_bytes"] < full
+
+
+def test_plan_counts_memory_freed_by_unloading():
+    needed = estimate_footprint(8000 * MB, LLAMA_8B, n_ctx=2048)["total_bytes"]
+
+    with pytest.raises(InsufficientMemoryError):
+        plan_context(8000 * MB, LLAMA_8B, 2048, available=1000 * MB)
+    n_ctx, _ = plan_context(8000 * MB, LLAMA_8B, 2048, available=1000 * MB, freed_bytes=needed)
+    assert n_ctx == 2048
+
+
+@patch("app.main.LLMEngine")
+@patch("app.main.os.path.exists", return_value=True)
+def test_switch_rejects_model_that_does_not_fit(_exists, mock_engine_cls):
+    mock_engine_cls.return_value.load_model.side_effect = InsufficientMemoryError(
+        "Model needs about 9000 MB", {}, 0
+    )
+
+    response = client.post("/models/switch", json={"filename": "big.gguf"})
+
+    assert response.status_code == 507
+    assert "9000 MB" in response.json()["detail"]
+
+
+VM_STAT = """Mach Virtual Memory Statistics: (page size of 16384 bytes)
+Pages free:                                5000.
+Pages active:                            200000.
+Pages inactive:                           90000.
+Pages speculative:                         1000.
+Pages wired down:                         80000.
+"""
+
+
+def test_available_memory_without_proc_uses_vm_stat_on_macos():
+    with patch("app.model_memory.open", side_effect=OSError, create=True), \
+            patch("app.model_memory.sys.platform", "darwin"), \
+            patch("app.model_memory.subprocess.run") as run:
+        run.return_value.stdout = VM_STAT
+        available = available_memory()
+
+    assert available == (5000 + 90000 + 1000) * 16384
+    assert run.call_args[0][0] == ["vm_stat"]
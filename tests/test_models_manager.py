@@ -1,6 +1,6 @@
+import asyncio
 from app.models_manager import ModelManager, MODEL_DIR
-import os
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, patch
 
 
 def test_list_local_models(tmp_path):
@@ -15,18 +15,15 @@ def test_list_local_models(tmp_path):
         assert models[0]["filename"] == "model1.gguf"
 
 
-@patch("app.models_manager.HfApi")
-def test_list_remote_models(mock_api_cls):
-    mock_api = mock_api_cls.return_value
-    mock_file = MagicMock()
-    mock_file.rfilename = "model.gguf"
-    mock_file.size = 1024 * 1024 * 5
-    # Mocking as if it has rfilename and size (duck typing)
-
-    mock_api.list_repo_tree.return_value = [mock_file]
+@patch("app.models_manager.get_hub_lookup")
+def test_list_remote_models(mock_get_lookup):
+    mock_get_lookup.return_value.list_gguf_files = AsyncMock(
+        return_value=[{"filename": "model.gguf", "size_mb": 5.0}]
+    )
 
     manager = ModelManager()
-    files = manager.list_remote_files("test/repo")
+    files = asyncio.run(manager.list_remote_files("https://huggingface.co/test/repo"))
 
     assert len(files) == 1
     assert files[0]["filename"] == "model.gguf"
+    mock_get_lookup.return_value.list_gguf_files.assert_called_with("test/repo")
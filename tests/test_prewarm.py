@@ -0,0 +1,122 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app import prewarm
+from app.download_manager import DownloadState
+from app.main import app
+from app.prewarm import PrewarmManager, page_cache_percent
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    PrewarmManager._instance = None
+    yield
+    PrewarmManager._instance = None
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    path = tmp_path / "a.gguf"
+    path.write_bytes(b"\x01" * (3 * 1024 * 1024 + 100))
+    return path
+
+
+def wait_until_done(info):
+    for _ in range(400):
+        if info.state not in (DownloadState.PENDING, DownloadState.IN_PROGRESS):
+            return
+        time.sleep(0.005)
+    raise AssertionError("timed out")
+
+
+def test_prewarm_reads_whole_file(model_file, monkeypatch):
+    monkeypatch.setattr(prewarm, "PREWARM_CHUNK_BYTES", 1024 * 1024)
+    info = PrewarmManager().start(str(model_file))
+    wait_until_done(info)
+
+    assert info.state == DownloadState.COMPLETED
+    assert PrewarmManager().to_dict(info)["progress"] == 100.0
+    # Just read, so resident (where mincore is available)
+    warm = page_cache_percent(str(model_file))
+    assert warm is None or warm == 100.0
+
+
+def test_starting_another_file_cancels_the_running_one(model_file, tmp_path, monkeypatch):
+    other = tmp_path / "b.gguf"
+    other.write_bytes(b"\x02" * 1024)
+    manager = PrewarmManager()
+    monkeypatch.setattr(manager.limiter, "consume", lambda n: time.sleep(0.05))
+    monkeypatch.setattr(prewarm, "PREWARM_CHUNK_BYTES", 4096)
+    first = manager.start(str(model_file))
+    # Same file again is the same job
+    assert manager.start(str(model_file)) is first
+    second = manager.start(str(other))
+    wait_until_done(first)
+    wait_until_done(second)
+
+    assert first.state == DownloadState.CANCELLED
+    assert second.state == DownloadState.COMPLETED
+
+
+def test_prewarm_endpoints(model_file):
+    with patch("app.main.MODEL_DIR", str(model_file.parent)):
+        started = client.post("/models/prewarm", json={"filename": "a.gguf"})
+        wait_until_done(PrewarmManager().get(str(model_file)))
+        status = client.get("/models/prewarm/a.gguf")
+        missing = client.post("/models/prewarm", json={"filename": "missing.gguf"})
+        cancel = client.delete("/models/prewarm/a.gguf")
+
+    assert started.status_code == 200
+    assert started.json()["filename"] == "a.gguf"
+    assert status.json()["state"] == "completed" and status.json()["progress"] == 100.0
+    assert missing.status_code == 404
+    # Already finished, nothing to cancel
+    assert cancel.status_code == 404
+
+
+def test_prewarm_refuses_models_larger_than_memory(model_file):
+    with patch("app.main.MODEL_DIR", str(model_file.parent)), patch("app.main.available_memory", return_value=1024):
+        response = client.post("/models/prewarm", json={"filename": "a.gguf"})
+
+    assert response.status_code == 507
+    assert PrewarmManager().get(str(model_file)) is None
+
+
+def test_warm_percent_is_reused_until_it_expires(model_file, monkeypatch):
+    calls = []
+    monkeypatch.setattr(prewarm, "page_cache_percent", lambda path: calls.append(path) or 50.0)
+    manager = PrewarmManager()
+
+    assert manager.warm_percent(str(model_file)) == 50.0
+    assert manager.warm_percent(str(model_file)) == 50.0
+    assert len(calls) == 1
+
+    monkeypatch.setattr(prewarm, "WARM_PERCENT_TTL", 0.0)
+    manager.warm_percent(str(model_file))
+    assert len(calls) == 2
+    assert manager.warm_percent(str(model_file.parent / "missing.gguf")) is None
+
+
+def test_cancel_before_the_thread_starts_sticks(model_file, monkeypatch):
+    started = []
+
+    class DeferredThread:
+        def __init__(self, target, args, daemon):
+            self.run = lambda: target(*args)
+
+        def start(self):
+            started.append(self)
+
+    monkeypatch.setattr(prewarm.threading, "Thread", DeferredThread)
+    manager = PrewarmManager()
+    info = manager.start(str(model_file))
+    manager.cancel(str(model_file))
+    started[0].run()
+
+    assert info.state == DownloadState.CANCELLED
+    assert info.bytes_done == 0
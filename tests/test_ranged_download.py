@@ -0,0 +1,98 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.ranged_download import RangedDownload
+
+DATA = os.urandom(100_000)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves DATA with single-range support and records the ranges requested."""
+
+    ranges = []
+
+    def do_GET(self):
+        header = self.headers.get("Range")
+        start, end = 0, len(DATA) - 1
+        if header:
+            first, last = header.removeprefix("bytes=").split("-")
+            start, end = int(first), int(last)
+            self.ranges.append((start, end))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(DATA[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    RangeHandler.ranges = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/model.gguf"
+    server.shutdown()
+    server.server_close()
+
+
+def test_parallel_download_verifies_and_renames(server_url, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    progress = []
+
+    path = RangedDownload(
+        server_url, dest, len(DATA), sha256=SHA256, connections=3, chunk_size=16_384,
+        on_progress=lambda done, total: progress.append(done),
+    ).run()
+
+    assert path == dest
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+    assert len(RangeHandler.ranges) == 7
+    assert progress[-1] == len(DATA)
+    assert not os.path.exists(dest + ".part")
+    assert not os.path.exists(dest + ".part.json")
+
+
+def test_cancelled_download_resumes_from_manifest(server_url, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    reads = []
+
+    def cancel_after_two_chunks():
+        reads.append(1)
+        return len(reads) > 2
+
+    with pytest.raises(InterruptedError):
+        RangedDownload(
+            server_url, dest, len(DATA), sha256=SHA256, connections=1, chunk_size=16_384,
+            is_cancelled=cancel_after_two_chunks,
+        ).run()
+    assert os.path.exists(dest + ".part.json")
+
+    RangeHandler.ranges = []
+    RangedDownload(server_url, dest, len(DATA), sha256=SHA256, connections=2, chunk_size=16_384).run()
+
+    # The two finished chunks were not fetched again
+    assert sorted(RangeHandler.ranges)[0][0] == 2 * 16_384
+    assert len(RangeHandler.ranges) == 5
+    with open(dest, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_checksum_mismatch_discards_partial_file(server_url, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+
+    with pytest.raises(ValueError, match="SHA256 mismatch"):
+        RangedDownload(server_url, dest, len(DATA), sha256="0" * 64, chunk_size=32_768).run()
+
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + ".part")
+    assert not os.path.exists(dest + ".part.json")
@@ -0,0 +1,162 @@
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+import re
+import pytest
+from app.main import app
+from app.schemas import ContextOp
+from app.sessions import SessionManager, SessionVersionError
+
+client = TestClient(app)
+
+
+class WordEngine:
+    """Minimal stand-in for LLMEngine's tokenizer: one token per space-prefixed word."""
+
+    def __init__(self):
+        self.vocab = {}
+        self.pieces = {}
+        self.tokenized = []
+        self.model_path = "/models/a.gguf"
+
+    def get_current_model(self):
+        return self.model_path
+
+    def prefix_tokens(self):
+        return [1]
+
+    def tokenize(self, data):
+        self.tokenized.append(data)
+        ids = []
+        for word in re.findall(rb" ?[^ ]+| +", data):
+            if word not in self.vocab:
+                self.vocab[word] = len(self.vocab) + 10
+                self.pieces[self.vocab[word]] = word
+            ids.append(self.vocab[word])
+        return ids
+
+    def token_pieces(self, token_ids):
+        return [self.pieces[t] for t in token_ids]
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    SessionManager._instance = None
+    yield
+    SessionManager._instance = None
+
+
+def test_append_only_tokenizes_tail():
+    engine = WordEngine()
+    manager = SessionManager()
+    text = "The quick brown fox jumps over the lazy"
+    manager.sync_text("s1", text, engine)
+
+    session = manager.sync_text("s1", text + " dog", engine)
+
+    assert len(engine.tokenized[-1]) < len(text)
+    assert session.token_ids == [1] + engine.tokenize((text + " dog").encode())
+    assert session.version == 2
+
+
+def test_edit_in_middle_matches_full_tokenization():
+    engine = WordEngine()
+    manager = SessionManager()
+    manager.sync_text("s1", "one two three four five six seven", engine)
+
+    session = manager.sync_text("s1", "one two three FOUR five six seven", engine)
+
+    expected = [1] + engine.tokenize(b"one two three FOUR five six seven")
+    assert session.token_ids == expected
+    data = session.data
+    assert [data[o:o + 1] for o in session.offsets[1:3]] == [b"o", b" "]
+
+
+def test_model_switch_invalidates_cache():
+    engine = WordEngine()
+    manager = SessionManager()
+    manager.sync_text("s1", "hello world", engine)
+    engine.model_path = "/models/b.gguf"
+
+    manager.sync_text("s1", "hello world again", engine)
+
+    assert engine.tokenized[-1] == b"hello world again"
+
+
+def test_tokenize_endpoint_with_session():
+    engine = WordEngine()
+    with patch("app.main.LLMEngine", return_value=engine):
+        response = client.post("/tokenize", json={"text": "hi there", "session_id": "abc"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["token_ids"][0] == 1
+    assert data["offsets"] == [0, 0, 2]
+    assert data["version"] == 1
+
+
+@patch("app.main.LLMEngine")
+def test_next_tokens_uses_session_tokens(mock_engine_cls):
+    engine = WordEngine()
+    mock_engine = mock_engine_cls.return_value
+    for name in ("get_current_model", "prefix_tokens", "tokenize", "token_pieces"):
+        setattr(mock_engine, name, getattr(engine, name))
+    mock_engine.get_next_tokens.return_value = []
+
+    client.post("/next-tokens", json={"text": "hi there", "session_id": "abc"})
+
+    kwargs = mock_engine.get_next_tokens.call_args.kwargs
+    assert kwargs["prompt_tokens"] == [1] + engine.tokenize(b"hi there")
+
+
+def test_apply_ops_append_and_truncate():
+    engine = WordEngine()
+    manager = SessionManager()
+    session = manager.apply_ops("s1", None, [ContextOp(op="set_text", text="hello")], engine)
+    version = session.version
+    world = engine.tokenize(b" world")
+
+    manager.apply_ops("s1", version, [ContextOp(op="append_tokens", token_ids=world)], engine)
+    assert session.text == "hello world"
+    assert session.token_ids[-1] == world[0]
+
+    manager.apply_ops("s1", session.version, [ContextOp(op="truncate", n_tokens=2)], engine)
+    assert session.text == "hello"
+    assert len(session.token_ids) == 2
+
+
+def test_apply_ops_rejects_stale_version():
+    engine = WordEngine()
+    manager = SessionManager()
+    manager.apply_ops("s1", None, [ContextOp(op="set_text", text="hello")], engine)
+
+    with pytest.raises(SessionVersionError) as exc:
+        manager.apply_ops("s1", 0, [ContextOp(op="append_text", text=" there")], engine)
+    assert exc.value.version == 1
+
+
+def test_session_next_tokens_delta_protocol():
+    engine = WordEngine()
+    with patch("app.main.LLMEngine") as mock_engine_cls:
+        mock_engine = mock_engine_cls.return_value
+        for name in ("get_current_model", "prefix_tokens", "tokenize", "token_pieces"):
+            setattr(mock_engine, name, getattr(engine, name))
+        mock_engine.get_next_tokens.return_value = []
+
+        first = client.post("/sessions/abc/next-tokens", json={
+            "ops": [{"op": "set_text", "text": "Once upon"}],
+        })
+        version = first.json()["session_version"]
+        second = client.post("/sessions/abc/next-tokens", json={
+            "base_version": version,
+            "ops": [{"op": "append_text", "text": " a time"}],
+        })
+        stale = client.post("/sessions/abc/next-tokens", json={
+            "base_version": version,
+            "ops": [{"op": "append_text", "text": " there"}],
+        })
+
+    assert second.status_code == 200
+    assert second.json()["n_tokens"] == 5
+    assert mock_engine.get_next_tokens.call_args.args[0] == "Once upon a time"
+    assert stale.status_code == 409
+    assert stale.json()["detail"]["version"] == second.json()["session_version"]
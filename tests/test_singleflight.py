@@ -0,0 +1,127 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+
+from app.llm import LLMEngine
+from app.main import app
+from app.singleflight import SingleFlight, call_key
+
+client = TestClient(app)
+
+
+def run_concurrently(fn, n):
+    results = [None] * n
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, fn())) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        time.sleep(0.005)
+    raise AssertionError("timed out")
+
+
+def test_duplicates_share_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait()
+        return ["result"]
+
+    threads, results = run_concurrently(lambda: flights.do(("k",), work), 4)
+    wait_for(lambda: flights.coalesced == 3)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [["result"]] * 4
+    assert flights.stats() == {"executed": 1, "coalesced": 3, "in_flight": 0}
+    # Once finished, the same key runs again
+    assert flights.do(("k",), lambda: "again") == "again"
+
+
+def test_followers_get_the_leaders_exception():
+    flights = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        release.wait()
+        raise ValueError("context too long")
+
+    def call():
+        try:
+            flights.do(("k",), failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads, _ = run_concurrently(call, 3)
+    wait_for(lambda: flights.coalesced == 2)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert errors == ["context too long"] * 3
+
+
+def test_call_key_is_hashable():
+    assert call_key("f", [1, 2], {"b": 1, "a": 2}) == call_key("f", [1, 2], {"a": 2, "b": 1})
+    assert call_key("f", [1, 2]) != call_key("f", [1, 3])
+
+
+@pytest.fixture
+def engine():
+    """An LLMEngine with the model replaced by a slow fake forward pass."""
+    engine = object.__new__(LLMEngine)
+    engine.lock = threading.Lock()
+    engine.flights = SingleFlight()
+    engine.current_model_path = "/models/a.gguf"
+    engine.model = MagicMock()
+    engine.model.detokenize = lambda tokens, special=True: bytes([65 + tokens[0]])
+    engine.release = threading.Event()
+    engine.passes = []
+
+    def eval_logits(prompt_tokens, timings=None):
+        engine.passes.append(list(prompt_tokens))
+        engine.release.wait()
+        return np.array([0.0, 2.0, 1.0])
+
+    engine._eval_logits = eval_logits
+    return engine
+
+
+def test_engine_coalesces_identical_contexts(engine):
+    threads, results = run_concurrently(lambda: engine.get_top_logprobs([1, 2, 3], 2), 3)
+    other, other_results = run_concurrently(lambda: engine.get_top_logprobs([1, 2], 2), 1)
+    wait_for(lambda: engine.flights.coalesced == 2)
+    engine.release.set()
+    for t in threads + other:
+        t.join()
+
+    assert sorted(engine.passes) == [[1, 2], [1, 2, 3]]
+    assert [r[0][2] for r in results] == [1, 1, 1]
+    # Each caller owns its list
+    assert results[0] is not results[1]
+    assert engine.coalesce_stats()["executed"] == 2
+
+
+def test_inference_stats_endpoint():
+    mock_engine = MagicMock()
+    mock_engine.coalesce_stats.return_value = {"executed": 5, "coalesced": 2, "in_flight": 1}
+    with patch("app.main.LLMEngine", return_value=mock_engine):
+        response = client.get("/inference/stats")
+
+    assert response.status_code == 200
+    assert response.json() == {"coalescing": {"executed": 5, "coalesced": 2, "in_flight": 1}}
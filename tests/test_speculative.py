@@ -0,0 +1,159 @@
+import random
+from collections import Counter
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.beam_tree import BeamTree, expand_node
+from app.llm import LLMEngine
+from app.main import app
+from app.sessions import SessionManager
+from app.speculative import SpeculativeConfig, SpeculativeStats, _choose, generate, ngram_draft
+
+client = TestClient(app)
+
+
+class CycleEngine:
+    """Stand-in engine whose most likely next token cycles 10, 11, 12, 10, ..."""
+
+    postprocess_candidates = LLMEngine.postprocess_candidates
+
+    def __init__(self, draft=None):
+        self.passes = []
+        self.draft = draft  # Tokens the "draft model" proposes, or None to follow the cycle
+
+    def get_current_model(self):
+        return "/models/a.gguf"
+
+    def prefix_tokens(self):
+        return [1]
+
+    def tokenize(self, data):
+        return list(data)
+
+    def token_pieces(self, token_ids):
+        return [f"<{t}>".encode() for t in token_ids]
+
+    def stop_tokens(self):
+        return [2]
+
+    def _top(self, tokens, top_k):
+        best = 10 + (tokens[-1] - 9) % 3 if tokens[-1] >= 10 else 10
+        other = 20 + tokens[-1] % 5
+        return [(f"<{best}>", -0.1, best), (f"<{other}>", -2.5, other)][:top_k]
+
+    def get_top_logprobs(self, prompt_tokens, top_k=40, timings=None):
+        return self._top(list(prompt_tokens), top_k)
+
+    def verify_top_logprobs(self, prompt_tokens, draft, top_k=40, timings=None):
+        self.passes.append(list(draft))
+        tokens = list(prompt_tokens)
+        rows = []
+        for t in [None] + list(draft):
+            if t is not None:
+                tokens.append(t)
+            rows.append(self._top(tokens, top_k))
+        return rows
+
+    def draft_tokens(self, draft_path, prompt_tokens, n_draft):
+        if self.draft is not None:
+            return self.draft[:n_draft]
+        tokens = list(prompt_tokens)
+        for _ in range(n_draft):
+            tokens.append(self._top(tokens, 1)[0][2])
+        return tokens[len(prompt_tokens):]
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    SessionManager._instance = None
+    yield
+    SessionManager._instance = None
+
+
+def test_ngram_draft_proposes_what_followed_last_occurrence():
+    assert ngram_draft([5, 6, 7, 8, 5, 6], 2) == [7, 8]
+    # The longest matching suffix wins over a more recent shorter one
+    assert ngram_draft([1, 2, 3, 9, 2, 4, 1, 2], 3) == [3, 9, 2]
+    assert ngram_draft([1, 2, 3], 4) == []
+
+
+@pytest.mark.parametrize("config", [
+    SpeculativeConfig("ngram"),
+    SpeculativeConfig("draft", "/models/draft.gguf"),
+    SpeculativeConfig("draft", "/models/draft.gguf", num_draft=2),
+])
+def test_greedy_output_matches_plain_decoding(config):
+    plain = generate(CycleEngine(), [1, 10, 11, 12, 10], "", 9, greedy=True)
+
+    engine = CycleEngine()
+    stats = SpeculativeStats()
+    spec = generate(engine, [1, 10, 11, 12, 10], "", 9, config, greedy=True, stats=stats)
+
+    assert [s["token_id"] for s in spec] == [s["token_id"] for s in plain] == [11, 12, 10] * 3
+    assert stats.generated == 9
+    assert stats.accepted == stats.drafted
+    assert stats.passes == len(engine.passes) < 9
+
+
+def test_rejected_draft_is_discarded_after_first_mismatch():
+    engine = CycleEngine(draft=[11, 30, 31])
+    stats = SpeculativeStats()
+    steps = generate(engine, [1, 10], "", 3, SpeculativeConfig("draft", "/models/d.gguf"), greedy=True, stats=stats)
+
+    assert [s["token_id"] for s in steps] == [11, 12, 10]
+    # First pass: 11 accepted, 30 rejected (12 taken instead); second pass verifies the rest
+    assert engine.passes[0] == [11, 30]
+    assert stats.accepted == 1
+    assert steps[0]["candidates"][0]["token_id"] == 11
+
+
+def test_choose_keeps_main_model_distribution():
+    valid = [
+        {"token_id": 1, "prob": 60.0},
+        {"token_id": 2, "prob": 30.0},
+        {"token_id": 3, "prob": 10.0},
+    ]
+    rng = random.Random(0)
+    n = 20000
+    # Always drafting the second most likely token must not skew the result
+    counts = Counter(_choose(valid, 2, False, rng)["token_id"] for _ in range(n))
+    for c in valid:
+        assert counts[c["token_id"]] / n == pytest.approx(c["prob"] / 100, abs=0.015)
+
+
+def test_beam_depth_uses_session_speculative_config():
+    engine = CycleEngine()
+    tree = BeamTree([1, 10], "")
+    stats = SpeculativeStats()
+    leaves = expand_node(tree, tree.root, engine, num_paths=1, depth=5, top_p=1.0,
+                         speculative=SpeculativeConfig("draft", "/models/d.gguf"), stats=stats)
+
+    assert [t["token"] for t in leaves[0].tokens] == ["<11>", "<12>", "<10>", "<11>", "<12>"]
+    assert stats.passes == 1 and stats.accepted == 3
+
+
+def test_session_generate_endpoint(tmp_path, monkeypatch):
+    engine = CycleEngine()
+    engine.load_draft_model = lambda path: None
+    (tmp_path / "draft.gguf").write_bytes(b"GGUF")
+    monkeypatch.setattr("app.main.MODEL_DIR", str(tmp_path))
+
+    with patch("app.main.LLMEngine", return_value=engine):
+        missing = client.put("/sessions/abc/speculative", json={"mode": "draft", "draft_model": "nope.gguf"})
+        config = client.put("/sessions/abc/speculative", json={"mode": "draft", "draft_model": "draft.gguf"})
+        generated = client.post("/sessions/abc/generate", json={
+            "ops": [{"op": "set_text", "text": "hi"}],
+            "max_tokens": 4,
+            "greedy": True,
+        })
+        status = client.get("/sessions/abc/speculative")
+
+    assert missing.status_code == 404
+    assert config.json()["draft_model"] == "draft.gguf"
+    data = generated.json()
+    assert data["text"] == "<10><11><12><10>"
+    assert data["speculative"]["accepted"] == 3
+    assert len(data["tokens"][0]["candidates"]) == 2
+    assert status.json()["stats"]["generated"] == 4
@@ -0,0 +1,74 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.main import app
+from app.sessions import SessionManager
+from app.sweep import MAX_SWEEP_CONFIGS, sweep_candidates
+
+client = TestClient(app)
+
+TOP_LOGPROBS = [("a", -0.4, 10), ("b", -1.3, 11), ("c", -2.0, 12), (" b", -2.2, 13)]
+
+
+def fixed_distribution(prompt_tokens):
+    return TOP_LOGPROBS
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    SessionManager._instance = None
+    yield
+    SessionManager._instance = None
+
+
+def test_sweep_matches_postprocess_candidates(byte_engine):
+    engine = byte_engine(fixed_distribution)
+    result = sweep_candidates(engine, TOP_LOGPROBS, "a b", [0.5, 1.5], [2, 4], [0.9], [1.0, 1.3])
+
+    assert [t["token"] for t in result["tokens"]] == ["a", "b", "c", " b"]
+    assert len(result["configs"]) == 8
+    for config in result["configs"]:
+        expected = engine.postprocess_candidates(
+            TOP_LOGPROBS[:config["top_k"]], "a b", config["temp"], config["top_p"], config["repeat_penalty"]
+        )
+        tokens = [result["tokens"][i]["token"] for i in config["index"]]
+        assert tokens == [c["token"] for c in expected]
+        assert config["prob"] == [c["prob"] for c in expected]
+        assert config["excluded"] == [c["excluded"] for c in expected]
+
+
+def test_sweep_endpoint_evaluates_context_once(byte_engine):
+    engine = byte_engine(fixed_distribution)
+    with patch("app.main.LLMEngine", return_value=engine):
+        first = client.post("/sessions/abc/sweep", json={
+            "ops": [{"op": "set_text", "text": "hi"}],
+            "temps": [0.2, 0.8, 1.4],
+            "top_ks": [2, 4],
+        })
+        version = first.json()["session_version"]
+        # Same context, other settings: served from the session's cached distribution
+        second = client.post("/sessions/abc/sweep", json={"base_version": version, "top_ks": [3], "top_ps": [0.5, 1.0]})
+        # A wider top_k than cached needs a new evaluation
+        third = client.post("/sessions/abc/sweep", json={"base_version": version, "top_ks": [10]})
+
+    assert first.status_code == second.status_code == third.status_code == 200
+    assert len(first.json()["configs"]) == 6
+    assert [c["top_p"] for c in second.json()["configs"]] == [0.5, 1.0]
+    assert engine.evaluated == [([1, ord("h"), ord("i")], 4), ([1, ord("h"), ord("i")], 10)]
+
+
+def test_sweep_endpoint_limits_grid_size(byte_engine):
+    engine = byte_engine(fixed_distribution)
+    with patch("app.main.LLMEngine", return_value=engine):
+        empty = client.post("/sessions/abc/sweep", json={"temps": []})
+        too_big = client.post("/sessions/abc/sweep", json={
+            "temps": [0.1] * 10,
+            "top_ks": [1] * 10,
+            "top_ps": [0.5] * (MAX_SWEEP_CONFIGS // 100 + 1),
+        })
+        stale = client.post("/sessions/abc/sweep", json={"base_version": 99})
+
+    assert empty.status_code == too_big.status_code == 422
+    assert stale.status_code == 409
+    assert engine.evaluated == []
@@ -0,0 +1,87 @@
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+import os
+import pytest
+from app.main import app
+from app.llm import LLMEngine
+from app.timing import RequestTimings
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def reset_singleton():
+    LLMEngine._instance = None
+    yield
+    LLMEngine._instance = None
+
+
+def test_phases_accumulate():
+    timings = RequestTimings()
+    with timings.phase("queue_wait"):
+        pass
+    with timings.phase("queue_wait"):
+        pass
+    timings.add_perf({"t_p_eval_ms": 5.0, "t_eval_ms": 1.0, "n_p_eval": 3, "n_eval": 1})
+    timings.add_perf({"t_p_eval_ms": 2.0, "t_eval_ms": 1.0, "n_p_eval": 1, "n_eval": 1})
+
+    data = timings.to_dict()
+    assert data["queue_wait_ms"] >= 0
+    assert data["prefill_ms"] == 7.0
+    assert data["decode_ms"] == 2.0
+    assert data["llama_perf"]["n_p_eval"] == 4
+    assert data["cache_hit"] is False
+
+
+@patch("app.llm.read_llama_perf", return_value=None)
+@patch("app.llm.reset_llama_perf")
+@patch("app.llm.Llama")
+@patch("app.llm.get_model_path")
+def test_engine_records_prefill_and_cache(mock_get_path, mock_llama, _reset, _perf):
+    mock_instance = MagicMock()
+    mock_llama.return_value = mock_instance
+    mock_instance.tokenize.return_value = [1, 2, 3, 4]
+    mock_instance._input_ids.tolist.return_value = [1, 2, 9]
+    mock_instance.create_completion.return_value = {
+        "choices": [{"logprobs": {"top_logprobs": [{"A": -0.1, "B": -2.0}]}}]
+    }
+
+    engine = LLMEngine()
+    timings = RequestTimings()
+    engine.get_next_tokens("Hello", timings=timings)
+
+    data = timings.to_dict()
+    assert data["cache_hit"] is True
+    assert data["cached_tokens"] == 2
+    assert data["prefill_tokens"] == 2
+    assert "sampler" in timings.phases_ms
+
+
+@patch("app.main.LLMEngine")
+def test_next_tokens_debug_timing(mock_engine_cls):
+    mock_engine = mock_engine_cls.return_value
+    mock_engine.get_next_tokens.return_value = [
+        {"token": " world", "prob": 99.0, "logprob": -0.1}
+    ]
+
+    response = client.post("/next-tokens", json={"text": "Hello", "debug_timing": True})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["timings"] is not None
+    assert "queue_wait_ms" in data["timings"]
+    assert isinstance(mock_engine.get_next_tokens.call_args.kwargs["timings"], RequestTimings)
+
+
+@patch("app.main.LLMEngine")
+def test_beam_search_profile(mock_engine_cls, tmp_path):
+    mock_engine = mock_engine_cls.return_value
+    mock_engine.generate_beam_paths.return_value = []
+
+    with patch("app.timing.PROFILE_DIR", str(tmp_path)):
+        response = client.post("/beam/search", json={"context": "Hello", "profile": True})
+
+    assert response.status_code == 200
+    profile_path = response.json()["timings"]["profile_path"]
+    assert os.path.dirname(profile_path) == str(tmp_path)
+    assert os.path.exists(profile_path)
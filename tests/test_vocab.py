@@ -0,0 +1,118 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock, patch
+
+from app.llm import LLMEngine
+from app.main import app
+from app.vocab import VocabIndex
+
+client = TestClient(app)
+
+PIECES = [b"<s>", b" the", b" th", b" t", b"the", b" 42", b"7", b"12", b"!", b"\xe2\x82", b"\xff", b" The", b""]
+
+
+def ids(mask):
+    return [PIECES[i] for i in np.flatnonzero(mask)]
+
+
+def test_prefix_query():
+    index = VocabIndex.build(PIECES)
+    assert sorted(index.prefix_ids(b" th").tolist()) == [1, 2]
+    # Partial: tokens that start spelling " the" as well
+    assert sorted(index.prefix_ids(b" the", partial=True).tolist()) == [1, 2, 3]
+    assert sorted(index.prefix_ids(b"\xff").tolist()) == [10]
+    assert index.prefix_ids(b"zzz").size == 0
+
+
+def test_class_and_regex_masks():
+    index = VocabIndex.build(PIECES)
+    assert ids(index.class_mask(["digit"])) == [b"7", b"12"]
+    assert ids(index.class_mask(["digit", "space"])) == [b" 42", b"7", b"12"]
+    assert ids(index.class_mask(["lower"])) == [b"the"]
+    # Partial UTF-8 sequences and empty tokens match no class
+    assert ids(index.class_mask(["letter", "digit", "space", "punct"])) == [
+        b"<s>", b" the", b" th", b" t", b"the", b" 42", b"7", b"12", b"!", b" The"
+    ]
+    assert ids(index.regex_mask(r" [Tt]he")) == [b" the", b" The"]
+    assert ids(index.mask({"prefix": " t", "regex": r"\s\w\w+"})) == [b" the", b" th"]
+    assert index.mask({}) is None
+
+
+def test_index_is_cached_on_disk(tmp_path):
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"GGUF")
+    get_pieces = MagicMock(return_value=PIECES)
+
+    first = VocabIndex.for_model(str(model_path), get_pieces)
+    second = VocabIndex.for_model(str(model_path), get_pieces)
+
+    assert get_pieces.call_count == 1
+    assert second.pieces == first.pieces == PIECES
+    assert np.array_equal(second.kinds, first.kinds)
+
+
+def test_saving_an_index_prunes_stale_variants(tmp_path):
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"GGUF")
+    VocabIndex.for_model(str(model_path), lambda: PIECES)
+    old = VocabIndex.cache_path(str(model_path))
+    other_model = os.path.join(os.path.dirname(old), "other.gguf.4-1.v1.npz")
+    open(other_model, "wb").close()
+
+    # Replaced with a different file: the old index is dropped, other models' are kept
+    model_path.write_bytes(b"GGUF2")
+    VocabIndex.for_model(str(model_path), lambda: PIECES)
+
+    assert sorted(os.listdir(os.path.dirname(old))) == sorted(
+        [os.path.basename(VocabIndex.cache_path(str(model_path))), "other.gguf.4-1.v1.npz"]
+    )
+
+
+def test_index_is_built_in_background_after_load(tmp_path):
+    model_path = tmp_path / "model.gguf"
+    model_path.write_bytes(b"GGUF")
+    engine = object.__new__(LLMEngine)
+    engine.model = SimpleNamespace(n_vocab=lambda: len(PIECES), detokenize=lambda tokens, special: PIECES[tokens[0]])
+    engine.current_model_path = str(model_path)
+
+    engine._start_vocab_index()
+    engine._vocab_thread.join()
+
+    assert engine.vocab.done()
+    assert ids(engine._token_mask(engine.vocab, {"prefix": " th"})) == [b" the", b" th"]
+    assert engine._token_mask(engine.vocab, None) is None
+
+    with patch("app.llm.close_llama", return_value=[]):
+        engine._unload()
+    with pytest.raises(RuntimeError, match="No model loaded"):
+        engine._token_mask(engine.vocab, {"prefix": " th"})
+
+
+def test_masked_top_logprobs_keep_unconditional_logprobs():
+    engine = MagicMock()
+    engine.model.detokenize = lambda tokens, special=True: PIECES[tokens[0]]
+    logits = np.array([5.0, 1.0, 2.0, 3.0, 4.0, 0.0, 0.5, 0.2, 0.1, 0.0, 0.0, 0.3, 0.0])
+    mask = VocabIndex.build(PIECES).mask({"prefix": " t"})
+
+    top = LLMEngine._top_logprobs(engine, logits, 10, mask)
+
+    assert [t[2] for t in top] == [3, 2, 1]
+    full = {t[2]: t[1] for t in LLMEngine._top_logprobs(engine, logits, 13)}
+    assert all(abs(full[t[2]] - t[1]) < 1e-9 for t in top)
+    assert LLMEngine._top_logprobs(engine, logits, 10, np.zeros(len(PIECES), dtype=bool)) == []
+
+
+def test_next_tokens_passes_token_filter():
+    mock_engine = MagicMock()
+    mock_engine.get_next_tokens.return_value = []
+    with patch("app.main.LLMEngine", return_value=mock_engine):
+        response = client.post("/next-tokens", json={"text": "Hi", "token_filter": {"prefix": " th"}})
+        invalid = client.post("/next-tokens", json={"text": "Hi", "token_filter": {"regex": "("}})
+
+    assert response.status_code == 200
+    assert mock_engine.get_next_tokens.call_args.kwargs["token_filter"] == {"prefix": " th", "partial": False}
+    assert invalid.status_code == 422
@@ -0,0 +1,196 @@
+from multiprocessing import Pipe
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.model_memory import InsufficientMemoryError
+from app.timing import RequestTimings
+from app.worker_pool import WorkerEngine, WorkerPool, partition_cores, serve
+
+client = TestClient(app)
+
+
+class EchoEngine:
+    def __init__(self):
+        self.loaded = None
+        self.footprint = None
+
+    def load_model(self, path):
+        if path == "/models/huge.gguf":
+            raise InsufficientMemoryError("Model needs about 900 MB", {"total_bytes": 900}, 100)
+        self.loaded = path
+        self.footprint = {"total_bytes": 100}
+
+    def get_next_tokens(self, prompt, timings=None, **kwargs):
+        if timings is not None:
+            timings.prefill_tokens = len(prompt)
+        return [{"token": prompt[::-1], "prob": 100.0, "logprob": 0.0}]
+
+
+class FakeWorker:
+    def __init__(self, index):
+        self.index = index
+        self.in_flight = 0
+        self.calls = []
+
+    def call(self, method, *args, **kwargs):
+        self.calls.append((method, args))
+
+
+def test_partition_cores_contiguous_groups():
+    assert partition_cores(3, list(range(8))) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+    assert partition_cores(2, [0]) == [[0], [0]]
+
+
+def test_serve_runs_engine_methods_and_returns_timings():
+    router, worker = Pipe()
+    engine = EchoEngine()
+    thread = threading.Thread(target=serve, args=(worker, engine))
+    thread.start()
+
+    router.send(("get_next_tokens", ("abc",), {"timings": RequestTimings()}))
+    status, result, timings = router.recv()
+    router.send(("create_completion", (), {}))
+    error = router.recv()
+    router.send(("load_model", ("/models/b.gguf",), {}))
+    loaded = router.recv()
+    router.send(("load_model", ("/models/huge.gguf",), {}))
+    too_big = router.recv()
+    router.send(None)
+    thread.join(timeout=5)
+
+    assert status == "ok"
+    assert result[0]["token"] == "cba"
+    assert timings.prefill_tokens == 3
+    assert error[0] == "error"
+    assert engine.loaded == "/models/b.gguf"
+    assert loaded[1] == {"total_bytes": 100}
+    assert too_big[0] == "memory_error" and too_big[1][1:] == ({"total_bytes": 900}, 100)
+
+
+def test_pool_routes_sessions_to_same_worker():
+    workers = [FakeWorker(i) for i in range(4)]
+    pool = WorkerPool(4, "/models/a.gguf", workers=workers)
+
+    first = pool.worker_for("session-1")
+    assert all(pool.worker_for("session-1") is first for _ in range(5))
+    workers[0].in_flight = 2
+    assert pool.worker_for() is not workers[0]
+
+
+def test_pool_broadcasts_model_switch():
+    workers = [FakeWorker(i) for i in range(2)]
+    pool = WorkerPool(2, "/models/a.gguf", workers=workers)
+
+    pool.engine_for("s").load_model("/models/b.gguf")
+
+    assert all(w.calls == [("load_model", ("/models/b.gguf",))] for w in workers)
+    assert pool.engine_for().get_current_model() == "/models/b.gguf"
+
+
+class FlakyWorker(FakeWorker):
+    def __init__(self, index, fails):
+        super().__init__(index)
+        self.fails = fails  # Model paths this worker can't load
+
+    def call(self, method, *args, **kwargs):
+        super().call(method, *args, **kwargs)
+        if method == "load_model" and args[0] in self.fails:
+            raise RuntimeError("ValueError: Failed to load model")
+
+
+def test_pool_rolls_back_a_failed_switch():
+    workers = [FlakyWorker(0, set()), FlakyWorker(1, {"/models/b.gguf"}), FlakyWorker(2, set())]
+    pool = WorkerPool(3, "/models/a.gguf", workers=workers)
+
+    with pytest.raises(RuntimeError, match="Worker 1 failed"):
+        pool.load_model("/models/b.gguf")
+
+    assert [c[1][0] for c in workers[0].calls] == ["/models/b.gguf", "/models/a.gguf"]
+    assert [c[1][0] for c in workers[1].calls] == ["/models/b.gguf", "/models/a.gguf"]
+    assert workers[2].calls == []
+    assert pool.current_model_path == "/models/a.gguf"
+    assert pool.degraded is None
+
+
+def test_switch_that_does_not_fit_answers_507():
+    class FullWorker(FakeWorker):
+        def call(self, method, *args, **kwargs):
+            super().call(method, *args, **kwargs)
+            if method == "load_model" and args[0].endswith("b.gguf"):
+                raise InsufficientMemoryError("Model needs about 900 MB", {"total_bytes": 900}, 100)
+
+    workers = [FullWorker(0), FullWorker(1)]
+    pool = WorkerPool(2, "/models/a.gguf", workers=workers)
+    with patch("app.main.WorkerPool.get", return_value=pool), patch("app.main.os.path.exists", return_value=True):
+        response = client.post("/models/switch", json={"filename": "b.gguf"})
+
+    assert response.status_code == 507
+    assert pool.current_model_path == "/models/a.gguf"
+
+
+def test_pool_is_degraded_when_rollback_fails():
+    workers = [FlakyWorker(0, set()), FlakyWorker(1, {"/models/a.gguf", "/models/b.gguf"})]
+    pool = WorkerPool(2, "/models/a.gguf", workers=workers)
+
+    with pytest.raises(RuntimeError, match="pool degraded"):
+        pool.load_model("/models/b.gguf")
+
+    assert pool.failed_workers == {1}
+    assert "1 of 2 workers" in pool.degraded
+    # Sessions that hashed to the failed worker go to a working one
+    assert all(pool.worker_for(f"session-{i}") is workers[0] for i in range(8))
+    with patch("app.main.WorkerPool.get", return_value=pool):
+        assert client.get("/health").json()["status"] == "degraded"
+
+    workers[1].fails = set()
+    pool.load_model("/models/b.gguf")
+    assert pool.degraded is None
+
+
+def test_models_counts_shared_weights_once():
+    workers = [FakeWorker(i) for i in range(3)]
+    for worker in workers:
+        worker.footprint = {"weights_bytes": 80, "total_bytes": 100}
+    workers[2].footprint = None  # Failed worker
+    pool = WorkerPool(3, "/models/a.gguf", workers=workers)
+
+    with patch("app.main.WorkerPool.get", return_value=pool), \
+            patch("app.main.ModelManager.list_local_models", return_value=[]) as list_local_models:
+        client.get("/models")
+
+    list_local_models.assert_called_once_with(freed_bytes=120)
+
+
+def test_pool_coalesces_identical_calls_across_workers():
+    release = threading.Event()
+
+    class SlowWorker(FakeWorker):
+        def call(self, method, *args, **kwargs):
+            self.calls.append((method, args))
+            release.wait()
+            return [{"token": "x", "prob": 100.0}]
+
+    workers = [SlowWorker(i) for i in range(2)]
+    pool = WorkerPool(2, "/models/a.gguf", workers=workers)
+    results = []
+    threads = [
+        threading.Thread(target=lambda w=w: results.append(
+            WorkerEngine(pool, w).get_top_logprobs([1, 2, 3], 40)
+        ))
+        for w in workers
+    ]
+    for t in threads:
+        t.start()
+    while pool.coalesce_stats()["coalesced"] < 1:
+        time.sleep(0.005)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert sum(len(w.calls) for w in workers) == 1
+    assert results[0] == results[1] and results[0] is not results[1]